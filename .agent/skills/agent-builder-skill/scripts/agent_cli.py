@@ -5,18 +5,41 @@ Agent Framework CLI
 Commands:
   scaffold <name>     - Create a new agent from a template
   compile <dir>       - Compile SYSTEM_PROMPT.md from agent definition
+                        (--profile <traces>: hot-path-first layout from recorded runs;
+                         --flatten: inline sub-agents into one prompt;
+                         --merge-chains: merge linear executor chains)
   validate <dir>      - Validate agent structure and graph integrity
   visualize <dir>     - Show the agent graph summary
   inspect <dir>       - Deep inspect: show full graph + node details
+  stats <dir>         - Aggregate recorded traces: node hotness, edge frequencies, latencies
+  liveness <dir>      - Context keys live across each edge (+ bytes saved on recorded runs)
+  train-router <dir> <node>
+                      - Train a local fast-path classifier for a router node from traces
+  loadtest <dir>      - Offline load test with stub models/tools: throughput, latency, queueing
+  run-batch <dir> <inputs.jsonl>
+                      - Run JSONL input records through the agent, streaming results (resumable)
+  deploy <src> <dest> - Incremental, atomic sync of an agent into a deployed copy
 """
 
 import sys
 import os
+import inspect
 import json
+import time
 import yaml
 from pathlib import Path
-from parser import parse_mermaid, load_agent
-from compiler import compile_and_write
+from parser import parse_mermaid, parse_duration
+from fast_loader import scan_agent_tree, load_agent_fast
+from compiler import compile_and_write, COLD_SESSION_RATE
+from trace_stats import find_trace_files, load_trace_columns, compute_stats, overlay
+from router_classifier import train_router, CLASSIFIER_FILE
+from tool_cache import parse_cache_policy
+from validators import schema_problems, tool_parameters_schema
+from liveness import analyze as analyze_liveness, bytes_saved
+from loop_analysis import analyze_bounds
+from loadtest import run_loadtest
+from batch_run import run_batch, DEFAULT_WORKERS, DEFAULT_HUMAN_REPLY
+from deploy import deploy, print_result
 
 
 def cmd_scaffold(name: str):
@@ -137,8 +160,9 @@ Detailed instructions for this node's behavior.
     print(f"   3. Run: python agent_cli.py compile {name}")
 
 
-def cmd_compile(agent_dir: str):
-    """Compile the system prompt."""
+def cmd_compile(agent_dir: str, profile: str = None, cold: str = None, flatten=None, merge_chains=None,
+                index=None):
+    """Compile the system prompt, optionally laid out from a trace profile."""
     path = Path(agent_dir)
     if not path.exists():
         print(f"❌ Directory '{agent_dir}' not found")
@@ -148,8 +172,18 @@ def cmd_compile(agent_dir: str):
         print(f"❌ No agent-mermaid.md found in '{agent_dir}'")
         return
 
+    stats = None
+    if profile:
+        files = find_trace_files(profile)
+        if not files:
+            print(f"❌ No trace files found under '{profile}'")
+            return
+        stats = compute_stats(load_trace_columns(files))
+
     print(f"🔨 Compiling agent: {agent_dir}")
-    prompt = compile_and_write(agent_dir)
+    cold_threshold = float(cold) if cold is not None else COLD_SESSION_RATE
+    prompt = compile_and_write(agent_dir, stats, cold_threshold, flatten=bool(flatten),
+                               merge=bool(merge_chains), index=bool(index))
     print(f"\n📋 Preview (first 50 lines):")
     print("─" * 60)
     for line in prompt.split("\n")[:50]:
@@ -158,24 +192,28 @@ def cmd_compile(agent_dir: str):
     print("─" * 60)
 
 
+def _bound(value, unit: str = "") -> str:
+    return "unbounded" if value is None else f"{value:g}{unit}"
+
+
 def cmd_validate(agent_dir: str):
     """Validate agent structure."""
-    path = Path(agent_dir)
     errors = []
     warnings = []
 
+    # One directory scan serves every existence check below
+    tree = scan_agent_tree(agent_dir)
+    agent = load_agent_fast(agent_dir, lazy=True, tree=tree)
+
     # Check required files
     required = ["agent-mermaid.md", "agent-config.yaml", "index.md"]
     for f in required:
-        if not (path / f).exists():
+        if not tree.has(f):
             errors.append(f"Missing required file: {f}")
 
     # Parse graph
-    mermaid_file = path / "agent-mermaid.md"
-    if mermaid_file.exists():
-        content = mermaid_file.read_text()
-        graph = parse_mermaid(content)
-
+    graph = agent["graph"]
+    if graph is not None:
         # Check for start node
         if not graph.start_node:
             errors.append("No START node found in graph")
@@ -185,14 +223,11 @@ def cmd_validate(agent_dir: str):
             warnings.append("No terminal nodes found (besides START)")
 
         # Check that nodes have corresponding directories
-        nodes_dir = path / "nodes"
-        for node_id, node in graph.nodes.items():
-            if node.node_type == "terminal":
-                continue
-            node_dir_name = node_id.replace("_", "-")
-            if nodes_dir.exists():
-                possible = [nodes_dir / node_id, nodes_dir / node_dir_name]
-                if not any(p.exists() for p in possible):
+        if "nodes" in tree.root.dirs:
+            for node_id, node in graph.nodes.items():
+                if node.node_type == "terminal":
+                    continue
+                if tree.node_dir(node_id) is None:
                     warnings.append(f"Node '{node_id}' has no directory in nodes/")
 
         # Check for orphan nodes (no edges)
@@ -203,38 +238,55 @@ def cmd_validate(agent_dir: str):
             if nid not in connected:
                 warnings.append(f"Node '{nid}' is disconnected from the graph")
 
-        # Check for cycles (that aren't intentional loops)
-        # Simple: just report loop edges
-        for edge in graph.edges:
-            if edge.max_iterations:
-                pass  # Intentional loop
-            # Check if edge creates a back-edge in topo sort
-            topo = graph.topological_sort()
-            if edge.source in topo and edge.target in topo:
-                if topo.index(edge.source) > topo.index(edge.target):
-                    if not edge.max_iterations and not edge.condition:
-                        warnings.append(
-                            f"Potential infinite loop: {edge.source} → {edge.target} "
-                            f"(no @max_iterations or @cond)"
-                        )
+        # Every cycle must pass through an @max_iterations bound
+        bounds = analyze_bounds(graph, agent["config"], agent["nodes"])
+        for loop in bounds.unbounded:
+            errors.append(
+                f"Unbounded loop through {', '.join(loop.unbounded)} "
+                f"(no @max_iterations on any edge or node of the cycle)"
+            )
 
         print(f"\n📊 Graph Stats:")
         print(f"   Nodes: {len(graph.nodes)}")
         print(f"   Edges: {len(graph.edges)}")
         print(f"   Start: {graph.start_node}")
         print(f"   Terminals: {graph.terminal_nodes}")
+        print(f"   Loops: {len(bounds.loops)} ({len(bounds.unbounded)} unbounded)")
+        latency = _bound(bounds.max_latency, "s")
+        if bounds.latency_capped:
+            latency += " (execution.max_total_time)"
+        print(f"\n⏱️  Worst case per run:")
+        print(f"   Steps: {_bound(bounds.max_steps)}")
+        print(f"   Model calls: {_bound(bounds.max_model_calls)}")
+        print(f"   Latency: {latency}")
+
+    # Check input/output schemas compile and their defaults are valid
+    config = agent["config"] or {}
+    for key in ("input_schema", "output_schema"):
+        if config.get(key):
+            errors.extend(schema_problems(key, config[key]))
 
     # Check node directories
-    nodes_dir = path / "nodes"
-    if nodes_dir.exists():
-        for node_dir in sorted(nodes_dir.iterdir()):
-            if node_dir.is_dir():
-                if not (node_dir / "index.md").exists():
-                    warnings.append(f"Node directory '{node_dir.name}' missing index.md")
-
-                # Check for recursive sub-agents
-                if (node_dir / "agent-mermaid.md").exists():
-                    print(f"   📦 Sub-agent detected: {node_dir.name}")
+    for name in sorted(agent["nodes"]):
+        node_data = agent["nodes"][name]
+        if "instructions" not in node_data:
+            warnings.append(f"Node directory '{name}' missing index.md")
+
+        tools = node_data.get("tools") or []
+        for tool in (tools if isinstance(tools, list) else [tools]):
+            if isinstance(tool, dict) and tool.get("parameters"):
+                errors.extend(schema_problems(
+                    f"{name}/tools.yaml {tool.get('name')}",
+                    tool_parameters_schema(tool)))
+            if isinstance(tool, dict) and tool.get("name"):
+                try:
+                    parse_cache_policy(tool)
+                except ValueError as e:
+                    errors.append(f"{name}/tools.yaml: {e}")
+
+        # Check for recursive sub-agents
+        if "sub_agent" in node_data:
+            print(f"   📦 Sub-agent detected: {name}")
 
     # Report
     print(f"\n{'='*50}")
@@ -313,7 +365,7 @@ def cmd_visualize(agent_dir: str):
 
 def cmd_inspect(agent_dir: str):
     """Deep inspection of the agent."""
-    agent = load_agent(agent_dir)
+    agent = load_agent_fast(agent_dir, lazy=True)
 
     print(f"\n🔍 Agent Inspection: {agent_dir}")
     print(f"{'='*60}")
@@ -348,6 +400,8 @@ def cmd_inspect(agent_dir: str):
                     has.append("guardrails.yaml")
                 if nd.get("references"):
                     has.append(f"{len(nd['references'])} references")
+                if nd.get("classifier"):
+                    has.append("classifier.npz")
                 if nd.get("sub_agent"):
                     has.append("SUB-AGENT")
                 print(f"     files: {', '.join(has)}")
@@ -355,20 +409,343 @@ def cmd_inspect(agent_dir: str):
     print(f"{'='*60}")
 
 
+def cmd_stats(agent_dir: str, traces: str = None, out: str = None):
+    """Aggregate recorded traces and overlay them onto the agent graph."""
+    path = Path(agent_dir)
+    mermaid_file = path / "agent-mermaid.md"
+    if not mermaid_file.exists():
+        print(f"❌ No agent-mermaid.md in '{agent_dir}'")
+        return
+
+    files = find_trace_files(traces or agent_dir)
+    if not files:
+        print(f"❌ No trace files found under '{traces or agent_dir}'")
+        return
+
+    started = time.perf_counter()
+    cols = load_trace_columns(files)
+    loaded = time.perf_counter()
+    stats = compute_stats(cols)
+    report = overlay(stats, parse_mermaid(mermaid_file.read_text()))
+    done = time.perf_counter()
+
+    print(f"\n📈 Trace Stats: {agent_dir}")
+    print(f"{'='*78}")
+    print(f"   Files: {len(files)}   Sessions: {report['sessions']}   Events: {report['events']}")
+    print(f"   Load: {loaded - started:.2f}s   Aggregate: {done - loaded:.2f}s")
+
+    def ms(v):
+        return f"{v:.0f}" if v is not None else "-"
+
+    print(f"\n🔥 Nodes (by visits):")
+    print(f"   {'node':<24}{'visits':>9}{'reach':>8}{'retry':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}")
+    for nid, n in sorted(report["nodes"].items(), key=lambda kv: -kv[1]["visits"]):
+        print(f"   {nid:<24}{n['visits']:>9}{n['session_rate']:>8.0%}{n['retry_rate']:>8.1%}"
+              f"{ms(n['p50_ms']):>9}{ms(n['p95_ms']):>9}{ms(n['p99_ms']):>9}")
+
+    slow = [(nid, n) for nid, n in report["nodes"].items() if n["p95_ms"] is not None]
+    if slow:
+        print(f"\n🐢 Slowest nodes (p95):")
+        for nid, n in sorted(slow, key=lambda kv: -kv[1]["p95_ms"])[:5]:
+            print(f"   {nid}: {ms(n['p95_ms'])} ms")
+
+    print(f"\n🔀 Edges (by traversals):")
+    for e in sorted(report["edges"], key=lambda e: -e["count"]):
+        cond_str = f" [{e['condition']}]" if e["condition"] else ""
+        print(f"   {e['source']} → {e['target']}: {e['count']} ({e['probability']:.1%}){cond_str}")
+
+    if report["loops"]:
+        print(f"\n🔁 Loop iterations (iterations: sessions):")
+        for nid, dist in report["loops"].items():
+            print(f"   {nid}: {', '.join(f'{k}x: {v}' for k, v in sorted(dist.items()))}")
+
+    if report["unexpected_transitions"] or report["unknown_nodes"]:
+        print(f"\n⚠️  Trace/graph mismatches:")
+        for e in report["unexpected_transitions"]:
+            print(f"   • Transition not in graph: {e['source']} → {e['target']} ({e['count']})")
+        for nid in report["unknown_nodes"]:
+            print(f"   • Node not in graph: {nid}")
+
+    if out:
+        Path(out).write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Wrote {out}")
+
+    print(f"{'='*78}")
+    return report
+
+
+def cmd_liveness(agent_dir: str, traces: str = None):
+    """Show the minimal context projection per edge and, with traces, bytes saved."""
+    agent = load_agent_fast(agent_dir, lazy=True)
+    graph = agent["graph"]
+    if not graph:
+        print(f"❌ No agent-mermaid.md in '{agent_dir}'")
+        return
+
+    liveness = analyze_liveness(graph, agent.get("config") or {}, agent["nodes"])
+    total = len(liveness.universe)
+
+    print(f"\n🧬 Context Liveness: {agent_dir}")
+    print(f"{'='*60}")
+    print(f"   Known context keys: {total}")
+    print(f"\n🔗 Live keys per edge:")
+    for (source, target), keys in liveness.edges.items():
+        print(f"   {source} → {target} ({len(keys)}/{total}): {', '.join(sorted(keys)) or '-'}")
+
+    files = find_trace_files(traces or agent_dir) if traces or (Path(agent_dir) / ".agent-sessions").exists() else []
+    if files:
+        report = bytes_saved(liveness, files)
+        full = sum(r["full_bytes"] for r in report.values())
+        saved = sum(r["saved_bytes"] for r in report.values())
+        print(f"\n💾 Bytes saved on {len(files)} recorded runs:")
+        for node_id, r in sorted(report.items(), key=lambda kv: -kv[1]["saved_bytes"]):
+            print(f"   {node_id}: {r['saved_bytes']} bytes ({r['saved_per_visit']}/visit over {r['visits']} visits)")
+        if full:
+            print(f"   Total: {saved} of {full} bytes ({saved / full:.1%})")
+
+    print(f"{'='*60}")
+
+
+def cmd_train_router(agent_dir: str, node_id: str, traces: str = None, epochs: str = "10"):
+    """Train and save a fast-path classifier for a router node."""
+    path = Path(agent_dir)
+    mermaid_file = path / "agent-mermaid.md"
+    if not mermaid_file.exists():
+        print(f"❌ No agent-mermaid.md in '{agent_dir}'")
+        return
+
+    graph = parse_mermaid(mermaid_file.read_text())
+    node = graph.nodes.get(node_id)
+    if not node:
+        print(f"❌ Node '{node_id}' not found in graph")
+        return
+    if node.node_type != "router":
+        print(f"❌ Node '{node_id}' is a {node.node_type}, not a router")
+        return
+
+    node_dir = next((path / "nodes" / n for n in (node_id, node_id.replace("_", "-"))
+                     if (path / "nodes" / n).is_dir()), None)
+    if node_dir is None:
+        print(f"❌ Node '{node_id}' has no directory in nodes/")
+        return
+
+    files = find_trace_files(traces or agent_dir)
+    if not files:
+        print(f"❌ No trace files found under '{traces or agent_dir}'")
+        return
+
+    print(f"🧠 Training fast-path router: {node_id} ({len(files)} trace files)")
+    try:
+        clf, evaluation = train_router(graph, node_id, files, epochs=int(epochs))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+
+    output_path = node_dir / CLASSIFIER_FILE
+    clf.save(str(output_path))
+
+    print(f"✅ Saved classifier → {output_path}")
+    print(f"   Branches: {', '.join(clf.labels)}")
+    print(f"   Training examples: {evaluation['train_examples']}")
+    if "accuracy" in evaluation:
+        print(f"   Holdout accuracy: {evaluation['accuracy']:.1%}")
+        print(f"   Fast-path coverage @ {evaluation['threshold']}: {evaluation['coverage']:.1%}"
+              f" (accuracy {evaluation['fast_path_accuracy']:.1%})")
+    print(f"   Decision latency: {evaluation['decision_us']:.0f} µs (traced inputs)")
+
+
+def cmd_loadtest(agent_dir: str, stubs: str = None, inputs: str = None, traces: str = None,
+                 concurrency: str = None, rate: str = None, requests: str = "200",
+                 duration: str = None, seed: str = "0", time_scale: str = "1", out: str = None,
+                 dispatch=None, batch_window: str = None, max_batch: str = None, hedge=None,
+                 prefetch=None, spans: str = None, sample_rate: str = "1"):
+    """Run sessions through the execution host against stub models and tools."""
+    if not (Path(agent_dir) / "agent-mermaid.md").exists():
+        print(f"❌ No agent-mermaid.md in '{agent_dir}'")
+        return
+
+    rate = float(rate) if rate else None
+    concurrency = int(concurrency) if concurrency else (None if rate else 8)
+    load = f"{rate:g}/s open loop" if rate else f"{concurrency} concurrent sessions"
+    dispatcher = None
+    if dispatch or batch_window or max_batch:
+        dispatcher = {"batch_window": parse_duration(batch_window),
+                      "max_batch": int(max_batch) if max_batch else None}
+        load += ", dispatched"
+    if hedge:
+        load += ", hedged"
+    if prefetch:
+        load += ", prefetching"
+    print(f"\n🏋️  Load test: {agent_dir} ({load}, up to {requests} sessions)")
+    report = run_loadtest(
+        agent_dir, stubs=stubs, inputs=inputs, traces=traces,
+        concurrency=concurrency, rate=rate, requests=int(requests),
+        duration=parse_duration(duration), seed=int(seed), time_scale=float(time_scale),
+        dispatcher=dispatcher, hedge=bool(hedge), prefetch=bool(prefetch),
+        spans=spans, sample_rate=float(sample_rate),
+    )
+
+    lat = report["latency_s"]
+    print(f"{'='*78}")
+    print(f"   Sessions: {report['sessions']}   Statuses: {report['statuses']}   Wall: {report['wall_s']}s")
+    print(f"   Throughput: {report['throughput_per_s']} sessions/s")
+    print(f"   End-to-end latency: p50 {lat['p50']}s   p95 {lat['p95']}s   p99 {lat['p99']}s")
+    if hedge:
+        print(f"   Hedged requests: {report['hedges']} ({report['hedge_wins']} won)")
+    if report["prefetch"]:
+        pf = report["prefetch"]
+        print(f"   Tool prefetches: {pf['started']} started, {pf['used']} used, "
+              f"{pf['discarded']} discarded ({pf['cancelled']} cancelled in flight)")
+    if report["spans"]:
+        sp = report["spans"]
+        print(f"   Spans: {sp['spans']} from {sp['traces']} sampled runs "
+              f"(rate {sp['sample_rate']:g}, {sp['dropped']} dropped) → {spans}")
+
+    print(f"\n⏳ Nodes (by queueing delay):")
+    print(f"   {'node':<24}{'visits':>9}{'queue p50':>11}{'queue p95':>11}{'service p50':>13}{'service p95':>13}")
+    for nid, n in sorted(report["nodes"].items(), key=lambda kv: -kv[1]["queue_ms"]["p95"]):
+        q, s = n["queue_ms"], n["service_ms"]
+        print(f"   {nid:<24}{n['visits']:>9}{q['p50']:>9.0f}ms{q['p95']:>9.0f}ms{s['p50']:>11.0f}ms{s['p95']:>11.0f}ms")
+
+    print(f"\n🤖 Models:")
+    for model, m in report["models"].items():
+        print(f"   {model}: {m['calls']} calls in {m['batches']} batches, {m['slots']} slots "
+              f"(peak {m['peak_in_flight']}), queue p95 {m['queue_ms']['p95']:.0f}ms")
+    for model, d in (report["dispatch"] or {}).items():
+        print(f"   ↳ dispatcher {model}: {d['coalesced']}/{d['requests']} coalesced, "
+              f"mean batch {d['mean_batch']}, peak {d['peak_in_flight']}/{d['max_concurrency']} in flight")
+
+    if out:
+        Path(out).write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Wrote {out}")
+    print(f"{'='*78}")
+    return report
+
+
+def cmd_run_batch(agent_dir: str, inputs: str, out: str = None, handler: str = "stub",
+                  workers: str = None, stubs: str = None, time_scale: str = "1", seed: str = "0",
+                  id_field: str = "id", human: str = None, no_traces=None, report: str = None):
+    """Run every input record through the agent and stream results to a JSONL file."""
+    if not (Path(agent_dir) / "agent-mermaid.md").exists():
+        print(f"❌ No agent-mermaid.md in '{agent_dir}'")
+        return
+    if not Path(inputs).is_file():
+        print(f"❌ Inputs file '{inputs}' not found")
+        return
+
+    out = out or str(Path(inputs).with_suffix("")) + ".results.jsonl"
+    reply = DEFAULT_HUMAN_REPLY if human is None else (None if human == "none" else json.loads(human))
+    workers = int(workers) if workers else DEFAULT_WORKERS
+
+    def progress(done, seconds):
+        print(f"   … {done} records in {seconds:.1f}s ({done / seconds:.1f}/s)")
+
+    print(f"\n📦 Batch run: {agent_dir} ← {inputs} ({workers} workers, {handler} handler)")
+    result = run_batch(agent_dir, inputs, out, handler=handler, workers=workers, stubs=stubs,
+                       time_scale=float(time_scale), seed=int(seed), id_field=id_field, human=reply,
+                       traces=not no_traces, progress=progress)
+
+    lat = result["latency_s"]
+    print(f"{'='*78}")
+    print(f"   Records: {result['records']}   Statuses: {result['statuses']}   Wall: {result['wall_s']}s")
+    if result["resumed"]:
+        print(f"   Resumed: {result['resumed']} records already in {out} were skipped")
+    if result["duplicates"]:
+        print(f"   ⚠️  {result['duplicates']} records repeated an earlier ID and were skipped")
+    if result["output_invalid"]:
+        print(f"   ⚠️  {result['output_invalid']} outputs violate output_schema")
+    print(f"   Throughput: {result['throughput_per_s']} records/s")
+    print(f"   Record latency: p50 {lat['p50']}s   p95 {lat['p95']}s   p99 {lat['p99']}s")
+    print(f"   Results → {out}")
+    if report:
+        Path(report).write_text(json.dumps(result, indent=2))
+        print(f"\n💾 Wrote {report}")
+    print(f"{'='*78}")
+    return result
+
+
+def cmd_deploy(source: str, dest: str, runtime: str = None, force_install=None):
+    """Sync an agent into its deployed copy, copying only changed files."""
+    if not (Path(source) / "agent-mermaid.md").exists():
+        print(f"❌ No agent-mermaid.md in '{source}' — this is the required source of truth.")
+        return
+    if not (Path(source) / "SYSTEM_PROMPT.md").exists():
+        print(f"⚠️  No SYSTEM_PROMPT.md. Compile first: python agent_cli.py compile {source}")
+
+    result = deploy(source, dest, runtime=runtime, force_install=bool(force_install))
+    print_result(result, runtime)
+    return result
+
+
+# Options that take no value; every other option needs one
+BOOLEAN_FLAGS = {
+    "compile": {"flatten", "merge_chains", "index"},
+    "loadtest": {"dispatch", "hedge", "prefetch"},
+    "run-batch": {"no_traces"},
+    "deploy": {"force_install"},
+}
+
+
+def _split_args(args: list, flags=frozenset()) -> tuple:
+    """Split argv into positional arguments and `--name value` options;
+    names in `flags` are booleans and take no value."""
+    positional, options = [], {}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith("--"):
+            key = arg[2:].replace("-", "_")
+            if key in flags:
+                options[key] = True
+                i += 1
+            elif i + 1 < len(args) and not args[i + 1].startswith("--"):
+                options[key] = args[i + 1]
+                i += 2
+            else:
+                raise ValueError(f"{arg} needs a value")
+        else:
+            positional.append(arg)
+            i += 1
+    return positional, options
+
+
+def _check_args(func, n_args: int, args: list, options: dict) -> None:
+    """Reject extra positional arguments and options `func` does not take."""
+    if len(args) > n_args:
+        raise ValueError(f"Unexpected argument: {args[n_args]}")
+    accepted = list(inspect.signature(func).parameters)[n_args:]
+    for key in options:
+        if key not in accepted:
+            raise ValueError(f"Unknown option --{key.replace('_', '-')}")
+
+
 def main():
     if len(sys.argv) < 2:
         print(__doc__)
         return
 
     cmd = sys.argv[1]
-    args = sys.argv[2:]
 
     commands = {
         "scaffold": (cmd_scaffold, 1, "<name>"),
-        "compile": (cmd_compile, 1, "<agent-dir>"),
+        "compile": (cmd_compile, 1, "<agent-dir> [--profile <traces>] [--cold <session-rate>] [--flatten] [--merge-chains] [--index]"),
         "validate": (cmd_validate, 1, "<agent-dir>"),
         "visualize": (cmd_visualize, 1, "<agent-dir>"),
         "inspect": (cmd_inspect, 1, "<agent-dir>"),
+        "stats": (cmd_stats, 1, "<agent-dir> [--traces <path>] [--out <report.json>]"),
+        "liveness": (cmd_liveness, 1, "<agent-dir> [--traces <path>]"),
+        "loadtest": (cmd_loadtest, 1, "<agent-dir> [--concurrency <n> | --rate <per-s>] [--requests <n>] "
+                                      "[--duration <d>] [--stubs <stubs.yaml>] [--inputs <jsonl>] "
+                                      "[--traces <path>] [--time-scale <x>] [--seed <n>] [--out <report.json>] "
+                                      "[--dispatch] [--batch-window <d>] [--max-batch <n>] [--hedge] [--prefetch] "
+                                      "[--spans <otlp.jsonl | collector-url>] [--sample-rate <0-1>]"),
+        "run-batch": (cmd_run_batch, 2, "<agent-dir> <inputs.jsonl> [--out <results.jsonl>] "
+                                        "[--handler stub|echo|<module:function>] [--workers <n>] "
+                                        "[--stubs <stubs.yaml>] [--time-scale <x>] [--seed <n>] "
+                                        "[--id-field <name>] [--human <json> | none] [--no-traces] "
+                                        "[--report <report.json>]"),
+        "deploy": (cmd_deploy, 2, "<source-agent-dir> <dest-dir> [--runtime <package-dir>] [--force-install]"),
+        "train-router": (cmd_train_router, 2, "<agent-dir> <node-id> [--traces <path>] [--epochs <n>]"),
     }
 
     if cmd not in commands:
@@ -377,11 +754,18 @@ def main():
         return
 
     func, n_args, usage = commands[cmd]
+    try:
+        args, options = _split_args(sys.argv[2:], BOOLEAN_FLAGS.get(cmd, ()))
+        _check_args(func, n_args, args, options)
+    except ValueError as e:
+        print(f"❌ {e}")
+        print(f"Usage: python agent_cli.py {cmd} {usage}")
+        return
     if len(args) < n_args:
         print(f"Usage: python agent_cli.py {cmd} {usage}")
         return
 
-    func(*args[:n_args])
+    func(*args, **options)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,283 @@
+"""
+Batch Runs over JSONL Inputs
+
+Pushes a file of input records through an agent on the ExecutionHost, for
+regression and evaluation runs over recorded traffic. Each line of the
+input file is one payload; its `id` field (see `id_field`) names the
+record, else its line number does (as `line:<n>`, so it cannot collide
+with an explicit ID). Records are checked against the
+agent's `input_schema` (defaults applied) before they run, and invalid
+ones are written out with their errors instead of running.
+
+A fixed pool of workers runs the records; the reader feeds them through a
+queue of at most two records per worker, so only the records in flight
+are held, however large the file is. Memory still grows with the number
+of records: the ID of every record already in the output and of every
+record fed is kept, to skip finished records and duplicates. Latencies are
+kept as a reservoir sample of at most LATENCY_SAMPLES, so the reported
+percentiles are exact up to that many records and estimates beyond it (the
+mean is always exact). Each result is appended to
+the output JSONL as soon as its record finishes (completion order), with
+the record's trace events:
+
+    {"id": "c-1042", "line": 17, "status": "done", "elapsed_ms": 812.4,
+     "output": {...}, "trace": [{"action": "enter", ...}, ...]}
+
+Status is done | error | waiting | invalid; `output_errors` lists
+violations of `output_schema`. Re-running with the same output file
+resumes: records whose IDs are already in it are skipped, and a torn last
+line from an interrupted run is cut off first.
+
+Node work goes to a handler like any host: `stub` (the load test's stub
+models and tools, see loadtest.py), `echo`, or `module:function` naming an
+`async def handler(session, node, inputs)`; with a reference index
+(`compile --index`; rebuilt first if the references changed since), each
+step's inputs carry its reference excerpts. Tool calls the
+handler makes with execution_host.dispatch_tool() are checked against the
+tool's parameters before they reach `call_tool` (the stub tools for
+`stub`). Sessions parked at a human_input node are resumed with `human`
+(None leaves them waiting).
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import random
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from execution_host import CompiledAgent, ExecutionHost, echo_handler
+from loadtest import LoadTest, StubConfig, percentile
+from reference_index import ReferenceIndex
+from validators import ValidationError
+
+
+DEFAULT_WORKERS = 8
+DEFAULT_HUMAN_REPLY = {"human_decision": "approve"}
+PROGRESS_EVERY = 500        # records between progress callbacks
+LATENCY_SAMPLES = 10000     # reservoir size for the latency percentiles
+
+
+def completed_ids(path: str) -> set:
+    """IDs already written to a batch output file.
+
+    A last line without its newline was cut short by an interruption; it is
+    truncated so the resumed run appends after the last whole record.
+    """
+    done = set()
+    if not os.path.isfile(path):
+        return done
+    good = 0
+    with open(path, "rb") as fh:
+        for raw in fh:
+            if not raw.endswith(b"\n"):
+                break
+            good += len(raw)
+            try:
+                done.add(str(json.loads(raw)["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    if good < os.path.getsize(path):
+        os.truncate(path, good)
+    return done
+
+
+def load_handler(spec: str) -> Callable:
+    """`echo` or `module:function` (imported from the current path)."""
+    if spec == "echo":
+        return echo_handler
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"Handler '{spec}' is not echo, stub or module:function")
+    return getattr(importlib.import_module(module), name)
+
+
+class BatchRun:
+    """One pass of an agent over a JSONL file of input records."""
+
+    def __init__(self, agent: CompiledAgent, handler=None, workers: int = DEFAULT_WORKERS,
+                 id_field: str = "id", human: Optional[dict] = DEFAULT_HUMAN_REPLY, traces: bool = True,
+                 progress: Callable = None, references: ReferenceIndex = None, call_tool: Callable = None):
+        self.agent = agent
+        self.input_validator = agent.validators.input
+        self.output_validator = agent.validators.output
+        # The ID field is record metadata unless the schema declares it
+        self.strip_id = id_field not in ((agent.config.get("input_schema") or {}).get("properties") or {})
+        self.workers = max(1, workers)
+        self.id_field = id_field
+        self.human = human
+        self.traces = traces
+        self.progress = progress
+        self.host = ExecutionHost(agent, handler, tracer=self._trace if traces else None, references=references,
+                                  call_tool=call_tool)
+        self._events = {}             # session id -> trace events of a record in flight
+        self.statuses = {}
+        self.latencies = []           # reservoir sample of record latencies (s)
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._rng = random.Random(0)
+        self.output_invalid = 0
+        self.resumed = 0
+        self.duplicates = 0
+
+    def _trace(self, session_id: str, event: dict) -> None:
+        events = self._events.get(session_id)
+        if events is not None:
+            events.append(event)
+
+    def records(self, path: str) -> Iterator[tuple]:
+        """(line number, ID, payload or None, parse error) per non-blank line."""
+        with open(path, encoding="utf-8") as fh:
+            for line_no, line in enumerate(fh, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, f"line:{line_no}", None, f"invalid JSON: {e.msg}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, f"line:{line_no}", None, "record is not an object"
+                    continue
+                key = record.get(self.id_field)
+                if key is None:
+                    yield line_no, f"line:{line_no}", record, None
+                    continue
+                if self.strip_id:
+                    record = {k: v for k, v in record.items() if k != self.id_field}
+                yield line_no, str(key), record, None
+
+    async def _one(self, line_no: int, key: str, payload: Optional[dict], problem: Optional[str]) -> dict:
+        result = {"id": key, "line": line_no}
+        if problem is not None:
+            return {**result, "status": "invalid", "errors": [problem]}
+        if self.input_validator is not None:
+            try:
+                payload = self.input_validator.check(payload)
+            except ValidationError as e:
+                return {**result, "status": "invalid", "errors": e.errors}
+
+        loop = asyncio.get_running_loop()
+        session_id = f"batch-{key}"
+        self._events[session_id] = events = []
+        started = loop.time()
+        try:
+            session = await self.host.start(payload, session_id=session_id)
+            while session.status == "waiting" and self.human is not None:
+                session = await self.host.resume(session.id, dict(self.human))
+        finally:
+            self._events.pop(session_id, None)
+            self.host.close(session_id)
+
+        result.update(status=session.status, elapsed_ms=round((loop.time() - started) * 1000, 1),
+                      output=session.output)
+        if session.error:
+            result["error"] = session.error
+        if session.status == "waiting":
+            result["node"] = session.node
+        if session.status == "done" and self.output_validator is not None:
+            errors = self.output_validator.errors(session.output or {})
+            if errors:
+                result["output_errors"] = errors
+        if self.traces:
+            result["trace"] = events
+        return result
+
+    def _count(self, result: dict) -> None:
+        status = result["status"]
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if "elapsed_ms" in result:
+            seconds = result["elapsed_ms"] / 1000
+            self._latency_total += seconds
+            self._latency_count += 1
+            if len(self.latencies) < LATENCY_SAMPLES:
+                self.latencies.append(seconds)
+            else:
+                slot = self._rng.randrange(self._latency_count)
+                if slot < LATENCY_SAMPLES:
+                    self.latencies[slot] = seconds
+        self.output_invalid += "output_errors" in result
+
+    async def run(self, inputs: str, output: str) -> dict:
+        """Run every record of `inputs` not already in `output`; returns the report."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        done, fed = completed_ids(output), set()
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        processed = 0
+
+        async def feed():
+            for item in self.records(inputs):
+                key = item[1]
+                if key in done:
+                    self.resumed += 1
+                elif key in fed:
+                    self.duplicates += 1
+                else:
+                    fed.add(key)
+                    await queue.put(item)
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def worker():
+            nonlocal processed
+            while (item := await queue.get()) is not None:
+                result = await self._one(*item)
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+                self._count(result)
+                processed += 1
+                if self.progress is not None and processed % PROGRESS_EVERY == 0:
+                    self.progress(processed, loop.time() - started)
+
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "a", encoding="utf-8") as out:
+            await asyncio.gather(feed(), *(worker() for _ in range(self.workers)))
+        return self.report(inputs, output, processed, loop.time() - started)
+
+    def report(self, inputs: str, output: str, processed: int, wall: float) -> dict:
+        return {
+            "agent": self.agent.name,
+            "inputs": inputs,
+            "output": output,
+            "workers": self.workers,
+            "records": processed,
+            "resumed": self.resumed,
+            "duplicates": self.duplicates,
+            "statuses": self.statuses,
+            "output_invalid": self.output_invalid,
+            "wall_s": round(wall, 3),
+            "throughput_per_s": round(processed / wall, 3) if wall else 0.0,
+            "latency_s": self.latency_summary(),
+        }
+
+    def latency_summary(self) -> dict:
+        values = sorted(self.latencies)
+        count = self._latency_count
+        summary = {"mean": round(self._latency_total / count, 3) if count else 0.0}
+        summary.update({f"p{q}": round(percentile(values, q), 3) for q in (50, 95, 99)})
+        return summary
+
+
+def run_batch(agent_dir: str, inputs: str, output: str, handler: str = "stub", workers: int = DEFAULT_WORKERS,
+              stubs: str = None, time_scale: float = 1.0, seed: int = 0, id_field: str = "id",
+              human: Optional[dict] = DEFAULT_HUMAN_REPLY, traces: bool = True, progress: Callable = None) -> dict:
+    """Load an agent and run one batch; see BatchRun. `handler` is `stub`
+    (stub backends from `stubs`, latencies scaled by `time_scale`), `echo`
+    or `module:function`."""
+    agent = CompiledAgent.from_dir(agent_dir)
+    call_tool = None
+    if handler == "stub":
+        stub = LoadTest(agent, StubConfig.load(stubs), seed=seed, time_scale=time_scale, record_samples=False)
+        agent, handle, call_tool = stub.host.agent, stub.handle, stub.backend.call_tool
+    else:
+        handle = load_handler(handler)
+    references = ReferenceIndex.load(agent_dir, rebuild=True)
+    batch = BatchRun(agent, handle, workers=workers, id_field=id_field, human=human, traces=traces,
+                     progress=progress, references=references, call_tool=call_tool)
+    try:
+        return asyncio.run(batch.run(inputs, output))
+    finally:
+        if references is not None:
+            references.close()
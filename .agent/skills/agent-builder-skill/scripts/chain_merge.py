@@ -0,0 +1,297 @@
+"""
+Linear Chain Merging
+
+A straight run of executors — each step's only way out is one plain edge
+into a step that nothing else enters — still costs one turn per node.
+merge_chains() collapses every such run into a single composite step that
+performs the members' instructions in order:
+
+- members are executors, plus transformers that only reshape data (no
+  tools, no @model of their own), which ride along with any model
+- all executors in a chain share the same @model (unset means the
+  agent's default), so the composite runs on one model
+- links carry no @cond, @transform, fallback or @max_iterations; members
+  have no @retry or @timeout (those bound one step) and identical @on_error
+  routes, which the composite keeps
+- the composite's ID joins the member IDs with CHAIN_SEPARATOR
+  (`analyze+synthesize`) and its node data lists them under "steps"
+
+The runtime only sees composites, so expand_events() maps a composite's
+trace events back onto the original node IDs: enter/complete pairs and the
+route between each pair of steps. The composite's duration lands on its
+first step. The compiler writes the mapping to CHAIN_MAP_FILE next to
+SYSTEM_PROMPT.md, and `python chain_merge.py <agent-dir> <trace.jsonl>`
+rewrites a recorded trace with it.
+
+    merged = merge_chains(agent, report := MergeReport())
+"""
+
+import json
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from parser import AgentGraph, NodeMeta
+from flatten import node_data_for
+from guardrails import load_rules
+
+
+CHAIN_SEPARATOR = "+"
+CHAIN_MAP_FILE = "chain-map.json"
+
+MERGEABLE_TYPES = ("executor", "transformer")
+
+
+@dataclass
+class MergeReport:
+    chains: dict = field(default_factory=dict)    # composite ID -> member IDs in order
+    nodes_before: int = 0
+    nodes_after: int = 0
+    edges_before: int = 0
+    edges_after: int = 0
+
+    def to_dict(self):
+        return {
+            "chains": self.chains,
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "edges_before": self.edges_before,
+            "edges_after": self.edges_after,
+        }
+
+
+def _noop_transformer(meta: NodeMeta, data: dict) -> bool:
+    return meta.node_type == "transformer" and not meta.tools and not meta.model \
+        and not data.get("tools")
+
+
+def _mergeable(meta: NodeMeta) -> bool:
+    return (meta.node_type in MERGEABLE_TYPES and meta.retry <= 1
+            and not meta.timeout and not meta.max_iterations)
+
+
+def _plain(edge) -> bool:
+    return not (edge.condition or edge.transform or edge.fallback or edge.on_error
+                or edge.max_iterations)
+
+
+def find_chains(graph: AgentGraph, nodes_data: dict = None) -> list:
+    """Member IDs of every mergeable chain (two or more nodes), in graph order."""
+    nodes_data = nodes_data or {}
+    outgoing, incoming, errors = {}, {}, {}
+    for edge in graph.edges:
+        if edge.on_error:
+            errors.setdefault(edge.source, set()).add(edge.target)
+            continue
+        outgoing.setdefault(edge.source, []).append(edge)
+        incoming.setdefault(edge.target, []).append(edge)
+
+    def model(node_id):
+        meta = graph.nodes[node_id]
+        return None if _noop_transformer(meta, node_data_for(nodes_data, node_id)) else (meta.model or "")
+
+    def link(node_id):
+        """The next member after node_id, if the chain may continue."""
+        out = outgoing.get(node_id, [])
+        if len(out) != 1 or not _plain(out[0]):
+            return None
+        nxt = out[0].target
+        meta = graph.nodes.get(nxt)
+        if meta is None or not _mergeable(meta) or len(incoming.get(nxt, [])) != 1:
+            return None
+        if errors.get(nxt, set()) != errors.get(node_id, set()):
+            return None
+        return nxt
+
+    links = {n: link(n) for n, meta in graph.nodes.items() if _mergeable(meta)}
+    led = {nxt for nxt in links.values() if nxt}
+
+    chains = []
+
+    def close(segment):
+        if len(segment) > 1 and any(graph.nodes[n].node_type == "executor" for n in segment):
+            chains.append(segment)
+
+    for head in links:
+        if head in led:
+            continue
+        segment, models, current = [head], {model(head)} - {None}, head
+        while (nxt := links.get(current)) is not None:
+            step = model(nxt)
+            if step is not None and models and step not in models:
+                close(segment)
+                segment, models = [], set()
+            segment.append(nxt)
+            models |= {step} - {None}
+            current = nxt
+        close(segment)
+    return chains
+
+
+def _rules(spec, stage: str) -> list:
+    return [{"name": r.name, "check": r.check, "action": r.action}
+            for r in load_rules(spec or {}) if r.stage == stage]
+
+
+def composite_data(members: list, graph: AgentGraph, nodes_data: dict) -> dict:
+    """Node data of the composite step standing for `members`."""
+    handoffs = {e.source: e.pass_fields for e in graph.edges if e.source in members and not e.on_error}
+    parts, tools, references = [], [], []
+    for i, node_id in enumerate(members, 1):
+        meta, data = graph.nodes[node_id], node_data_for(nodes_data, node_id)
+        parts.append(f"#### Step {i}: {meta.display_name} (`{node_id}`)\n")
+        parts.append(data.get("instructions") or f"*No specific instructions for `{node_id}`.*")
+        if i < len(members):
+            checks = _rules(data.get("guardrails"), "output")
+            if checks:
+                parts.append("\nBefore continuing, check: " + "; ".join(f"`{c['check']}`" for c in checks))
+            if handoffs.get(node_id):
+                parts.append(f"\nCarry `{handoffs[node_id]}` into step {i + 1}.")
+        parts.append("")
+        if isinstance(data.get("tools"), list):
+            tools.extend(t for t in data["tools"] if t not in tools)
+        references.extend(data.get("references") or [])
+
+    first, last = node_data_for(nodes_data, members[0]), node_data_for(nodes_data, members[-1])
+    data = {
+        "instructions": "Perform these steps in order within this one turn; each step's "
+                        "output is the next step's input.\n\n" + "\n".join(parts).rstrip(),
+        "steps": list(members),
+    }
+    if "path" in first:
+        data["path"] = first["path"]
+    if tools:
+        data["tools"] = tools
+    if references:
+        data["references"] = references
+    guardrails = {"input": _rules(first.get("guardrails"), "input"),
+                  "output": _rules(last.get("guardrails"), "output")}
+    if guardrails["input"] or guardrails["output"]:
+        data["guardrails"] = guardrails
+    return data
+
+
+def merge_chains(agent: dict, report: MergeReport = None) -> dict:
+    """A copy of `agent` (see parser.load_agent) with linear chains merged."""
+    graph = agent.get("graph")
+    if graph is None:
+        return agent
+    report = report if report is not None else MergeReport()
+    report.nodes_before, report.edges_before = len(graph.nodes), len(graph.edges)
+    nodes_data = dict(agent.get("nodes") or {})
+    chains = find_chains(graph, nodes_data)
+
+    owner = {}
+    new_nodes = {}
+    for node_id, meta in graph.nodes.items():
+        chain = next((c for c in chains if node_id in c), None)
+        if chain is None:
+            new_nodes[node_id] = meta
+            continue
+        composite = CHAIN_SEPARATOR.join(chain)
+        owner[node_id] = composite
+        if node_id != chain[0]:
+            continue
+        if composite in graph.nodes:
+            raise ValueError(f"Merging chain: node ID '{composite}' already exists")
+        models = [graph.nodes[n].model for n in chain if graph.nodes[n].model]
+        servers = [graph.nodes[n].tools for n in chain if graph.nodes[n].tools]
+        new_nodes[composite] = replace(
+            meta, id=composite, node_type="executor", model=models[0] if models else None,
+            tools=", ".join(servers) if servers else None,
+            display_name=" → ".join(graph.nodes[n].display_name for n in chain))
+        nodes_data[composite] = composite_data(chain, graph, nodes_data)
+        report.chains[composite] = list(chain)
+
+    for chain in chains:
+        for node_id in chain:
+            nodes_data.pop(node_id, None)
+            nodes_data.pop(node_id.replace("_", "-"), None)
+
+    edges, kept_errors = [], set()
+    for edge in graph.edges:
+        source, target = owner.get(edge.source, edge.source), owner.get(edge.target, edge.target)
+        if source == target and source in report.chains and not edge.on_error:
+            continue                                  # a link inside the chain
+        if edge.on_error and source in report.chains:
+            if (source, target) in kept_errors:
+                continue
+            kept_errors.add((source, target))
+        edges.append(replace(edge, source=source, target=target))
+
+    start = owner.get(graph.start_node, graph.start_node)
+    merged = AgentGraph(nodes=new_nodes, edges=edges, start_node=start,
+                        terminal_nodes=[owner.get(n, n) for n in graph.terminal_nodes])
+    report.nodes_after, report.edges_after = len(merged.nodes), len(merged.edges)
+    return {**agent, "graph": merged, "nodes": nodes_data}
+
+
+def expand_events(events: Iterable[dict], chains: dict) -> Iterator[dict]:
+    """Trace events of a merged agent, rewritten onto the original node IDs.
+
+    `chains` maps composite IDs to member IDs (MergeReport.chains, or the
+    "chains" of CHAIN_MAP_FILE).
+    """
+    for event in events:
+        action = event.get("action")
+        if action == "route":
+            source, target = event.get("from"), event.get("to")
+            if source in chains or target in chains:
+                event = {**event, "from": chains[source][-1] if source in chains else source,
+                         "to": chains[target][0] if target in chains else target}
+            yield event
+            continue
+        members = chains.get(event.get("node"))
+        if members is None:
+            yield event
+        elif action == "complete":
+            ts = {"ts": event["ts"]} if "ts" in event else {}
+            for i, node_id in enumerate(members):
+                if i:
+                    yield {"action": "route", "from": members[i - 1], "to": node_id, **ts}
+                    yield {"action": "enter", "node": node_id,
+                           "iteration": event.get("iteration", 1), "chain": event["node"], **ts}
+                if i < len(members) - 1:
+                    yield {"action": "complete", "node": node_id, "chain": event["node"], **ts}
+            yield {**event, "node": members[-1], "chain": event["node"]}
+        else:
+            yield {**event, "node": members[0], "chain": event["node"]}
+
+
+def turns_saved(chains: dict, profile=None) -> float:
+    """Turns per run the merged chains save.
+
+    Each visit of a non-head member is a turn the composite absorbs. Visits
+    per run come from `profile` (a TraceStats recorded on the unmerged
+    agent); without one each chain runs once per run.
+    """
+    saved = 0.0
+    for members in chains.values():
+        if profile is None:
+            saved += len(members) - 1
+            continue
+        runs = max(profile.sessions, 1)
+        saved += sum(profile.nodes.get(n, {}).get("visits", 0) for n in members[1:]) / runs
+    return round(saved, 2)
+
+
+def read_chain_map(agent_dir: str) -> dict:
+    """Composite ID -> member IDs from the agent's CHAIN_MAP_FILE, if compiled with chains."""
+    path = Path(agent_dir) / CHAIN_MAP_FILE
+    return json.loads(path.read_text()).get("chains", {}) if path.is_file() else {}
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    ap = argparse.ArgumentParser(description="Rewrite traces of a chain-merged agent onto original node IDs")
+    ap.add_argument("agent_dir", help="Agent compiled with --merge-chains (holds chain-map.json)")
+    ap.add_argument("trace", help="Trace JSONL written by the merged agent")
+    args = ap.parse_args()
+
+    chains = read_chain_map(args.agent_dir)
+    with open(args.trace) as fh:
+        events = (json.loads(line) for line in fh if line.strip())
+        for event in expand_events(events, chains):
+            sys.stdout.write(json.dumps(event) + "\n")
@@ -0,0 +1,422 @@
+"""
+Session Checkpoint Store
+
+Persists in-flight execution state — current node, status, context,
+per-node iteration counters and the trace cursor — so a session parked at a
+human_input node (or any other) survives process restarts and resumes with a
+single indexed lookup.
+
+State lives in SQLite in WAL mode, one row per session plus one row per
+context key and per iteration counter, so each transition writes only what
+changed. Transitions are buffered in memory and coalesced per session; a
+background writer flushes them in one transaction every `flush_interval`
+seconds or once `batch_size` sessions are dirty. Reads merge the buffered
+deltas, so load() always sees the latest transition. Call flush() before
+anything that must be durable immediately (e.g. handing off to a human).
+If a background flush fails, its batch stays buffered and is retried, and
+the error is raised by the next transition() or flush().
+
+    store = CheckpointStore.for_agent("agents/travel-support")
+    store.transition("s-42", node="escalate", status="waiting",
+                     context={"reason": "refund > 500"}, iterations={"escalate": 1},
+                     trace_cursor=17)
+    state = store.load("s-42")
+
+Benchmark:
+
+    python checkpoint_store.py --sessions 5000 --transitions 10
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+CHECKPOINT_DB = "checkpoints.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id   TEXT PRIMARY KEY,
+    agent        TEXT,
+    status       TEXT NOT NULL DEFAULT 'initialized',
+    current_node TEXT,
+    trace_cursor INTEGER NOT NULL DEFAULT 0,
+    created_at   REAL,
+    updated_at   REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions(status);
+CREATE TABLE IF NOT EXISTS context (
+    session_id TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    PRIMARY KEY (session_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS iterations (
+    session_id TEXT NOT NULL,
+    node       TEXT NOT NULL,
+    count      INTEGER NOT NULL,
+    PRIMARY KEY (session_id, node)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_SESSION = """
+INSERT INTO sessions (session_id, agent, status, current_node, trace_cursor, created_at, updated_at)
+VALUES (?, ?, COALESCE(?, 'initialized'), ?, COALESCE(?, 0), ?, ?)
+ON CONFLICT(session_id) DO UPDATE SET
+    agent = COALESCE(excluded.agent, agent),
+    status = COALESCE(?, status),
+    current_node = COALESCE(excluded.current_node, current_node),
+    trace_cursor = COALESCE(?, trace_cursor),
+    updated_at = excluded.updated_at
+"""
+
+_DELETED = object()
+
+
+@dataclass
+class SessionState:
+    session_id: str
+    agent: Optional[str] = None
+    status: str = "initialized"
+    current_node: Optional[str] = None
+    context: dict = field(default_factory=dict)
+    iterations: dict = field(default_factory=dict)    # node -> count
+    trace_cursor: int = 0                             # trace events already written
+    created_at: Optional[float] = None
+    updated_at: Optional[float] = None
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "agent": self.agent,
+            "status": self.status,
+            "current_node": self.current_node,
+            "context": self.context,
+            "iterations": self.iterations,
+            "trace_cursor": self.trace_cursor,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class _Delta:
+    """Changes to one session since the last flush. Values are absolute,
+    so applying a delta twice is harmless."""
+    __slots__ = ("deleted", "agent", "status", "current_node", "trace_cursor",
+                 "context", "iterations", "updated_at")
+
+    def __init__(self):
+        self.deleted = False
+        self.agent = self.status = self.current_node = self.trace_cursor = None
+        self.context = {}
+        self.iterations = {}
+        self.updated_at = None
+
+    def empty(self) -> bool:
+        return (self.agent is None and self.status is None and self.current_node is None
+                and self.trace_cursor is None and not self.context and not self.iterations)
+
+    def apply(self, session_id: str, state: Optional[SessionState]) -> Optional[SessionState]:
+        if self.deleted:
+            if self.empty():
+                return None
+            state = None
+        state = state or SessionState(session_id)
+        for name in ("agent", "status", "current_node", "trace_cursor"):
+            value = getattr(self, name)
+            if value is not None:
+                setattr(state, name, value)
+        for key, value in self.context.items():
+            if value is _DELETED:
+                state.context.pop(key, None)
+            else:
+                state.context[key] = value
+        state.iterations.update(self.iterations)
+        if state.created_at is None:
+            state.created_at = self.updated_at
+        state.updated_at = self.updated_at or state.updated_at
+        return state
+
+    def merged(self, newer: "_Delta") -> "_Delta":
+        """This delta followed by `newer`, as one delta."""
+        if newer.deleted:
+            return newer
+        delta = _Delta()
+        delta.deleted = self.deleted
+        for name in ("agent", "status", "current_node", "trace_cursor", "updated_at"):
+            value = getattr(newer, name)
+            setattr(delta, name, value if value is not None else getattr(self, name))
+        delta.context = {**self.context, **newer.context}
+        delta.iterations = {**self.iterations, **newer.iterations}
+        return delta
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class CheckpointStore:
+    """Batched, incremental session checkpoints in a WAL-mode SQLite file."""
+
+    def __init__(self, path: str, flush_interval: float = 0.05, batch_size: int = 512):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._writer = _connect(path)
+        self._writer.executescript(_SCHEMA)
+        self._reader = _connect(path)
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()      # one flush at a time
+        self._cond = threading.Condition()
+        self._pending = {}                       # session_id -> _Delta
+        self._inflight = {}                      # deltas being written
+        self._closed = False
+        self._error = None                       # failure of a background flush, not yet raised
+        self.flushes = 0
+        self.rows_written = 0
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_agent(cls, agent_dir: str, **kwargs) -> "CheckpointStore":
+        """Open the store in the agent's .agent-sessions directory."""
+        sessions_dir = os.path.join(agent_dir, ".agent-sessions")
+        os.makedirs(sessions_dir, exist_ok=True)
+        return cls(os.path.join(sessions_dir, CHECKPOINT_DB), **kwargs)
+
+    # -- writes ------------------------------------------------------------
+
+    def transition(self, session_id: str, node: str = None, status: str = None,
+                   context: dict = None, removed: tuple = (), iterations: dict = None,
+                   trace_cursor: int = None, agent: str = None) -> None:
+        """Record one transition. Only the given fields change: `context`
+        keys are upserted, `removed` keys dropped, `iterations` are absolute
+        counts per node."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("CheckpointStore is closed")
+            self._raise_error()
+            delta = self._pending.get(session_id)
+            if delta is None:
+                delta = self._pending[session_id] = _Delta()
+            if agent is not None:
+                delta.agent = agent
+            if status is not None:
+                delta.status = status
+            if node is not None:
+                delta.current_node = node
+            if trace_cursor is not None:
+                delta.trace_cursor = trace_cursor
+            if context:
+                delta.context.update(context)
+            for key in removed:
+                delta.context[key] = _DELETED
+            if iterations:
+                delta.iterations.update(iterations)
+            delta.updated_at = time.time()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def save(self, state: SessionState) -> None:
+        """Checkpoint a whole SessionState (replacing any stored context)."""
+        self.delete(state.session_id)
+        self.transition(state.session_id, node=state.current_node, status=state.status,
+                        context=state.context, iterations=state.iterations,
+                        trace_cursor=state.trace_cursor, agent=state.agent)
+
+    def delete(self, session_id: str) -> None:
+        with self._cond:
+            delta = self._pending[session_id] = _Delta()
+            delta.deleted = True
+            delta.updated_at = time.time()
+
+    def flush(self) -> int:
+        """Write all buffered transitions now; returns the sessions written."""
+        with self._cond:
+            self._raise_error()
+        return self._flush()
+
+    def _flush(self) -> int:
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            try:
+                if batch:
+                    self._write(batch)
+            except BaseException:
+                with self._cond:
+                    # Keep the batch for the next attempt, under anything newer
+                    for session_id, delta in batch.items():
+                        newer = self._pending.get(session_id)
+                        self._pending[session_id] = delta if newer is None else delta.merged(newer)
+                raise
+            finally:
+                with self._cond:
+                    self._inflight = {}
+        return len(batch)
+
+    def _raise_error(self) -> None:
+        """Raise the last background flush failure once (caller holds _cond)."""
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _write(self, batch: dict) -> None:
+        sessions, upserts, deletes, counters, dropped = [], [], [], [], []
+        for session_id, delta in batch.items():
+            if delta.deleted:
+                dropped.append((session_id,))
+                if delta.empty():
+                    continue
+            ts = delta.updated_at
+            sessions.append((session_id, delta.agent, delta.status, delta.current_node,
+                             delta.trace_cursor, ts, ts, delta.status, delta.trace_cursor))
+            for key, value in delta.context.items():
+                if value is _DELETED:
+                    deletes.append((session_id, key))
+                else:
+                    upserts.append((session_id, key, json.dumps(value, default=str)))
+            counters.extend((session_id, node, count) for node, count in delta.iterations.items())
+
+        conn = self._writer
+        conn.execute("BEGIN")
+        try:
+            if dropped:
+                for table in ("sessions", "context", "iterations"):
+                    conn.executemany(f"DELETE FROM {table} WHERE session_id = ?", dropped)
+            conn.executemany(_UPSERT_SESSION, sessions)
+            conn.executemany(
+                "INSERT INTO context (session_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id, key) DO UPDATE SET value = excluded.value", upserts)
+            conn.executemany("DELETE FROM context WHERE session_id = ? AND key = ?", deletes)
+            conn.executemany(
+                "INSERT INTO iterations (session_id, node, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id, node) DO UPDATE SET count = excluded.count", counters)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.flushes += 1
+        self.rows_written += len(sessions) + len(upserts) + len(deletes) + len(counters) + len(dropped)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # After a failure, wait out the interval before retrying even when the batch is full
+                if not self._closed and (len(self._pending) < self.batch_size or self._error is not None):
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self._flush()
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+            if closed:
+                return
+
+    # -- reads -------------------------------------------------------------
+
+    def load(self, session_id: str) -> Optional[SessionState]:
+        """Return the latest state of a session, or None if unknown."""
+        with self._cond:
+            deltas = [d for d in (self._inflight.get(session_id), self._pending.get(session_id)) if d]
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT agent, status, current_node, trace_cursor, created_at, updated_at "
+                "FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            state = None
+            if row is not None:
+                state = SessionState(session_id, row[0], row[1], row[2], trace_cursor=row[3],
+                                     created_at=row[4], updated_at=row[5])
+                state.context = {k: json.loads(v) for k, v in self._reader.execute(
+                    "SELECT key, value FROM context WHERE session_id = ?", (session_id,))}
+                state.iterations = dict(self._reader.execute(
+                    "SELECT node, count FROM iterations WHERE session_id = ?", (session_id,)))
+        for delta in deltas:
+            state = delta.apply(session_id, state)
+        return state
+
+    def sessions(self, status: str = None) -> list:
+        """Session IDs, optionally only those with a given status."""
+        self.flush()
+        with self._read_lock:
+            if status is None:
+                rows = self._reader.execute("SELECT session_id FROM sessions")
+            else:
+                rows = self._reader.execute("SELECT session_id FROM sessions WHERE status = ?", (status,))
+            return [r[0] for r in rows]
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._writer.close()
+        self._reader.close()
+        with self._cond:
+            self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import statistics
+    import tempfile
+
+    ap = argparse.ArgumentParser(description="Benchmark checkpoint writes and resume latency")
+    ap.add_argument("--sessions", type=int, default=5000)
+    ap.add_argument("--transitions", type=int, default=10)
+    ap.add_argument("--db", help="database path (default: a temporary file)")
+    args = ap.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="checkpoints-"), CHECKPOINT_DB)
+    nodes = ["intake", "classify", "booking_lookup", "assess_action", "escalate", "draft_response", "review"]
+    rng = random.Random(0)
+    ids = [f"session-{i:06d}" for i in range(args.sessions)]
+
+    with CheckpointStore(path) as store:
+        start = time.perf_counter()
+        for step in range(args.transitions):
+            node = nodes[step % len(nodes)]
+            for sid in ids:
+                store.transition(sid, node=node, status="running", agent="bench",
+                                 context={f"{node}_output": {"text": "x" * rng.randint(50, 500), "step": step}},
+                                 iterations={node: step // len(nodes) + 1}, trace_cursor=3 * step)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        total = args.sessions * args.transitions
+        flushes, rows = store.flushes, store.rows_written
+
+    with CheckpointStore(path) as store:
+        samples = []
+        for sid in rng.sample(ids, min(1000, len(ids))):
+            t = time.perf_counter()
+            state = store.load(sid)
+            samples.append((time.perf_counter() - t) * 1000)
+            assert state is not None and state.trace_cursor == 3 * (args.transitions - 1)
+        samples.sort()
+        print(json.dumps({
+            "sessions": args.sessions,
+            "transitions": total,
+            "transitions_per_s": round(total / elapsed),
+            "flushes": flushes,
+            "rows_written": rows,
+            "resume_p50_ms": round(statistics.median(samples), 3),
+            "resume_p99_ms": round(samples[int(len(samples) * 0.99) - 1], 3),
+            "db_bytes": os.path.getsize(path),
+        }, indent=2))
@@ -12,22 +12,68 @@ The generated prompt follows a specific structure:
 5. Data Contracts
 6. Guardrails & Constraints
 7. Error Handling
+
+With a trace profile (see trace_stats.py) the compiler switches to a
+profile-guided layout: hot-path nodes come first and rarely-visited nodes
+are collapsed to a one-line summary whose full instructions are loaded on
+demand when the agent actually routes there.
+
+With `index=True`, compile_and_write() also builds a BM25 index over the
+references (reference_index.py) in the agent's `.reference-index/`. Node reference files below LARGE_REFERENCE_BYTES are
+pasted in full as before; larger ones carry the chunks most relevant to the
+node's instructions, and the ExecutionHost (given the index as
+`references`) injects the top-k chunks for each input.
+
+With `flatten=True` sub-agents are inlined into the parent graph
+(flatten.py) and compiled into the one prompt instead of being referenced
+as separate SYSTEM_PROMPT.md files; flatten_savings() reports the size
+and round-trip trade-off. With `merge=True` straight executor chains are
+compiled as composite steps (chain_merge.py) and chain_savings() reports
+the turns saved per run.
 """
 
 import json
 import yaml
 from pathlib import Path
 from datetime import datetime
-from parser import parse_mermaid, load_agent, AgentGraph, NodeMeta, EdgeMeta
-
-
-def compile_system_prompt(agent_dir: str) -> str:
-    """Compile a full system prompt from an agent directory."""
-    agent = load_agent(agent_dir)
+from parser import parse_mermaid, AgentGraph, NodeMeta, EdgeMeta
+from fast_loader import load_agent_fast
+from guardrails import load_rules
+from flatten import FlattenReport, flatten_agent, SEPARATOR
+from chain_merge import MergeReport, merge_chains, turns_saved, CHAIN_MAP_FILE, CHAIN_SEPARATOR
+import reference_index
+from reference_index import ReferenceIndex, AGENT_SCOPE, DEFAULT_TOP_K, is_inlined
+
+
+# Nodes reached by fewer than this fraction of recorded sessions are collapsed
+# in profile-guided layouts.
+COLD_SESSION_RATE = 0.05
+
+
+def compile_system_prompt(agent_dir: str, profile=None, cold_threshold: float = COLD_SESSION_RATE,
+                          flatten: bool = False, merge: bool = False) -> str:
+    """Compile a full system prompt from an agent directory.
+
+    If `profile` (a TraceStats) is given, nodes are laid out hot-path first and
+    nodes reached by fewer than `cold_threshold` of sessions are collapsed.
+    With `flatten`, sub-agents are inlined rather than referenced; with
+    `merge`, linear executor chains become composite steps.
+    """
+    # Sub-agents are only summarized here, so their own nested agents never load
+    agent = load_agent_fast(agent_dir, lazy=True)
+    if flatten:
+        agent = flatten_agent(agent)
+    if merge:
+        agent = merge_chains(agent)
     graph = agent["graph"]
     config = agent.get("config", {}) or {}
     index_content = agent.get("index", "")
 
+    order, collapsed = None, set()
+    if graph and profile is not None:
+        order, collapsed = profile_layout(graph, profile, cold_threshold)
+    index = ReferenceIndex.load(agent_dir)
+
     sections = []
 
     # ── Section 1: Identity & Purpose ──
@@ -35,11 +81,16 @@ def compile_system_prompt(agent_dir: str) -> str:
 
     # ── Section 2: Execution Graph Overview ──
     if graph:
-        sections.append(_compile_graph_overview(graph, config))
+        sections.append(_compile_graph_overview(graph, config, order))
 
     # ── Section 3: Node Instructions (topological order) ──
     if graph:
-        sections.append(_compile_node_instructions(graph, agent["nodes"]))
+        sections.append(_compile_node_instructions(graph, agent["nodes"], order, collapsed, index))
+    library = _compile_reference_library(index)
+    if library:
+        sections.append(library)
+    if index is not None:
+        index.close()
 
     # ── Section 4: Tool Definitions ──
     tools_section = _compile_tools(agent["nodes"], config)
@@ -99,7 +150,31 @@ def _compile_identity(config: dict, index_content: str) -> str:
     return "\n".join(lines)
 
 
-def _compile_graph_overview(graph: AgentGraph, config: dict) -> str:
+def profile_layout(graph: AgentGraph, profile, cold_threshold: float = COLD_SESSION_RATE) -> tuple:
+    """Return (node order, collapsed node IDs) for a profile-guided layout.
+
+    Nodes are ordered by the fraction of sessions that reach them, with the
+    topological position as tie-breaker, so the hot path reads in execution
+    order and cold branches sink to the end.
+    """
+    topo_order = graph.topological_sort()
+    position = {nid: i for i, nid in enumerate(topo_order)}
+
+    def reach(nid):
+        # A merged chain is reached as often as its first step
+        stats = profile.nodes.get(nid) or profile.nodes.get(nid.split(CHAIN_SEPARATOR)[0], {})
+        return stats.get("session_rate", 0.0)
+
+    order = sorted(topo_order, key=lambda nid: (-reach(nid), position[nid]))
+    collapsed = {
+        nid for nid in order
+        if graph.nodes.get(nid) and graph.nodes[nid].node_type != "terminal"
+        and reach(nid) < cold_threshold
+    }
+    return order, collapsed
+
+
+def _compile_graph_overview(graph: AgentGraph, config: dict, order: list = None) -> str:
     lines = [
         "## Execution Flow",
         "",
@@ -107,7 +182,7 @@ def _compile_graph_overview(graph: AgentGraph, config: dict) -> str:
         "",
     ]
 
-    topo_order = graph.topological_sort()
+    topo_order = order or graph.topological_sort()
 
     # Generate natural language walkthrough
     lines.append("### Step-by-Step Flow")
@@ -153,7 +228,8 @@ def _compile_graph_overview(graph: AgentGraph, config: dict) -> str:
     return "\n".join(lines)
 
 
-def _compile_node_instructions(graph: AgentGraph, nodes: dict) -> str:
+def _compile_node_instructions(graph: AgentGraph, nodes: dict, order: list = None, collapsed: set = frozenset(),
+                               index: ReferenceIndex = None) -> str:
     lines = [
         "## Node Instructions",
         "",
@@ -162,7 +238,12 @@ def _compile_node_instructions(graph: AgentGraph, nodes: dict) -> str:
         "",
     ]
 
-    topo_order = graph.topological_sort()
+    if collapsed:
+        lines.append("Rarely-used nodes are summarized at the end. Before executing one of them,")
+        lines.append("load its full instructions (`node_enter` returns them, or read the listed file).")
+        lines.append("")
+
+    topo_order = order or graph.topological_sort()
 
     for node_id in topo_order:
         node = graph.nodes.get(node_id)
@@ -172,6 +253,10 @@ def _compile_node_instructions(graph: AgentGraph, nodes: dict) -> str:
         node_dir_name = node_id.replace("_", "-")
         node_data = nodes.get(node_dir_name, nodes.get(node_id, {}))
 
+        if node_id in collapsed:
+            lines.extend(_compile_collapsed_node(node, node_data))
+            continue
+
         lines.append(f"### 🔹 {node.display_name} (`{node_id}`)")
         lines.append(f"- **Type**: {node.node_type}")
         if node.model:
@@ -194,16 +279,194 @@ def _compile_node_instructions(graph: AgentGraph, nodes: dict) -> str:
         if refs:
             lines.append("")
             lines.append("**Reference Materials:**")
+            scope = index.node_scope(node_id) if index is not None else None
+            indexed = []
             for ref in refs:
+                if scope is not None and not is_inlined(scope, _reference_size(node_data, ref)):
+                    indexed.append(ref["name"])
+                    continue
                 lines.append(f"<reference name=\"{ref['name']}\">")
                 lines.append(ref["content"])
                 lines.append("</reference>")
+            if indexed:
+                names = ", ".join(f"`{name}`" for name in indexed)
+                lines.append(f"Indexed: {names}. The sections most relevant to each input are "
+                             f"passed in at runtime (`_references`); for this step:")
+                query = f"{node.display_name} {instructions}"
+                for excerpt in index.search(query, [scope], DEFAULT_TOP_K, indexed_only=True):
+                    lines.append(excerpt.render())
 
         lines.append("")
 
     return "\n".join(lines)
 
 
+def _reference_size(node_data: dict, ref: dict) -> int:
+    """Bytes of a node reference file on disk."""
+    path = Path(node_data.get("path", "")) / "references" / ref["name"]
+    return path.stat().st_size if path.is_file() else len(ref["content"])
+
+
+def _compile_reference_library(index: ReferenceIndex) -> str:
+    if index is None or not index.scope_size(AGENT_SCOPE):
+        return ""
+    files = sorted({index.sources[i] for i in range(len(index)) if index.doc_scope[i] == 0})
+    lines = [
+        "## Reference Library",
+        "",
+        f"Agent-wide references ({index.scope_size(AGENT_SCOPE)} indexed sections): "
+        + ", ".join(f"`{name}`" for name in files) + ".",
+        "The most relevant sections for each input are passed to each step at runtime (`_references`).",
+    ]
+    return "\n".join(lines)
+
+
+def _compile_collapsed_node(node: NodeMeta, node_data: dict) -> list:
+    """Short summary of a cold node; full instructions are loaded on demand."""
+    lines = [f"### 🔸 {node.display_name} (`{node.id}`) — rarely used"]
+    lines.append(f"- **Type**: {node.node_type}")
+    summary = _summarize_instructions(node_data.get("instructions", ""))
+    if summary:
+        lines.append(f"- **Summary**: {summary}")
+    if node_data.get("path"):
+        lines.append(f"- **Full instructions**: `nodes/{Path(node_data['path']).name}/index.md`")
+    lines.append("")
+    return lines
+
+
+def _summarize_instructions(instructions: str) -> str:
+    """First paragraph of the `## Role` section, else the first prose line."""
+    in_role = False
+    role = []
+    for line in instructions.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            if role:
+                break
+            in_role = stripped.lstrip("#").strip().lower() == "role"
+            continue
+        if in_role:
+            if not stripped and role:
+                break
+            if stripped:
+                role.append(stripped)
+    if role:
+        return " ".join(role)
+    for line in instructions.splitlines():
+        if line.strip() and not line.strip().startswith("#"):
+            return line.strip()
+    return ""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(text) // 4
+
+
+def layout_savings(agent_dir: str, profile, cold_threshold: float = COLD_SESSION_RATE) -> dict:
+    """Compare the default and profile-guided prompts.
+
+    The expected on-demand cost charges each collapsed node's full
+    instructions once per session that reaches it, spread over the average
+    number of node visits (turns) per session.
+    """
+    baseline = estimate_tokens(compile_system_prompt(agent_dir))
+    profiled = estimate_tokens(compile_system_prompt(agent_dir, profile, cold_threshold))
+
+    agent = load_agent_fast(agent_dir, lazy=True)
+    graph = agent["graph"]
+    _, collapsed = profile_layout(graph, profile, cold_threshold)
+
+    on_demand = 0.0
+    for node_id in collapsed:
+        node_data = agent["nodes"].get(node_id.replace("_", "-"), agent["nodes"].get(node_id, {}))
+        rate = profile.nodes.get(node_id, {}).get("session_rate", 0.0)
+        on_demand += rate * estimate_tokens(node_data.get("instructions", ""))
+
+    sessions = max(profile.sessions, 1)
+    turns = sum(n["visits"] for n in profile.nodes.values()) / sessions or 1.0
+    per_turn = baseline - profiled - on_demand / turns
+
+    return {
+        "baseline_tokens": baseline,
+        "profiled_tokens": profiled,
+        "collapsed_nodes": sorted(collapsed),
+        "on_demand_tokens_per_session": round(on_demand, 1),
+        "turns_per_session": round(turns, 2),
+        "expected_tokens_saved_per_turn": round(per_turn, 1),
+    }
+
+
+def _subagent_dirs(agent: dict, prefix: str = "") -> list:
+    """(namespaced node ID, path) of every sub-agent, nested ones included."""
+    found = []
+    for name, node_data in (agent.get("nodes") or {}).items():
+        sub = node_data.get("sub_agent")
+        if not sub:
+            continue
+        node_id = next((n for n in (agent["graph"].nodes if agent.get("graph") else ())
+                        if n.replace("_", "-") == name or n == name), name)
+        found.append((prefix + node_id, node_data["path"]))
+        found.extend(_subagent_dirs(sub, f"{prefix}{node_id}{SEPARATOR}"))
+    return found
+
+
+def flatten_savings(agent_dir: str, profile=None) -> dict:
+    """Size and round-trip trade-off of flattening sub-agents.
+
+    Unflattened, each visit of a sub-agent node loads the sub-agent's own
+    prompt and walks the sub-agent node, its START and its exit as steps.
+    Visits per run come from `profile` (a TraceStats); without one, each
+    sub-agent node counts once per run. Nested sub-agents are counted once
+    per visit of their parent.
+    """
+    agent = load_agent_fast(agent_dir, lazy=True)
+    report = FlattenReport()
+    flatten_agent(agent, report)
+    parent = estimate_tokens(compile_system_prompt(agent_dir))
+    flat = estimate_tokens(compile_system_prompt(agent_dir, flatten=True))
+    subs = {node_id: estimate_tokens(compile_system_prompt(path)) for node_id, path in _subagent_dirs(agent)}
+
+    loads = steps = 0.0
+    for node_id in subs:
+        top = node_id.split(SEPARATOR)[0]
+        visits = 1.0
+        if profile is not None:
+            visits = profile.nodes.get(top, {}).get("visits", 0) / max(profile.sessions, 1)
+        loads += visits
+        if node_id == top:
+            removed = [n for n in report.removed_nodes if n == top or n.startswith(top + SEPARATOR)]
+            steps += visits * len(removed)
+
+    return {
+        **report.to_dict(),
+        "parent_tokens": parent,
+        "subagent_tokens": subs,
+        "flattened_tokens": flat,
+        "added_tokens": flat - parent,
+        "prompt_loads_saved_per_run": round(loads, 2),
+        "steps_saved_per_run": round(steps, 2),
+    }
+
+
+def chain_savings(agent_dir: str, profile=None, flatten: bool = False) -> dict:
+    """Chains merged into composite steps and the turns they save per run.
+
+    `profile` (a TraceStats) should be recorded on the unmerged agent; see
+    chain_merge.turns_saved().
+    """
+    agent = load_agent_fast(agent_dir, lazy=True)
+    if flatten:
+        agent = flatten_agent(agent)
+    report = MergeReport()
+    merge_chains(agent, report)
+    return {
+        **report.to_dict(),
+        "turns_saved_per_run": turns_saved(report.chains, profile),
+        "profiled_sessions": profile.sessions if profile is not None else 0,
+    }
+
+
 def _compile_tools(nodes: dict, config: dict) -> str:
     all_tools = []
     mcp_servers = config.get("mcp_servers", [])
@@ -294,17 +557,15 @@ def _compile_guardrails(nodes: dict) -> str:
     for node_name, gr in all_guardrails:
         lines.append(f"### {node_name}")
 
-        input_rules = gr.get("input", [])
-        if input_rules:
-            lines.append("**Input Validation:**")
-            for rule in input_rules:
-                lines.append(f"  - {rule}")
-
-        output_rules = gr.get("output", [])
-        if output_rules:
-            lines.append("**Output Validation:**")
-            for rule in output_rules:
-                lines.append(f"  - {rule}")
+        rules = load_rules(gr)
+        for stage, title in (("input", "Input Validation"), ("output", "Output Validation")):
+            stage_rules = [r for r in rules if r.stage == stage]
+            if not stage_rules:
+                continue
+            lines.append(f"**{title}:**")
+            for rule in stage_rules:
+                action = f" → on failure: {rule.action}" if rule.action != "fail" else ""
+                lines.append(f"  - {rule.check}{action}")
 
         lines.append("")
 
@@ -389,16 +650,67 @@ def _compile_footer(agent_dir: str) -> str:
 > To update, modify the source files and re-run the compiler."""
 
 
-def compile_and_write(agent_dir: str) -> str:
-    """Compile and write the SYSTEM_PROMPT.md to the agent directory."""
-    prompt = compile_system_prompt(agent_dir)
+def compile_and_write(agent_dir: str, profile=None, cold_threshold: float = COLD_SESSION_RATE,
+                      flatten: bool = False, merge: bool = False, index: bool = False) -> str:
+    """Compile and write the SYSTEM_PROMPT.md to the agent directory.
+
+    The trace profile only applies to this agent; sub-agents are compiled
+    with the default topological layout, or inlined with `flatten`. With
+    `merge`, the composite -> original node mapping goes to CHAIN_MAP_FILE.
+    With `index`, the reference index is (re)built first.
+    """
+    if index:
+        index_path = reference_index.build_index(agent_dir)
+        if index_path is not None:
+            print(f"📚 Indexed references → {index_path}")
+    elif (Path(agent_dir) / reference_index.INDEX_DIR).is_dir() and ReferenceIndex.load(agent_dir) is None:
+        print("⚠️  References changed since the index was built; it is ignored until rebuilt with --index")
+    prompt = compile_system_prompt(agent_dir, profile, cold_threshold, flatten=flatten, merge=merge)
     output_path = Path(agent_dir) / "SYSTEM_PROMPT.md"
     output_path.write_text(prompt)
     print(f"✅ Compiled system prompt → {output_path}")
     print(f"   Size: {len(prompt)} chars, {len(prompt.split(chr(10)))} lines")
 
+    map_path = Path(agent_dir) / CHAIN_MAP_FILE
+    if merge:
+        savings = chain_savings(agent_dir, profile, flatten)
+        map_path.write_text(json.dumps(savings, indent=2))
+        if savings["chains"]:
+            for composite, members in savings["chains"].items():
+                print(f"   Merged chain: {' → '.join(members)} as `{composite}`")
+            basis = f"{savings['profiled_sessions']} sessions" if profile is not None else "one pass per chain"
+            print(f"   Turns saved per run: {savings['turns_saved_per_run']} ({basis})")
+            print(f"   Chain map → {map_path}")
+        else:
+            print("   No mergeable chains")
+    elif map_path.is_file():
+        map_path.unlink()     # stale mapping from an earlier merged build
+
+    if profile is not None:
+        savings = layout_savings(agent_dir, profile, cold_threshold)
+        print(f"   Profile-guided layout ({profile.sessions} sessions):")
+        print(f"   Tokens: {savings['baseline_tokens']} → {savings['profiled_tokens']}")
+        print(f"   Collapsed: {', '.join(savings['collapsed_nodes']) or 'none'}")
+        print(f"   On-demand detail: ~{savings['on_demand_tokens_per_session']} tokens/session")
+        print(f"   Expected savings: ~{savings['expected_tokens_saved_per_turn']} tokens/turn")
+
+    if flatten:
+        savings = flatten_savings(agent_dir, profile)
+        if savings["subagents"]:
+            print(f"   Flattened sub-agents: {', '.join(savings['subagents'])}")
+            print(f"   Nodes: {savings['nodes_before']} → {savings['nodes_after']}   "
+                  f"Edges: {savings['edges_before']} → {savings['edges_after']}")
+            print(f"   Size: {savings['parent_tokens']} → {savings['flattened_tokens']} tokens "
+                  f"(+{savings['added_tokens']}; sub-agent prompts were "
+                  f"{sum(savings['subagent_tokens'].values())} tokens)")
+            print(f"   Round-trips saved per run: {savings['prompt_loads_saved_per_run']} prompt loads, "
+                  f"{savings['steps_saved_per_run']} steps")
+            for note in savings["dropped"]:
+                print(f"   ⚠️  Dropped {note}")
+        return prompt
+
     # Also compile sub-agents recursively
-    agent = load_agent(agent_dir)
+    agent = load_agent_fast(agent_dir, lazy=True)
     for node_name, node_data in agent.get("nodes", {}).items():
         if "sub_agent" in node_data:
             sub_path = node_data["path"]
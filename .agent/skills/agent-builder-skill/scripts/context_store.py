@@ -0,0 +1,541 @@
+"""
+Copy-on-Write Session Context
+
+The session context (the shared memory of `context.shared_memory` in
+agent-config.yaml) is read by every node and written by most, and each
+branch of a fork and each pass of a @max_iterations loop needs its own
+view of it. Context is a persistent map — a hash array mapped trie with
+path copying — so a write returns a new Context that shares every untouched
+subtree with the old one:
+
+    snapshot        O(1): a Context never changes, keeping a reference is
+                    the snapshot
+    set / updated   O(log32 n) new trie nodes per key written
+    diff(a, b)      skips subtrees the two snapshots share, so its cost
+                    follows the size of the change, not of the context
+
+Values are shared, not copied: replace a nested value instead of mutating
+it in place.
+
+merge_branches() defines how the branches of a fork are combined at the
+aggregator, by its @strategy:
+
+    merge   (default) the changes of every branch are applied in edge order;
+            a key changed differently by several branches is a conflict:
+            dicts are merged key by key, lists keep the items each branch
+            added, anything else takes the value of the later branch
+    vote    per key, the value most of the branches that changed it agree
+            on; ties go to the earlier branch
+    first   only the changes of the branch that reached the aggregator first
+
+Benchmark against copy.deepcopy:
+
+    python context_store.py --keys 2000 --branches 8 --writes 4
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+_MISSING = object()
+# Contexts up to this many keys are plain dicts (see Context)
+SMALL_CONTEXT = 16
+
+MERGE_STRATEGIES = ("merge", "vote", "first")
+
+
+# ---------------------------------------------------------------------------
+# Trie
+# ---------------------------------------------------------------------------
+
+class _Leaf:
+    __slots__ = ("hash", "key", "value")
+
+    def __init__(self, h, key, value):
+        self.hash = h
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    """Leaves whose keys have the same full hash."""
+    __slots__ = ("hash", "leaves")
+
+    def __init__(self, h, leaves):
+        self.hash = h
+        self.leaves = leaves
+
+    def get(self, key):
+        for leaf in self.leaves:
+            if leaf.key == key:
+                return leaf.value
+        return _MISSING
+
+    def assoc(self, leaf: _Leaf):
+        for i, current in enumerate(self.leaves):
+            if current.key == leaf.key:
+                if current.value is leaf.value:
+                    return self, False
+                return _Collision(self.hash, self.leaves[:i] + (leaf,) + self.leaves[i + 1:]), False
+        return _Collision(self.hash, self.leaves + (leaf,)), True
+
+    def without(self, key):
+        leaves = tuple(leaf for leaf in self.leaves if leaf.key != key)
+        if len(leaves) == len(self.leaves):
+            return self
+        return leaves[0] if len(leaves) == 1 else _Collision(self.hash, leaves)
+
+
+class _Node:
+    """32-way branch; `slots` holds the children present in `bitmap`, in bit order."""
+    __slots__ = ("bitmap", "slots")
+
+    def __init__(self, bitmap, slots):
+        self.bitmap = bitmap
+        self.slots = slots
+
+
+_EMPTY = _Node(0, ())
+
+
+def _hash(key) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _pair(shift: int, a, b):
+    """Smallest subtree holding a and b (leaves or collisions)."""
+    if a.hash == b.hash:
+        if type(a) is _Collision:
+            return a.assoc(b)[0]
+        return _Collision(a.hash, (a, b))
+    ia, ib = (a.hash >> shift) & _MASK, (b.hash >> shift) & _MASK
+    if ia == ib:
+        return _Node(1 << ia, (_pair(shift + _BITS, a, b),))
+    return _Node((1 << ia) | (1 << ib), (a, b) if ia < ib else (b, a))
+
+
+def _get(node: _Node, h: int, key):
+    shift = 0
+    while True:
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return _MISSING
+        child = node.slots[(node.bitmap & (bit - 1)).bit_count()]
+        kind = type(child)
+        if kind is _Node:
+            node = child
+            shift += _BITS
+        elif kind is _Leaf:
+            return child.value if child.key is key or child.key == key else _MISSING
+        else:
+            return child.get(key) if child.hash == h else _MISSING
+
+
+def _assoc(node: _Node, shift: int, leaf: _Leaf) -> tuple:
+    """(new node, whether a key was added); `node` itself when nothing changed."""
+    bit = 1 << ((leaf.hash >> shift) & _MASK)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    slots = node.slots
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit, slots[:index] + (leaf,) + slots[index:]), True
+    current = slots[index]
+    kind = type(current)
+    if kind is _Node:
+        child, added = _assoc(current, shift + _BITS, leaf)
+    elif kind is _Leaf and (current.key is leaf.key or current.key == leaf.key):
+        child, added = (current if current.value is leaf.value else leaf), False
+    elif kind is _Collision and current.hash == leaf.hash:
+        child, added = current.assoc(leaf)
+    else:
+        child, added = _pair(shift + _BITS, current, leaf), True
+    if child is current:
+        return node, False
+    return _Node(node.bitmap, slots[:index] + (child,) + slots[index + 1:]), added
+
+
+def _dissoc(node: _Node, shift: int, h: int, key):
+    """Node without `key` (None when it becomes empty); `node` itself when absent."""
+    bit = 1 << ((h >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node
+    index = (node.bitmap & (bit - 1)).bit_count()
+    current = node.slots[index]
+    kind = type(current)
+    if kind is _Leaf:
+        if not (current.key is key or current.key == key):
+            return node
+        child = None
+    elif kind is _Node:
+        child = _dissoc(current, shift + _BITS, h, key)
+        if child is current:
+            return node
+        # A branch left with one leaf collapses into its parent
+        if child is not None and len(child.slots) == 1 and type(child.slots[0]) is not _Node:
+            child = child.slots[0]
+    else:
+        child = current.without(key) if current.hash == h else current
+        if child is current:
+            return node
+    slots = node.slots
+    if child is None:
+        if len(slots) == 1:
+            return None
+        return _Node(node.bitmap & ~bit, slots[:index] + slots[index + 1:])
+    return _Node(node.bitmap, slots[:index] + (child,) + slots[index + 1:])
+
+
+def _fill(node: _Node, out: dict) -> None:
+    for child in node.slots:
+        kind = type(child)
+        if kind is _Leaf:
+            out[child.key] = child.value
+        elif kind is _Node:
+            _fill(child, out)
+        else:
+            for leaf in child.leaves:
+                out[leaf.key] = leaf.value
+
+
+def _leaves(entry):
+    if entry is None:
+        return
+    kind = type(entry)
+    if kind is _Leaf:
+        yield entry
+    elif kind is _Collision:
+        yield from entry.leaves
+    else:
+        for child in entry.slots:
+            yield from _leaves(child)
+
+
+def _same(a, b) -> bool:
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+
+def _diff(a, b, diff: "ContextDiff") -> None:
+    """Collect the changes from subtree a to subtree b into `diff`."""
+    if a is b:
+        return
+    if type(a) is _Node and type(b) is _Node:
+        bits = a.bitmap | b.bitmap
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            _diff(a.slots[(a.bitmap & (bit - 1)).bit_count()] if a.bitmap & bit else None,
+                  b.slots[(b.bitmap & (bit - 1)).bit_count()] if b.bitmap & bit else None,
+                  diff)
+        return
+    # Subtrees of different shape: compare their leaves directly
+    _diff_items({leaf.key: leaf.value for leaf in _leaves(a)},
+                ((leaf.key, leaf.value) for leaf in _leaves(b)), diff)
+
+
+def _diff_items(old: dict, new, diff: "ContextDiff") -> None:
+    old = dict(old)
+    for key, value in new:
+        previous = old.pop(key, _MISSING)
+        if previous is _MISSING:
+            diff.added[key] = value
+        elif not _same(previous, value):
+            diff.changed[key] = value
+    diff.removed.extend(old)
+
+
+# ---------------------------------------------------------------------------
+# Context
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ContextDiff:
+    """Changes from one Context snapshot to another."""
+    added: dict = field(default_factory=dict)
+    changed: dict = field(default_factory=dict)     # key -> new value
+    removed: list = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    @property
+    def updates(self) -> dict:
+        """Keys to set: added and changed."""
+        return {**self.added, **self.changed}
+
+    def apply(self, context: "Context") -> "Context":
+        return context.updated(self.updates).without(self.removed)
+
+    def to_dict(self):
+        return {"added": self.added, "changed": self.changed, "removed": sorted(self.removed, key=str)}
+
+
+class Context(Mapping):
+    """Immutable mapping with structural sharing; writes return a new Context.
+
+    Up to SMALL_CONTEXT keys the Context is a plain dict copied on write,
+    which is cheaper than the trie at that size.
+    """
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, data=None):
+        self._root, self._size = {}, 0
+        if data:
+            other = self.updated(data)
+            self._root, self._size = other._root, other._size
+
+    @classmethod
+    def _make(cls, root, size: int) -> "Context":
+        context = cls.__new__(cls)
+        context._root, context._size = root, size
+        return context
+
+    def __getitem__(self, key):
+        root = self._root
+        if type(root) is dict:
+            return root[key]
+        value = _get(root, _hash(key), key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        root = self._root
+        if type(root) is dict:
+            return root.get(key, default)
+        value = _get(root, _hash(key), key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        root = self._root
+        if type(root) is dict:
+            return key in root
+        return _get(root, _hash(key), key) is not _MISSING
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def pick(self, keys) -> dict:
+        """{key: value} for those of `keys` that are present."""
+        root = self._root
+        if type(root) is dict:
+            return {key: root[key] for key in keys if key in root}
+        out = {}
+        for key in keys:
+            value = _get(root, _hash(key), key)
+            if value is not _MISSING:
+                out[key] = value
+        return out
+
+    def set(self, key, value) -> "Context":
+        return self.updated(((key, value),))
+
+    def updated(self, data) -> "Context":
+        """A Context with the keys of `data` (a mapping or (key, value) pairs) set."""
+        root = self._root
+        if not hasattr(data, "items"):
+            data = dict(data)
+        if type(root) is dict:
+            if not data:
+                return self
+            small = {**root, **data}
+            if len(small) <= SMALL_CONTEXT:
+                return Context._make(small, len(small))
+            root, data = _EMPTY, small
+        size = self._size if root is self._root else 0
+        for key, value in data.items():
+            root, added = _assoc(root, 0, _Leaf(_hash(key), key, value))
+            size += added
+        return self if root is self._root else Context._make(root, size)
+
+    def without(self, keys) -> "Context":
+        root = self._root
+        if type(root) is dict:
+            keys = set(keys)
+            small = {k: v for k, v in root.items() if k not in keys}
+            return self if len(small) == len(root) else Context._make(small, len(small))
+        size = self._size
+        for key in keys:
+            pruned = _dissoc(root, 0, _hash(key), key)
+            if pruned is not root:
+                root, size = pruned or _EMPTY, size - 1
+        return self if root is self._root else Context._make(root, size)
+
+    def diff(self, other: "Context") -> ContextDiff:
+        """Changes from this snapshot to `other`."""
+        diff = ContextDiff()
+        if type(self._root) is _Node and type(other._root) is _Node:
+            _diff(self._root, other._root, diff)
+        elif self._root is not other._root:
+            _diff_items(self.to_dict(), other.to_dict().items(), diff)
+        return diff
+
+    def to_dict(self) -> dict:
+        root = self._root
+        if type(root) is dict:
+            return dict(root)
+        out = {}
+        _fill(root, out)
+        return out
+
+    def __reduce__(self):
+        return Context, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"Context({self.to_dict()!r})"
+
+
+# ---------------------------------------------------------------------------
+# Merging fork branches
+# ---------------------------------------------------------------------------
+
+def _combine(base, current, new):
+    """Value for a key two branches changed differently (merge strategy)."""
+    if isinstance(current, dict) and isinstance(new, dict):
+        base = base if isinstance(base, dict) else {}
+        return {**current, **{k: v for k, v in new.items() if k not in base or not _same(base[k], v)}}
+    if isinstance(current, list) and isinstance(new, list):
+        return current + [item for item in new if item not in current]
+    return new
+
+
+def merge_branches(base: Context, branches: list, strategy: str = None) -> tuple:
+    """Combine the contexts of fork branches that started from `base`.
+
+    `branches` are in edge order, except that for `first` branches[0] must
+    be the branch that arrived first. Returns (context, conflicts) where
+    conflicts lists the keys branches changed to different values.
+    """
+    strategy = strategy or "merge"
+    if strategy not in MERGE_STRATEGIES:
+        raise ValueError(f"Unknown merge strategy '{strategy}' (expected {', '.join(MERGE_STRATEGIES)})")
+    if not branches:
+        return base, []
+    if strategy == "first":
+        return branches[0], []
+
+    # key -> [(branch index, new value or _MISSING when removed)]
+    proposals = {}
+    for index, branch in enumerate(branches):
+        diff = base.diff(branch)
+        for key, value in diff.updates.items():
+            proposals.setdefault(key, []).append((index, value))
+        for key in diff.removed:
+            proposals.setdefault(key, []).append((index, _MISSING))
+
+    updates, removed, conflicts = {}, [], []
+    for key, changes in proposals.items():
+        values = [value for _, value in changes]
+        if any(not _same(values[0], value) for value in values[1:]):
+            conflicts.append(key)
+        if strategy == "vote":
+            tally = []    # [value, votes] in order of first proposal
+            for value in values:
+                for entry in tally:
+                    if _same(entry[0], value):
+                        entry[1] += 1
+                        break
+                else:
+                    tally.append([value, 1])
+            value = max(tally, key=lambda entry: entry[1])[0]     # first of the most voted
+        else:
+            value = values[0]
+            original = base.get(key)
+            for new in values[1:]:
+                value = new if value is _MISSING or new is _MISSING else _combine(original, value, new)
+        if value is _MISSING:
+            removed.append(key)
+        else:
+            updates[key] = value
+    return base.updated(updates).without(removed), sorted(conflicts, key=str)
+
+
+if __name__ == "__main__":
+    import argparse
+    import copy
+    import json
+    import random
+    import time
+    import tracemalloc
+
+    ap = argparse.ArgumentParser(description="Benchmark Context snapshots against copy.deepcopy")
+    ap.add_argument("--keys", type=int, default=2000, help="Keys in the context")
+    ap.add_argument("--branches", type=int, default=8, help="Snapshots taken (branches or iterations)")
+    ap.add_argument("--writes", type=int, default=4, help="Keys each branch writes")
+    ap.add_argument("--rounds", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    data = {f"field_{i}": {"text": f"value {i} " * 8, "score": rng.random(), "tags": [i, i + 1]}
+            for i in range(args.keys)}
+    writes = [[(f"field_{rng.randrange(args.keys * 2)}", {"text": f"branch {b}", "score": rng.random()})
+               for _ in range(args.writes)] for b in range(args.branches)]
+
+    base_dict = copy.deepcopy(data)
+    started = time.perf_counter()
+    base = Context(data)
+    build_s = time.perf_counter() - started
+
+    # The host builds the context incrementally as nodes write, so both sides
+    # start from an existing base and time only branching, diffing and merging
+    def naive():
+        """Each branch deep-copies the context, writes, and is merged by comparing every key."""
+        merged = copy.deepcopy(base_dict)
+        for branch_writes in writes:
+            view = copy.deepcopy(base_dict)
+            view.update(branch_writes)
+            for key, value in view.items():
+                if key not in base_dict or base_dict[key] != value:
+                    merged[key] = value
+        return merged
+
+    def persistent():
+        views = [base.updated(branch_writes) for branch_writes in writes]
+        return merge_branches(base, views, "merge")[0]
+
+    def measure(fn):
+        result = fn()
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            fn()
+        seconds = (time.perf_counter() - started) / args.rounds
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, seconds, peak
+
+    naive_result, naive_s, naive_peak = measure(naive)
+    cow_result, cow_s, cow_peak = measure(persistent)
+    views = [base.updated(branch_writes) for branch_writes in writes]
+    started = time.perf_counter()
+    for view in views:
+        base.diff(view)
+    diff_s = (time.perf_counter() - started) / args.branches
+
+    assert cow_result.to_dict() == naive_result, "merge results differ"
+    print(json.dumps({
+        "keys": args.keys,
+        "branches": args.branches,
+        "writes_per_branch": args.writes,
+        "deepcopy": {"ms": round(naive_s * 1000, 3), "peak_kb": round(naive_peak / 1024)},
+        "context": {"ms": round(cow_s * 1000, 3), "peak_kb": round(cow_peak / 1024),
+                    "diff_us": round(diff_s * 1e6, 1), "build_ms": round(build_s * 1000, 1)},
+        "speedup": round(naive_s / cow_s, 1) if cow_s else None,
+    }, indent=2))
@@ -0,0 +1,307 @@
+"""
+Incremental Agent Deployment
+
+Syncs an agent source tree into a deployed copy without tearing the copy
+down. Files are compared by SHA-256 and only changed files are written;
+every write goes to a temporary file in the target directory and is moved
+into place with os.replace(), so a running session never reads a half
+written file. Files that disappeared from the source are removed; anything
+else in the deployed tree (e.g. .agent-sessions) is left alone. A first
+deploy over a copy made without a manifest (e.g. `cp -R`) treats every
+file outside SKIP_DIRS as deployed, so the result matches a clean copy.
+
+Each deploy writes `.deploy-manifest.json` into the destination:
+
+    {
+      "version": 3,
+      "files": {"nodes/classify/index.md": {"sha256": "...", "size": 812}, ...},
+      "changed": [...], "removed": [...],
+      "nodes": ["classify"],          # nodes whose files changed
+      "reload": "nodes"               # none | nodes | full
+    }
+
+so the runtime can hot-reload only the changed nodes. A change to the
+graph, config or compiled prompt requires a full reload. The manifest also
+records the source file stats, so unchanged files are not hashed again.
+
+Dependencies of the runtime (npm) are only installed when the hash of its
+lockfile (package-lock.json, else package.json) differs from the last
+install.
+
+The module only needs the standard library, so setup scripts can run it
+on hosts without the skill's dependencies:
+
+    python deploy.py <source-agent-dir> <deployed-dir> [--runtime <package-dir>]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+# Same as fast_loader's; repeated here so deploying needs no PyYAML
+DEFAULT_WORKERS = 16
+SKIP_DIRS = {".agent-sessions", "runs", "__pycache__", ".git", "node_modules", ".reference-index"}
+
+MANIFEST_FILE = ".deploy-manifest.json"
+LOCK_HASH_FILE = ".deploy-lock-hash"
+LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json", "package.json")
+# Changes to these require reloading the whole agent
+FULL_RELOAD_FILES = {"agent-mermaid.md", "agent-config.yaml", "SYSTEM_PROMPT.md"}
+
+
+@dataclass
+class DeployResult:
+    source: str
+    dest: str
+    changed: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    unchanged: int = 0
+    hashed: int = 0               # files whose content had to be hashed
+    bytes_copied: int = 0
+    nodes: list = field(default_factory=list)
+    reload: str = "none"
+    install: str = "skipped"      # skipped | installed | unchanged | failed | unavailable
+    seconds: float = 0.0
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "dest": self.dest,
+            "changed": self.changed,
+            "removed": self.removed,
+            "unchanged": self.unchanged,
+            "hashed": self.hashed,
+            "bytes_copied": self.bytes_copied,
+            "nodes": self.nodes,
+            "reload": self.reload,
+            "install": self.install,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def file_sha256(path) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+def scan_files(root: Path) -> dict:
+    """relative path -> os.stat_result for every file under root. SKIP_DIRS
+    only apply at the root: a node may well be called `runs`."""
+    files = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if directory != root or entry.name not in SKIP_DIRS:
+                        stack.append(Path(entry.path))
+                elif entry.is_file() and entry.name != MANIFEST_FILE:
+                    files[Path(entry.path).relative_to(root).as_posix()] = entry.stat()
+    return files
+
+
+def load_manifest(dest: Path) -> dict:
+    try:
+        return json.loads((dest / MANIFEST_FILE).read_text())
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _stage(src: Path, dest: Path) -> str:
+    """Copy src next to dest under a temporary name; returns that name."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".tmp")
+    os.close(fd)
+    shutil.copy2(src, tmp)
+    return tmp
+
+
+def node_of(rel: str):
+    """Node ID for a file under nodes/<dir>/, else None."""
+    parts = rel.split("/")
+    if len(parts) > 2 and parts[0] == "nodes":
+        return parts[1].replace("-", "_")
+    return None
+
+
+def sync_tree(source: str, dest: str, max_workers: int = DEFAULT_WORKERS) -> DeployResult:
+    """Bring `dest` up to date with `source` and write the manifest."""
+    started = time.perf_counter()
+    src_root, dest_root = Path(source).resolve(), Path(dest).resolve()
+    result = DeployResult(source=str(src_root), dest=str(dest_root))
+    previous = load_manifest(dest_root)
+    known = previous.get("files") or {}
+    dest_root.mkdir(parents=True, exist_ok=True)
+    source_files = scan_files(src_root)
+    # Without a manifest nothing says which files earlier copies put there
+    deployed = set(known) if previous else set(scan_files(dest_root))
+
+    # Reuse the recorded hash when size and mtime match the last deploy and
+    # the deployed file is still there
+    def digest(rel):
+        st = source_files[rel]
+        entry = known.get(rel)
+        if (entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+                and (dest_root / rel).is_file()):
+            return rel, entry["sha256"], False
+        return rel, file_sha256(src_root / rel), True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        digests = list(pool.map(digest, sorted(source_files)))
+
+    files, staged = {}, []
+    try:
+        for rel, sha, hashed in digests:
+            st = source_files[rel]
+            result.hashed += hashed
+            files[rel] = {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            target = dest_root / rel
+            if (known.get(rel) or {}).get("sha256") == sha and target.is_file():
+                result.unchanged += 1
+                continue
+            if not known.get(rel) and target.is_file() and file_sha256(target) == sha:
+                result.unchanged += 1      # first deploy over an identical copy
+                continue
+            staged.append((_stage(src_root / rel, target), target))
+            result.changed.append(rel)
+            result.bytes_copied += st.st_size
+    except BaseException:
+        for tmp, _ in staged:
+            os.unlink(tmp)
+        raise
+
+    # Swap everything in once all copies are staged
+    for tmp, target in staged:
+        os.replace(tmp, target)
+    for rel in sorted(deployed - set(files)):
+        try:
+            (dest_root / rel).unlink()
+        except FileNotFoundError:
+            pass
+        result.removed.append(rel)
+        _prune_empty(dest_root / rel, dest_root)
+
+    touched = result.changed + result.removed
+    result.nodes = sorted({n for n in map(node_of, touched) if n})
+    if any(rel in FULL_RELOAD_FILES for rel in touched):
+        result.reload = "full"
+    elif result.nodes:
+        result.reload = "nodes"
+    elif touched:
+        result.reload = "full"     # other shared files (e.g. references)
+
+    manifest = {
+        "version": int(previous.get("version", 0)) + (1 if touched else 0),
+        "deployed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "source": result.source,
+        "files": files,
+        "changed": result.changed,
+        "removed": result.removed,
+        "nodes": result.nodes,
+        "reload": result.reload,
+    }
+    _write_atomic(dest_root / MANIFEST_FILE, json.dumps(manifest, indent=1).encode())
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _prune_empty(path: Path, root: Path) -> None:
+    parent = path.parent
+    while parent != root and parent.is_dir() and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
+
+
+def lockfile_hash(package_dir: Path):
+    for name in LOCKFILES:
+        path = package_dir / name
+        if path.is_file():
+            return file_sha256(path)
+    return None
+
+
+def install_dependencies(package_dir: str, force: bool = False) -> str:
+    """npm install in `package_dir` unless its lockfile hash is unchanged."""
+    package_dir = Path(package_dir)
+    current = lockfile_hash(package_dir)
+    if current is None:
+        return "skipped"
+    marker = package_dir / "node_modules" / LOCK_HASH_FILE
+    if not force and marker.is_file() and marker.read_text().strip() == current:
+        return "unchanged"
+    npm = shutil.which("npm")
+    if npm is None:
+        return "unavailable"
+    proc = subprocess.run([npm, "install", "--silent"], cwd=package_dir,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if proc.returncode != 0:
+        return "failed"
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(marker, current.encode())
+    return "installed"
+
+
+def deploy(source: str, dest: str, runtime: str = None, force_install: bool = False,
+           max_workers: int = DEFAULT_WORKERS) -> DeployResult:
+    """Sync the agent and, with `runtime`, its package dependencies."""
+    result = sync_tree(source, dest, max_workers=max_workers)
+    if runtime:
+        started = time.perf_counter()
+        result.install = install_dependencies(runtime, force=force_install)
+        result.seconds += time.perf_counter() - started
+    return result
+
+
+def print_result(result: DeployResult, runtime: str = None) -> None:
+    print(f"🚚 Deployed {result.source} → {result.dest} in {result.seconds:.2f}s")
+    print(f"   Changed: {len(result.changed)} ({result.bytes_copied / 1024:.1f} KB)   "
+          f"Removed: {len(result.removed)}   Unchanged: {result.unchanged}   Hashed: {result.hashed}")
+    for rel in result.changed[:10]:
+        print(f"   ✏️  {rel}")
+    if len(result.changed) > 10:
+        print(f"   ... and {len(result.changed) - 10} more")
+    for rel in result.removed:
+        print(f"   🗑️  {rel}")
+    reload = {"none": "nothing to reload", "full": "full reload",
+              "nodes": f"reload nodes: {', '.join(result.nodes)}"}[result.reload]
+    print(f"   🔄 {reload} (manifest: {Path(result.dest) / MANIFEST_FILE})")
+    if runtime:
+        icon = {"installed": "✅", "unchanged": "⏭️ ", "failed": "❌", "unavailable": "⚠️ "}.get(result.install, "⏭️ ")
+        print(f"   {icon} Dependencies: {result.install}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Sync an agent into its deployed copy, copying only changed files")
+    ap.add_argument("source", help="Agent source directory")
+    ap.add_argument("dest", help="Deployed copy (created if missing)")
+    ap.add_argument("--runtime", help="Package directory whose npm dependencies to keep installed")
+    ap.add_argument("--force-install", action="store_true", help="Run npm install even if the lockfile is unchanged")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = ap.parse_args()
+
+    result = deploy(args.source, args.dest, runtime=args.runtime, force_install=args.force_install,
+                    max_workers=args.workers)
+    print_result(result, args.runtime)
@@ -0,0 +1,939 @@
+"""
+Multi-Session Execution Host
+
+Runs many concurrent sessions of one agent on asyncio. The agent is loaded
+and compiled once into a CompiledAgent — frozen node and edge records with
+@cond expressions precompiled — that every session shares read-only. A
+Session holds only what differs per conversation (current node, status,
+context, iteration counters, trace cursor) in a __slots__ object, and an
+idle session (e.g. parked at a human_input node) has no task or coroutine
+attached, so tens of thousands of them cost a few KB each.
+
+Node work is delegated to a handler coroutine:
+
+    async def handler(session, node, inputs) -> dict
+
+whose output is merged into the session context. A handler may return
+`_route: <target>` to pick a branch explicitly (the model's routing
+decision); otherwise the first outgoing edge whose @cond holds is taken,
+then an unconditional edge, then a @fallback edge. @cond expressions see
+the context and output plus `iterations`, `max` and `threshold` of the node.
+A @cond that orders strings (`severity <= 'medium'`) has no meaning the
+host can evaluate; such an edge is left to the model and only taken via
+`_route`.
+
+Deadlines and retries: each handler attempt is cancelled after the node's
+@timeout, and a node makes up to @retry attempts with exponential backoff
+and full jitter between them (`retry` trace events). A run is cancelled
+once its active time — waits at human_input nodes excluded — exceeds
+execution.max_total_time. With `hedge=True` the host sends a duplicate
+request when an attempt runs past the node's p95 latency (seeded from
+recorded traces via `hedge_after`, then observed online) and keeps the
+first result; only enable it when handlers are idempotent. A `prefetcher`
+(prefetch.Prefetcher) starts side-effect-free tool calls of likely
+successors while a router node runs. Handlers make tool calls through
+dispatch_tool(name, args), which checks the arguments against the tool's
+tools.yaml parameters (ValidationError, not retried) before they reach the
+prefetcher or the `call_tool` backend. A router node with a trained
+classifier (nodes/<id>/classifier.npz, see router_classifier.py) is decided
+locally when the classifier's confidence reaches the node's @threshold; the
+handler only runs for the inputs it is unsure about.
+
+Guardrails (nodes/<id>/guardrails.yaml, see guardrails.py) run around the
+handler: the input stage on the context plus the node's inputs, the output
+stage on those plus its output. A `warn` failure is only traced (as are
+rules delegated to the model when no `guardrail_check` answers them),
+`revise` re-runs the handler once with the failed checks under
+`_guardrail_feedback`, and `fail` or `escalate` raise GuardrailError, which
+takes the node's on_error edge like any other handler error.
+
+The context is a copy-on-write context_store.Context: each branch of a fork
+runs on its own O(1) snapshot, and the aggregator merges the branches by its
+@strategy (merge / vote / first). With a tracer, re-entering a loop node
+records what changed in the context since the previous pass
+(`context_diff` on the `enter` event), and an aggregator's `enter` event
+carries the merge outcome. With `spans` (spans.SpanRecorder) sampled runs
+record a span per node execution and routing decision under a root span
+per run; handlers add model and tool call spans with spans.span().
+With `references` (reference_index.ReferenceIndex) the reference chunks
+most relevant to a node's inputs that its compiled prompt does not carry
+are passed to the handler under `_references`.
+
+    host = ExecutionHost(CompiledAgent.from_dir("agents/travel-support"), handler)
+    session = await host.start({"message": "..."})
+    if session.status == "waiting":
+        session = await host.resume(session.id, {"human_decision": "approve"})
+
+Memory benchmark:
+
+    python execution_host.py <agent-dir> --sessions 10000
+"""
+
+import ast
+import asyncio
+import contextvars
+import itertools
+import random
+import re
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Callable, Optional
+
+from parser import parse_duration
+from fast_loader import load_agent_fast
+from context_store import Context, merge_branches
+from liveness import parse_fields
+from spans import annotate, span
+from tool_cache import ToolCache, iter_tool_defs
+import router_classifier
+from router_classifier import FastPathRouter, RouterClassifier
+from guardrails import GuardrailEngine, load_rules
+from validators import AgentValidators, ValidationError
+
+
+# Backoff before retry n (1-based): uniform in [0, min(MAX, BASE * 2**(n-1))]
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 10.0
+# Online latency history per node used for the hedging threshold
+HEDGE_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+# Input key carrying reference excerpts for the current step
+REFERENCES_KEY = "_references"
+# Input key carrying the failed output checks when a guardrail asks for a revision
+FEEDBACK_KEY = "_guardrail_feedback"
+
+# The host running the current step, for dispatch_tool()
+_current_host = contextvars.ContextVar("execution_host", default=None)
+
+# ---------------------------------------------------------------------------
+# Conditions
+# ---------------------------------------------------------------------------
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.Is, ast.IsNot, ast.Name, ast.Load, ast.Constant, ast.List, ast.Tuple,
+)
+_ORDERING = (ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+_KEYWORDS = {"AND": "and", "OR": "or", "NOT": "not", "true": "True", "false": "False", "null": "None"}
+# A quoted string (left as is) or a DSL keyword outside one
+_KEYWORD_TOKEN = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|\b(AND|OR|NOT|true|false|null)\b""")
+
+
+class _Scope(dict):
+    """Unknown names evaluate to None instead of raising."""
+    def __missing__(self, key):
+        return None
+
+
+def _orders_strings(tree: ast.AST) -> bool:
+    """True if an ordering comparison has a string literal operand."""
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Compare):
+            continue
+        operands = [node.left, *node.comparators]
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            if isinstance(op, _ORDERING) and any(
+                    isinstance(o, ast.Constant) and isinstance(o.value, str) for o in (left, right)):
+                return True
+    return False
+
+
+def compile_condition(expr: str) -> Optional[Callable[[dict], bool]]:
+    """Compile an @cond expression into `check(scope) -> bool`.
+
+    Supports comparisons, AND/OR/NOT, literals and field names. Expressions
+    outside that subset, and comparisons that fail at runtime (e.g. None <
+    500), evaluate to False. Ordering comparisons against a string literal
+    would compare alphabetically ('high' < 'medium'), so they return None:
+    the condition can only be decided by the model.
+    """
+    source = _KEYWORD_TOKEN.sub(lambda m: m.group(1) or _KEYWORDS[m.group(2)], expr)
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError:
+        return lambda scope: False
+    if not all(isinstance(n, _ALLOWED_NODES) for n in ast.walk(tree)):
+        return lambda scope: False
+    if _orders_strings(tree):
+        return None
+    code = compile(tree, f"<cond {expr}>", "eval")
+
+    def check(scope: dict) -> bool:
+        try:
+            return bool(eval(code, {"__builtins__": {}}, _Scope(scope)))
+        except Exception:
+            return False
+    return check
+
+
+# ---------------------------------------------------------------------------
+# Shared, immutable agent
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class CompiledEdge:
+    source: str
+    target: str
+    condition: Optional[str] = None
+    check: Optional[Callable] = field(default=None, compare=False, repr=False)
+    pass_fields: tuple = ()
+    max_iterations: Optional[int] = None
+    on_error: bool = False
+    fallback: bool = False
+
+    @property
+    def key(self) -> str:
+        """Iteration-counter key for edge @max_iterations."""
+        return f"{self.source}->{self.target}"
+
+    @property
+    def delegated(self) -> bool:
+        """The @cond cannot be evaluated locally; only the model can pick this edge."""
+        return self.condition is not None and self.check is None
+
+
+@dataclass(frozen=True)
+class CompiledNode:
+    id: str
+    node_type: str
+    model: Optional[str] = None
+    timeout: Optional[float] = None          # seconds
+    retry: int = 1
+    threshold: Optional[float] = None
+    max_iterations: Optional[int] = None
+    strategy: Optional[str] = None
+    tools: tuple = ()                        # function names from tools.yaml
+    servers: tuple = ()                      # @tools (MCP servers the node uses)
+    instructions: str = ""
+    edges: tuple = ()                        # outgoing CompiledEdges
+    classifier: Optional[str] = None         # path of a trained router classifier
+    guardrails: tuple = ()                   # GuardrailRules from guardrails.yaml
+
+
+@dataclass(frozen=True)
+class CompiledAgent:
+    name: str
+    path: str
+    start: str
+    nodes: MappingProxyType                  # id -> CompiledNode
+    config: MappingProxyType
+    tools: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))  # name -> tools.yaml entry
+    validators: AgentValidators = field(default_factory=AgentValidators, compare=False, repr=False)
+
+    @property
+    def default_model(self) -> Optional[str]:
+        return (self.config.get("defaults") or {}).get("model")
+
+    def model_for(self, node: CompiledNode) -> Optional[str]:
+        """The node's @model, else the agent's default model."""
+        return node.model or self.default_model
+
+    @classmethod
+    def from_dir(cls, agent_dir: str) -> "CompiledAgent":
+        return cls.from_agent(load_agent_fast(agent_dir, lazy=True))
+
+    @classmethod
+    def from_agent(cls, agent: dict) -> "CompiledAgent":
+        """Compile a loaded agent (see parser.load_agent)."""
+        graph = agent["graph"]
+        if graph is None or not graph.start_node:
+            raise ValueError(f"{agent['path']}: no graph with a START node")
+        config = agent.get("config") or {}
+        checks = {}
+        edges = {}
+        for edge in graph.edges:
+            if edge.condition and edge.condition not in checks:
+                checks[edge.condition] = compile_condition(edge.condition)
+            edges.setdefault(edge.source, []).append(CompiledEdge(
+                source=edge.source,
+                target=edge.target,
+                condition=edge.condition,
+                check=checks.get(edge.condition),
+                pass_fields=parse_fields(edge.pass_fields),
+                max_iterations=edge.max_iterations,
+                on_error=edge.on_error,
+                fallback=edge.fallback,
+            ))
+
+        # Field names a node's guardrails may refer to: what its edges pass, and the agent schemas
+        schema_fields = {name for key in ("input_schema", "output_schema")
+                         for name in ((config.get(key) or {}).get("properties") or {})}
+        fields = {}
+        for edge_list in edges.values():
+            for edge in edge_list:
+                for node_id in (edge.source, edge.target):
+                    fields.setdefault(node_id, set(schema_fields)).update(
+                        f for f in edge.pass_fields if f != "*")
+
+        nodes = {}
+        for node_id, meta in graph.nodes.items():
+            node_data = agent["nodes"].get(node_id.replace("_", "-"), agent["nodes"].get(node_id, {}))
+            tools = node_data.get("tools") or []
+            nodes[node_id] = CompiledNode(
+                id=node_id,
+                node_type=meta.node_type,
+                model=meta.model,
+                timeout=parse_duration(meta.timeout),
+                retry=meta.retry or 1,
+                threshold=meta.threshold,
+                max_iterations=meta.max_iterations,
+                strategy=meta.strategy,
+                tools=tuple(t["name"] for t in (tools if isinstance(tools, list) else [tools])
+                            if isinstance(t, dict) and t.get("name")),
+                servers=parse_fields(meta.tools),
+                instructions=node_data.get("instructions", ""),
+                edges=tuple(edges.get(node_id, ())),
+                classifier=node_data.get("classifier"),
+                guardrails=tuple(load_rules(node_data.get("guardrails"), fields.get(node_id, schema_fields))),
+            )
+        tool_defs = {}
+        for _, tool in iter_tool_defs(agent["nodes"]):
+            tool_defs.setdefault(tool["name"], tool)
+        return cls(
+            name=config.get("name") or graph.start_node,
+            path=agent["path"],
+            start=graph.start_node,
+            nodes=MappingProxyType(nodes),
+            config=MappingProxyType(config),
+            tools=MappingProxyType(tool_defs),
+            validators=AgentValidators.from_agent(agent),
+        )
+
+
+# ---------------------------------------------------------------------------
+# Sessions
+# ---------------------------------------------------------------------------
+
+class Session:
+    """Per-conversation state; everything else is shared through the host."""
+    __slots__ = ("id", "node", "status", "context", "iterations", "cursor", "output", "error",
+                 "elapsed", "snapshots")
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.node = None
+        self.status = "initialized"      # running | waiting | done | error
+        self.context = Context()
+        self.iterations = {}             # node id (or edge key) -> count
+        self.cursor = 0                  # trace events emitted
+        self.output = None
+        self.error = None
+        self.elapsed = 0.0               # active seconds, for execution.max_total_time
+        self.snapshots = None            # node id -> context at its last entry (traced only)
+
+    def __repr__(self):
+        return f"Session({self.id!r}, node={self.node!r}, status={self.status!r})"
+
+
+class _BranchSession(Session):
+    """One branch of a fork: its own context snapshot and counters; the
+    trace cursor stays the parent's."""
+    __slots__ = ("parent",)
+
+    def __init__(self, parent: Session):
+        self.parent = parent
+        self.id = parent.id
+        self.node = parent.node
+        self.status = parent.status
+        self.context = parent.context
+        self.iterations = dict(parent.iterations)
+        self.output = None
+        self.error = None
+        self.elapsed = parent.elapsed
+        self.snapshots = None if parent.snapshots is None else dict(parent.snapshots)
+
+    @property
+    def cursor(self):
+        return self.parent.cursor
+
+    @cursor.setter
+    def cursor(self, value):
+        self.parent.cursor = value
+
+
+class RoutingError(RuntimeError):
+    """No outgoing edge of a node can be taken."""
+
+
+class GuardrailError(RuntimeError):
+    """A guardrail stopped a step; `report` is its GuardrailReport."""
+
+    def __init__(self, node_id: str, report):
+        self.report = report
+        names = ", ".join(r.name for r in report.failures)
+        super().__init__(f"'{node_id}' failed {report.stage} guardrails ({report.action}): {names}")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A node's @timeout (on every attempt) or the run's max_total_time expired."""
+
+
+async def echo_handler(session: Session, node: CompiledNode, inputs: dict) -> dict:
+    """Default handler: passes inputs through unchanged."""
+    return dict(inputs)
+
+
+class ExecutionHost:
+    """Runs sessions of one CompiledAgent concurrently on the current event loop.
+
+    `store` (a CheckpointStore) receives a checkpoint at every transition and
+    lets sessions be restored after a restart; `tracer(session_id, event)`
+    receives runtime-format trace events (enter / complete / route / retry /
+    fast_path).
+    `hedge_after` maps node IDs to seconds (e.g. from hedge_delays()).
+    `prefetcher` is notified when router nodes start and choose a branch.
+    `spans` (a SpanRecorder) receives spans of sampled sessions.
+    `references` (a ReferenceIndex) supplies reference excerpts per step.
+    With `fast_path`, router nodes with a trained classifier are decided
+    locally when it is confident (needs numpy).
+    `guardrail_check(rules, payload)` answers guardrail rules that need a
+    model with {rule name: bool}; it may be a coroutine function, and a
+    plain function runs in a worker thread (see GuardrailEngine.arun).
+    `call_tool(name, args)` is the coroutine that performs real tool calls
+    for dispatch_tool(); calls to tools with a `cache` policy go through
+    `tool_cache` (the prefetcher's cache, else one built from tools.yaml).
+    """
+
+    def __init__(self, agent: CompiledAgent, handler=None, store=None, tracer=None,
+                 max_steps: int = 1000, hedge: bool = False, hedge_after: dict = None,
+                 rng: random.Random = None, prefetcher=None, spans=None, references=None,
+                 fast_path: bool = True, guardrail_check: Callable = None, call_tool: Callable = None,
+                 tool_cache: ToolCache = None):
+        self.agent = agent
+        self.handler = handler or echo_handler
+        self.store = store
+        self.tracer = tracer
+        self.max_steps = max_steps
+        self.max_total_time = parse_duration((agent.config.get("execution") or {}).get("max_total_time"))
+        self.hedge = hedge
+        self.hedge_after = dict(hedge_after or {})
+        self.prefetcher = prefetcher
+        self.spans = spans
+        self.references = references
+        self.call_tool = call_tool
+        if tool_cache is None:
+            tool_cache = prefetcher.cache if prefetcher is not None else ToolCache.from_tools(agent.tools.values())
+        self.tool_cache = tool_cache
+        self.routers = self._fast_path_routers() if fast_path else {}
+        self.guardrails = {node.id: GuardrailEngine(list(node.guardrails), guardrail_check)
+                           for node in agent.nodes.values() if node.guardrails}
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._rng = rng or random.Random()
+        self._latency = {}               # node id -> deque of recent attempt seconds
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _fast_path_routers(self) -> dict:
+        """node id -> FastPathRouter for router nodes with a trained classifier."""
+        if router_classifier.np is None:
+            return {}
+        return {node.id: FastPathRouter(node, node.edges, RouterClassifier.load(node.classifier))
+                for node in self.agent.nodes.values() if node.node_type == "router" and node.classifier}
+
+    # -- session lifecycle --------------------------------------------------
+
+    def open(self, session_id: str = None) -> Session:
+        session_id = session_id or f"session-{next(self._ids):06d}"
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id)
+        return session
+
+    def restore(self, session_id: str) -> Optional[Session]:
+        """Rebuild a session from the checkpoint store."""
+        session = self.sessions.get(session_id)
+        if session is not None or self.store is None:
+            return session
+        state = self.store.load(session_id)
+        if state is None:
+            return None
+        session = self.open(session_id)
+        session.node = state.current_node
+        session.status = state.status
+        session.context = Context(state.context)
+        session.iterations = state.iterations
+        session.cursor = state.trace_cursor
+        return session
+
+    def close(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+    async def start(self, inputs: dict = None, session_id: str = None) -> Session:
+        """Open a session and run it from START until it finishes or waits."""
+        session = self.open(session_id)
+        session.context = session.context.updated(inputs or {})
+        await self._run(session, self.agent.start, dict(inputs or {}))
+        return session
+
+    async def resume(self, session_id: str, inputs: dict = None) -> Session:
+        """Continue a session waiting at a human_input node with the human's reply."""
+        session = self.restore(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        if session.status != "waiting":
+            raise RuntimeError(f"Session {session_id} is {session.status}, not waiting")
+        node = self.agent.nodes[session.node]
+        output = dict(inputs or {})
+        self._emit(session, {"action": "complete", "node": node.id, "output_data": output})
+        session.context = session.context.updated(output)
+        session.status = "running"
+        try:
+            edge = self._route(session, node, output)
+        except RoutingError as e:
+            self._fail(session, e)
+            return session
+        await self._run(session, edge.target, self._project(session, edge, output), via=edge)
+        return session
+
+    # -- execution ----------------------------------------------------------
+
+    async def _run(self, session: Session, node_id: str, inputs: dict, via: CompiledEdge = None):
+        session.status = "running"
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        token = _current_host.set(self)
+        budget = None if self.max_total_time is None else self.max_total_time - session.elapsed
+        trace = nullcontext() if self.spans is None else self.spans.trace(
+            session.id, f"run {self.agent.name}", {"agent.name": self.agent.name, "agent.session.id": session.id,
+                                                   "agent.start_node": node_id})
+        try:
+            try:
+                with trace:
+                    async with asyncio.timeout(budget):
+                        await self._walk(session, node_id, inputs, via)
+            except TimeoutError as e:
+                if isinstance(e, DeadlineExceeded) or budget is None:
+                    raise
+                raise DeadlineExceeded(
+                    f"Run exceeded execution.max_total_time ({self.max_total_time:g}s)") from None
+        except Exception as e:
+            self._fail(session, e)
+        finally:
+            _current_host.reset(token)
+            session.elapsed += loop.time() - started
+
+    async def _walk(self, session: Session, node_id: str, inputs: dict, via: CompiledEdge = None,
+                    until_join: bool = False) -> Optional[tuple]:
+        """Execute from `node_id`. Branches of a fork run with until_join and
+        return (aggregator id, inputs) when they reach one."""
+        nodes = self.agent.nodes
+        merge = None
+        for _ in range(self.max_steps):
+            node = nodes[node_id]
+            if via is not None:
+                self._emit(session, {"action": "route", "from": via.source, "to": node_id,
+                                     "condition": via.condition, "data_passed": inputs})
+                if via.max_iterations:
+                    session.iterations[via.key] = session.iterations.get(via.key, 0) + 1
+            if until_join and node.node_type == "aggregator":
+                return node_id, inputs
+
+            count = session.iterations.get(node_id, 0) + 1
+            if node.max_iterations and count > node.max_iterations:
+                self._emit(session, {"action": "iteration_limit", "node": node_id,
+                                     "count": count - 1, "max": node.max_iterations})
+                raise RoutingError(f"'{node_id}' hit max iterations ({node.max_iterations})")
+            session.iterations[node_id] = count
+            session.node = node_id
+            event = {"action": "enter", "node": node_id, "iteration": count, "input_data": inputs}
+            if self.tracer is not None:
+                self._snapshot(session, node_id, event)
+            if merge is not None:
+                event["merge"], merge = merge, None
+            self._emit(session, event)
+
+            if node.node_type == "terminal" and node_id != self.agent.start:
+                session.status = "done"
+                session.output = inputs
+                self._checkpoint(session, node_id, inputs, flush=True)
+                return None
+            if node.node_type == "human_input":
+                session.status = "waiting"
+                self._checkpoint(session, node_id, inputs, flush=True)
+                return None
+
+            speculation = None
+            if node.node_type == "terminal" or node.node_type == "fork":
+                output = dict(inputs)
+            else:
+                if self.prefetcher is not None and node.node_type == "router":
+                    speculation = self.prefetcher.start(session, node, inputs)
+                try:
+                    if self.spans is None:
+                        output = await self._step(session, node, inputs)
+                    else:
+                        with span(f"node {node_id}", {"agent.node.id": node_id, "agent.node.type": node.node_type,
+                                                      "agent.node.iteration": count,
+                                                      "gen_ai.request.model": self.agent.model_for(node)}):
+                            output = await self._step(session, node, inputs)
+                except Exception as e:
+                    if speculation:
+                        self.prefetcher.settle(speculation, None)
+                    edge = next((e for e in node.edges if e.on_error), None)
+                    if edge is None:
+                        raise
+                    self._emit(session, {"action": "error", "node": node_id, "error": str(e)})
+                    node_id, inputs, via = edge.target, {"error": str(e)}, edge
+                    continue
+            route = output.pop("_route", None)
+            self._emit(session, {"action": "complete", "node": node_id, "output_data": output})
+            session.context = session.context.updated(output)
+            self._checkpoint(session, node_id, output)
+
+            if node.node_type == "fork":
+                joined = await self._fork(session, node, output)
+                if joined is None:
+                    return None
+                node_id, inputs, merge = joined
+                via = None
+                continue
+
+            edge = self._route(session, node, output, route)
+            if speculation:
+                self.prefetcher.settle(speculation, edge.target)
+            node_id, inputs, via = edge.target, self._project(session, edge, output), edge
+        raise RoutingError(f"Exceeded {self.max_steps} steps")
+
+    async def _fork(self, session: Session, node: CompiledNode, output: dict) -> Optional[tuple]:
+        """Run the branches of a fork, each on its own snapshot of the context,
+        and merge them by the aggregator's @strategy. Returns (aggregator id,
+        inputs, merge summary), or None when no branch reached an aggregator.
+        A branch that raises cancels the others and fails the fork."""
+        base = session.context
+        branches = [_BranchSession(session) for _ in node.edges]
+        arrived = []
+
+        async def run(branch, edge):
+            joined = await self._walk(branch, edge.target, self._project(session, edge, output), edge,
+                                      until_join=True)
+            arrived.append(branch)
+            return joined
+
+        tasks = [asyncio.create_task(run(b, e)) for b, e in zip(branches, node.edges)]
+        try:
+            joined = await asyncio.gather(*tasks)
+        except BaseException:
+            # A failed (or cancelled) fork stops the branches still running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        for branch in branches:
+            for key, count in branch.iterations.items():
+                if count > session.iterations.get(key, 0):
+                    session.iterations[key] = count
+        joins = [(branch, j) for branch, j in zip(branches, joined) if j is not None]
+        if not joins:
+            # Every branch finished or is waiting: keep the state of the last one
+            last = arrived[-1]
+            session.node, session.status, session.output = last.node, last.status, last.output
+            session.context = merge_branches(base, [b.context for b in branches])[0]
+            return None
+
+        aggregator = self.agent.nodes[joins[0][1][0]]
+        strategy = aggregator.strategy or "merge"
+        if strategy == "first":
+            joins.sort(key=lambda j: arrived.index(j[0]))
+            inputs = dict(joins[0][1][1])
+        else:
+            inputs = {}
+            for _, (_, branch_inputs) in joins:
+                inputs.update(branch_inputs)
+        session.context, conflicts = merge_branches(base, [b.context for b, _ in joins], strategy)
+        changes = base.diff(session.context)
+        self._checkpoint(session, aggregator.id, changes.updates, removed=changes.removed)
+        return aggregator.id, inputs, {"strategy": strategy, "branches": len(joins),
+                                       "conflicts": conflicts, "context_diff": changes.to_dict()}
+
+    def _snapshot(self, session: Session, node_id: str, event: dict) -> None:
+        """Keep the context at each node entry; on re-entry (a loop pass)
+        add what changed since the previous one to the enter event."""
+        if session.snapshots is None:
+            session.snapshots = {}
+        previous = session.snapshots.get(node_id)
+        if previous is not None:
+            event["context_diff"] = previous.diff(session.context).to_dict()
+        session.snapshots[node_id] = session.context
+
+    async def _step(self, session: Session, node: CompiledNode, inputs: dict) -> dict:
+        """A node's work: the fast-path decision of a router when confident
+        (traced as a `fast_path` event with its route and confidence), else _call() between the node's input and output guardrails, with
+        the step's reference excerpts added to its inputs under REFERENCES_KEY."""
+        router = self.routers.get(node.id)
+        if router is not None:
+            edge, confidence = router.route(inputs)
+            annotate({"agent.fast_path": edge is not None, "agent.fast_path.confidence": round(confidence, 4)})
+            if edge is not None:
+                self._emit(session, {"action": "fast_path", "node": node.id, "route": edge.target,
+                                     "confidence": round(confidence, 4)})
+                return {**inputs, "_route": edge.target}
+        engine = self.guardrails.get(node.id)
+        if engine is not None:
+            await self._guard(session, node, engine, "input", {**session.context.to_dict(), **inputs})
+        if self.references is not None:
+            excerpts = self.references.inject(node.id, inputs)
+            if excerpts:
+                inputs = {**inputs, REFERENCES_KEY: excerpts}
+        output = dict(await self._call(session, node, inputs) or {})
+        output.pop(REFERENCES_KEY, None)
+        if engine is None:
+            return output
+        payload = {**session.context.to_dict(), **inputs, **output}
+        report = await self._guard(session, node, engine, "output", payload, revise=True)
+        if report.action == "revise":
+            checks = {rule.name: rule.check for rule in engine.stage_rules("output")}
+            feedback = [checks[r.name] for r in report.failures]
+            output = dict(await self._call(session, node, {**inputs, FEEDBACK_KEY: feedback}) or {})
+            output.pop(REFERENCES_KEY, None)
+            output.pop(FEEDBACK_KEY, None)
+            await self._guard(session, node, engine, "output", {**payload, **output})
+        return output
+
+    async def _guard(self, session: Session, node: CompiledNode, engine: GuardrailEngine, stage: str,
+                     payload: dict, revise: bool = False):
+        """Run one guardrail stage; raises GuardrailError unless the outcome
+        is a pass, a warning, or (with `revise`) a revision request."""
+        report = await engine.arun(stage, payload)
+        if report.passed:
+            return report
+        self._emit(session, {"action": "guardrail", "node": node.id, "stage": stage, "outcome": report.action,
+                             "failed": [r.name for r in report.failures],
+                             "pending": [r.name for r in report.pending]})
+        if report.action in (None, "warn") or (revise and report.action == "revise"):
+            return report
+        raise GuardrailError(node.id, report)
+
+    async def _call(self, session: Session, node: CompiledNode, inputs: dict) -> dict:
+        """Run the handler with the node's @timeout per attempt and up to
+        @retry attempts, backing off with full jitter in between."""
+        loop = asyncio.get_running_loop()
+        attempts = max(node.retry or 1, 1)
+        for attempt in range(1, attempts + 1):
+            started = loop.time()
+            try:
+                async with asyncio.timeout(node.timeout):
+                    output = await self._attempt(session, node, inputs)
+            except Exception as e:
+                if isinstance(e, TimeoutError) and node.timeout is not None:
+                    e = DeadlineExceeded(f"'{node.id}' timed out after {node.timeout:g}s")
+                # A rejected tool call fails the same way on every attempt
+                if attempt == attempts or isinstance(e, ValidationError):
+                    annotate({"agent.retries": attempt - 1})
+                    raise e
+                delay = self._rng.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)))
+                self._emit(session, {"action": "retry", "node": node.id, "attempt": attempt,
+                                     "error": str(e), "backoff_ms": round(delay * 1000)})
+                await asyncio.sleep(delay)
+                continue
+            self._observe(node.id, loop.time() - started)
+            if attempt > 1:
+                annotate({"agent.retries": attempt - 1})
+            return output
+
+    async def _attempt(self, session: Session, node: CompiledNode, inputs: dict):
+        """One attempt; with hedging, a duplicate is sent once the attempt
+        outlives the node's p95 and the first successful result wins."""
+        delay = self.hedge_delay(node.id) if self.hedge else None
+        if delay is None:
+            return await self.handler(session, node, inputs)
+        primary = asyncio.ensure_future(self.handler(session, node, inputs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            self.hedges += 1
+            annotate({"agent.hedged": True})
+            pending.add(asyncio.ensure_future(self.handler(session, node, inputs)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            annotate({"agent.hedge_won": True})
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def dispatch(self, name: str, args: dict):
+        """A tool call: arguments checked against the tool's parameters
+        (defaults applied), then joined with a prefetch, answered from the
+        tool cache or sent to `call_tool`."""
+        if self.prefetcher is not None:
+            return await self.prefetcher.call(name, args)
+        args = self.agent.validators.check_tool_args(name, args)
+        if self.call_tool is None:
+            raise RuntimeError(f"No tool backend for '{name}'")
+        if not self.tool_cache.is_cacheable(name):
+            return await self.call_tool(name, args)
+        hit, value = self.tool_cache.get(name, args)
+        annotate({"agent.cache.hit": hit})
+        if not hit:
+            value = await self.call_tool(name, args)
+            self.tool_cache.put(name, args, value)
+        return value
+
+    def hedge_delay(self, node_id: str) -> Optional[float]:
+        """Seconds after which a request to the node is hedged: the p95 of
+        recent attempts, else the recorded p95 from `hedge_after`."""
+        history = self._latency.get(node_id)
+        if history is not None and len(history) >= HEDGE_MIN_SAMPLES:
+            ordered = sorted(history)
+            return ordered[int(0.95 * (len(ordered) - 1))]
+        return self.hedge_after.get(node_id)
+
+    def _observe(self, node_id: str, seconds: float) -> None:
+        history = self._latency.get(node_id)
+        if history is None:
+            history = self._latency[node_id] = deque(maxlen=HEDGE_WINDOW)
+        history.append(seconds)
+
+    def _route(self, session: Session, node: CompiledNode, output: dict, route: str = None) -> CompiledEdge:
+        """_choose() inside a routing span."""
+        if self.spans is None:
+            return self._choose(session, node, output, route)
+        with span(f"route {node.id}") as route_span:
+            edge = self._choose(session, node, output, route)
+            if route_span is not None:
+                route_span.name = f"route {node.id} -> {edge.target}"
+                route_span.attributes.update({"agent.edge.source": node.id, "agent.edge.target": edge.target,
+                                              "agent.edge.condition": edge.condition,
+                                              "agent.edge.explicit": route == edge.target})
+        return edge
+
+    def _choose(self, session: Session, node: CompiledNode, output: dict, route: str = None) -> CompiledEdge:
+        edges = [e for e in node.edges
+                 if not e.on_error and not (e.max_iterations and session.iterations.get(e.key, 0) >= e.max_iterations)]
+        if route is not None:
+            for edge in edges:
+                if edge.target == route:
+                    return edge
+        scope = {**session.context.to_dict(), **output, "iterations": session.iterations.get(node.id, 0),
+                 "max": node.max_iterations, "threshold": node.threshold}
+        for edge in edges:
+            if edge.check is not None and not edge.fallback and edge.check(scope):
+                return edge
+        for edge in edges:
+            if edge.condition is None and not edge.fallback:
+                return edge
+        for edge in edges:
+            if edge.fallback:
+                return edge
+        delegated = [e.condition for e in edges if e.delegated]
+        if delegated:
+            raise RoutingError(f"No route from '{node.id}': @cond {delegated[0]!r} needs the model's "
+                               f"routing decision (_route)")
+        raise RoutingError(f"No route from '{node.id}'")
+
+    def _project(self, session: Session, edge: CompiledEdge, output: dict) -> dict:
+        """Inputs for the edge's target: its @pass fields, else the source output."""
+        if not edge.pass_fields:
+            return dict(output)
+        if "*" in edge.pass_fields:
+            return session.context.to_dict()
+        return session.context.pick(edge.pass_fields)
+
+    def _fail(self, session: Session, error: Exception):
+        session.status = "error"
+        session.error = str(error)
+        self._checkpoint(session, session.node, None, flush=True)
+
+    def _emit(self, session: Session, event: dict):
+        session.cursor += 1
+        if self.tracer is not None:
+            event["ts"] = datetime.now(timezone.utc).isoformat()
+            self.tracer(session.id, event)
+
+    def _checkpoint(self, session: Session, node_id: str, changed: Optional[dict], flush: bool = False,
+                    removed: list = ()):
+        if self.store is None:
+            return
+        self.store.transition(
+            session.id, node=node_id, status=session.status, agent=self.agent.name,
+            context=session.context.pick(changed or ()),
+            removed=removed, iterations=session.iterations, trace_cursor=session.cursor)
+        if flush:
+            self.store.flush()
+
+    def stats(self) -> dict:
+        by_status = {}
+        for session in self.sessions.values():
+            by_status[session.status] = by_status.get(session.status, 0) + 1
+        stats = {"sessions": len(self.sessions), "by_status": by_status,
+                 "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+        if self.routers:
+            stats["fast_path"] = {node_id: {"decided": r.decided, "deferred": r.deferred}
+                                  for node_id, r in self.routers.items()}
+        return stats
+
+
+async def dispatch_tool(name: str, args: dict = None):
+    """A tool call from a handler, through the host running the step (see
+    ExecutionHost.dispatch)."""
+    host = _current_host.get()
+    if host is None:
+        raise RuntimeError("dispatch_tool() called outside a host step")
+    return await host.dispatch(name, args or {})
+
+
+def hedge_delays(stats) -> dict:
+    """Per-node hedging thresholds (seconds) from a trace_stats.TraceStats."""
+    return {node_id: s["p95_ms"] / 1000.0 for node_id, s in stats.nodes.items() if s.get("p95_ms")}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+    import time
+    import tracemalloc
+
+    ap = argparse.ArgumentParser(description="Run many stub sessions and measure per-session memory")
+    ap.add_argument("agent_dir")
+    ap.add_argument("--sessions", type=int, default=10000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    agent = CompiledAgent.from_dir(args.agent_dir)
+    rng = random.Random(args.seed)
+
+    async def stub(session, node, inputs):
+        # Routers pick a random branch like a model would; validators score
+        # randomly so their @cond edges (including the iteration exit) decide
+        output = {f"{node.id}_output": f"{node.id} handled {len(inputs)} fields"}
+        branches = [e for e in node.edges if not e.on_error]
+        if node.node_type == "validator":
+            output["quality"] = rng.random()
+        elif len(branches) > 1:
+            output["_route"] = rng.choice(branches).target
+        return output
+
+    async def main():
+        host = ExecutionHost(agent, stub)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        await asyncio.gather(*(host.start({"message": f"request {i}"}) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        report = host.stats()
+        report.update({
+            "seconds": round(elapsed, 3),
+            "sessions_per_s": round(args.sessions / elapsed),
+            "session_memory_mb": round((after - before) / 1e6, 2),
+            "bytes_per_session": round((after - before) / args.sessions),
+        })
+        print(json.dumps(report, indent=2))
+
+    asyncio.run(main())
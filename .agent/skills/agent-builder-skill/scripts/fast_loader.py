@@ -0,0 +1,321 @@
+"""
+Fast Agent Loader
+
+Drop-in replacement for parser.load_agent() for large agent trees and slow
+(network) filesystems. The tree is listed once with os.scandir — one call per
+directory instead of an exists()/is_dir()/stat() probe per expected file —
+into an in-memory index, and every file is then read and parsed on a thread
+pool, so per-file latency overlaps instead of adding up. YAML goes through
+the C-accelerated loader when PyYAML was built with libyaml.
+
+The result has exactly the same structure as load_agent().
+
+Benchmark (compares both loaders and checks they agree):
+
+    python fast_loader.py <agent-dir> [--repeat 5]
+    python fast_loader.py --synthetic 2000 --at /mnt/nfs/tmp [--repeat 3]
+    python fast_loader.py --synthetic 2000 --latency-ms 1    # simulated slow FS
+"""
+
+import builtins
+import contextlib
+import io
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from parser import (
+    parse_mermaid, load_agent, load_yaml, LazySubAgent, LARGE_REFERENCE_BYTES, _YAML_LOADER,
+)
+
+
+DEFAULT_WORKERS = 16
+
+# Runtime output that lives in an agent's root directory but is never
+# loaded; node folders may use these names
+SKIP_DIRS = {".agent-sessions", "runs", "__pycache__", ".git", "node_modules", ".reference-index"}
+
+
+@dataclass
+class DirListing:
+    path: str
+    files: list = field(default_factory=list)     # names, in directory order
+    dirs: list = field(default_factory=list)
+
+    def has(self, name: str) -> bool:
+        return name in self.files
+
+    def join(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+
+@dataclass
+class AgentTree:
+    """In-memory index of an agent directory."""
+    root: DirListing
+    nodes: dict = field(default_factory=dict)        # node dir name -> DirListing
+    references: dict = field(default_factory=dict)   # node dir name -> DirListing
+
+    def has(self, name: str) -> bool:
+        return self.root.has(name)
+
+    def node_dir(self, node_id: str) -> Optional[DirListing]:
+        """Listing of a graph node's directory (`foo_bar` or `foo-bar`)."""
+        return self.nodes.get(node_id, self.nodes.get(node_id.replace("_", "-")))
+
+
+def _scan(path: str, skip: frozenset = frozenset()) -> DirListing:
+    listing = DirListing(path=path)
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.name not in skip:
+                        listing.dirs.append(entry.name)
+                elif entry.is_file():
+                    listing.files.append(entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return listing
+
+
+def _scan_node(path: str) -> tuple:
+    listing = _scan(path)
+    refs = _scan(listing.join("references")) if "references" in listing.dirs else None
+    return listing, refs
+
+
+def scan_agent_tree(agent_dir: str, pool: ThreadPoolExecutor = None) -> AgentTree:
+    """List an agent directory, its node folders and their references.
+    Node folders are listed concurrently when a pool is given."""
+    tree = AgentTree(root=_scan(str(agent_dir), SKIP_DIRS))
+    if "nodes" not in tree.root.dirs:
+        return tree
+    nodes = _scan(tree.root.join("nodes"))
+    paths = [nodes.join(name) for name in nodes.dirs]
+    scanned = pool.map(_scan_node, paths) if pool else map(_scan_node, paths)
+    for name, (listing, refs) in zip(nodes.dirs, scanned):
+        tree.nodes[name] = listing
+        if refs is not None:
+            tree.references[name] = refs
+    return tree
+
+
+def _read(path: str) -> str:
+    with open(path) as fh:
+        return fh.read()
+
+
+def _read_yaml(path: str):
+    return load_yaml(_read(path))
+
+
+def _read_mermaid(path: str):
+    return parse_mermaid(_read(path))
+
+
+def _read_reference(path: str) -> dict:
+    name = os.path.basename(path)
+    with open(path) as fh:
+        if os.fstat(fh.fileno()).st_size >= LARGE_REFERENCE_BYTES:
+            return {"name": name, "content": f"[Large file: {name}]"}
+        return {"name": name, "content": fh.read()}
+
+
+def _load_node(listing: DirListing, refs: Optional[DirListing], lazy: bool) -> dict:
+    """Read one node folder; mirrors the per-node part of load_agent()."""
+    node_data = {"path": listing.path}
+    if listing.has("index.md"):
+        node_data["instructions"] = _read(listing.join("index.md"))
+    if listing.has("tools.yaml"):
+        node_data["tools"] = _read_yaml(listing.join("tools.yaml"))
+    if listing.has("guardrails.yaml"):
+        node_data["guardrails"] = _read_yaml(listing.join("guardrails.yaml"))
+    if listing.has("classifier.npz"):
+        node_data["classifier"] = listing.join("classifier.npz")
+    if listing.has("agent-mermaid.md"):
+        # Eager sub-agents are filled in by the caller once the pool is free
+        node_data["sub_agent"] = LazySubAgent(listing.path, loader=load_agent_fast) if lazy else None
+    if refs is not None:
+        node_data["references"] = [_read_reference(refs.join(f)) for f in refs.files]
+    return node_data
+
+
+def load_agent_fast(agent_dir: str, lazy: bool = False, max_workers: int = DEFAULT_WORKERS,
+                    tree: AgentTree = None, pool: ThreadPoolExecutor = None) -> dict:
+    """Load an agent like parser.load_agent(), scanning once and reading in parallel.
+
+    Pass a `tree` from scan_agent_tree() to reuse an existing index, and a
+    `pool` to share worker threads across calls.
+    """
+    if pool is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as own_pool:
+            return load_agent_fast(agent_dir, lazy=lazy, tree=tree, pool=own_pool)
+
+    tree = tree or scan_agent_tree(agent_dir, pool)
+    root = tree.root
+    result = {"path": str(agent_dir), "graph": None, "config": None, "index": None, "nodes": {}}
+
+    # One task per file at the root and per node folder below it
+    pending = []
+    for key, name, reader in (("graph", "agent-mermaid.md", _read_mermaid),
+                              ("config", "agent-config.yaml", _read_yaml),
+                              ("index", "index.md", _read)):
+        if root.has(name):
+            pending.append((key, pool.submit(reader, root.join(name))))
+    nodes = {name: pool.submit(_load_node, listing, tree.references.get(name), lazy)
+             for name, listing in tree.nodes.items()}
+
+    for key, future in pending:
+        result[key] = future.result()
+    for name, future in nodes.items():
+        result["nodes"][name] = future.result()
+
+    # Nested agents are loaded from this thread so the shared pool cannot deadlock
+    if not lazy:
+        for node_data in result["nodes"].values():
+            if "sub_agent" in node_data:
+                node_data["sub_agent"] = load_agent_fast(node_data["path"], pool=pool)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def _comparable(agent: dict) -> dict:
+    """Agent dict with the graph and sub-agents reduced to plain data."""
+    nodes = {}
+    for name, node_data in agent["nodes"].items():
+        node_data = dict(node_data)
+        if "sub_agent" in node_data:
+            node_data["sub_agent"] = _comparable(dict(node_data["sub_agent"]))
+        nodes[name] = node_data
+    graph = agent["graph"].to_dict() if agent["graph"] else None
+    return {**agent, "graph": graph, "nodes": nodes}
+
+
+def make_synthetic_agent(dest: str, n_nodes: int, refs_per_node: int = 2) -> str:
+    """Write an agent with `n_nodes` node folders (a simple chain) to `dest`."""
+    os.makedirs(dest, exist_ok=True)
+    ids = [f"step_{i:05d}" for i in range(n_nodes)]
+    lines = ["```mermaid", "graph TD", "    START([Start]) --> " + ids[0] + "[Step 0]"]
+    for i in range(1, n_nodes):
+        lines.append(f"    {ids[i - 1]} -->|\"@pass: data\"| {ids[i]}[Step {i}]")
+    lines += [f"    {ids[-1]} --> END([Done])", "```", ""]
+    with open(os.path.join(dest, "agent-mermaid.md"), "w") as fh:
+        fh.write("\n".join(lines))
+    with open(os.path.join(dest, "agent-config.yaml"), "w") as fh:
+        fh.write("name: synthetic\nversion: '1.0'\nexecution:\n  max_total_iterations: 100\n")
+    with open(os.path.join(dest, "index.md"), "w") as fh:
+        fh.write("# Synthetic Agent\n\nBenchmark fixture.\n")
+
+    for i, node_id in enumerate(ids):
+        node_dir = os.path.join(dest, "nodes", node_id.replace("_", "-"))
+        os.makedirs(os.path.join(node_dir, "references"), exist_ok=True)
+        with open(os.path.join(node_dir, "index.md"), "w") as fh:
+            fh.write(f"# Step {i}\n\nTransform `data` and pass it on.\n")
+        with open(os.path.join(node_dir, "tools.yaml"), "w") as fh:
+            fh.write(f"- type: function\n  name: tool_{i}\n  description: Tool {i}\n"
+                     "  parameters:\n    query:\n      type: string\n      required: true\n"
+                     "    limit:\n      type: integer\n      default: 10\n")
+        with open(os.path.join(node_dir, "guardrails.yaml"), "w") as fh:
+            fh.write("output:\n  - check: \"data is not empty\"\n    action: fail\n")
+        for r in range(refs_per_node):
+            with open(os.path.join(node_dir, "references", f"ref-{r}.md"), "w") as fh:
+                fh.write(f"Reference {r} for step {i}.\n" * 20)
+    return dest
+
+
+@contextlib.contextmanager
+def filesystem_latency(seconds: float, counter: dict):
+    """Add `seconds` to every stat/listdir/scandir/open and count the calls,
+    to approximate a network filesystem on local disk."""
+    names = [(os, "stat"), (os, "lstat"), (os, "listdir"), (os, "scandir"),
+             (io, "open"), (builtins, "open")]
+    originals = [(module, name, getattr(module, name)) for module, name in names]
+    lock = threading.Lock()
+
+    def slow(fn):
+        def wrapper(*args, **kwargs):
+            with lock:
+                counter["calls"] = counter.get("calls", 0) + 1
+            if seconds:
+                time.sleep(seconds)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    for module, name, fn in originals:
+        setattr(module, name, slow(fn))
+    try:
+        yield counter
+    finally:
+        for module, name, fn in originals:
+            setattr(module, name, fn)
+
+
+def benchmark(agent_dir: str, repeat: int = 3, max_workers: int = DEFAULT_WORKERS,
+              latency_ms: float = 0.0) -> dict:
+    """Best-of-`repeat` wall time of load_agent vs load_agent_fast, with an
+    optional simulated per-call filesystem latency."""
+    timings = {"load_agent": [], "load_agent_fast": []}
+    calls = {}
+    results = {}
+    for _ in range(repeat):
+        for name, fn in (("load_agent", lambda: load_agent(agent_dir)),
+                         ("load_agent_fast", lambda: load_agent_fast(agent_dir, max_workers=max_workers))):
+            counter = {}
+            with filesystem_latency(latency_ms / 1000.0, counter):
+                start = time.perf_counter()
+                results[name] = fn()
+                timings[name].append(time.perf_counter() - start)
+            calls[name] = counter.get("calls", 0)
+
+    if _comparable(results["load_agent"]) != _comparable(results["load_agent_fast"]):
+        raise AssertionError("load_agent_fast returned a different agent than load_agent")
+
+    base, fast = min(timings["load_agent"]), min(timings["load_agent_fast"])
+    return {
+        "nodes": len(results["load_agent"]["nodes"]),
+        "load_agent_s": round(base, 4),
+        "load_agent_fast_s": round(fast, 4),
+        "speedup": round(base / fast, 2) if fast else None,
+        "load_agent_fs_calls": calls["load_agent"],
+        "load_agent_fast_fs_calls": calls["load_agent_fast"],
+        "simulated_latency_ms": latency_ms,
+        "yaml_loader": _YAML_LOADER.__name__,
+        "workers": max_workers,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import tempfile
+
+    ap = argparse.ArgumentParser(description="Benchmark load_agent vs load_agent_fast")
+    ap.add_argument("agent_dir", nargs="?", help="existing agent directory")
+    ap.add_argument("--synthetic", type=int, help="generate an agent with this many node folders")
+    ap.add_argument("--at", help="parent directory for the synthetic agent (e.g. a network mount)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    ap.add_argument("--latency-ms", type=float, default=0.0,
+                    help="simulated latency added to each filesystem call")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        parent = tempfile.mkdtemp(prefix="agent-bench-", dir=args.at)
+        try:
+            make_synthetic_agent(os.path.join(parent, "agent"), args.synthetic)
+            report = benchmark(os.path.join(parent, "agent"), args.repeat, args.workers, args.latency_ms)
+        finally:
+            shutil.rmtree(parent, ignore_errors=True)
+    elif args.agent_dir:
+        report = benchmark(args.agent_dir, args.repeat, args.workers, args.latency_ms)
+    else:
+        ap.error("give an agent directory or --synthetic N")
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,226 @@
+"""
+Sub-Agent Flattening
+
+A node whose folder holds its own agent-mermaid.md runs as a sub-agent:
+entering it switches to the sub-agent's SYSTEM_PROMPT.md and walks its
+START and terminal nodes on the way in and out. flatten_agent() inlines
+such sub-agents into the parent graph so that one prompt covers the whole
+run:
+
+- inlined nodes get namespaced IDs `<node>__<sub-node>` (nested sub-agents
+  are flattened first, so IDs nest: `search__web__fetch`)
+- the sub-agent's START is removed: every edge into the sub-agent node is
+  spliced with every edge out of START; its terminal nodes are removed the
+  same way, splicing the edges into them with the edges out of the
+  sub-agent node (a terminal with nowhere to go stays, namespaced)
+- a spliced edge ANDs both @cond expressions; the parent edge's @pass wins,
+  being the contract of the sub-agent node, else the inner edge's is kept
+- an @on_error edge of the sub-agent node becomes the error route of every
+  inlined node that has none
+- inlined nodes without @model take the sub-agent's defaults.model, else
+  the sub-agent node's @model
+- the sub-agent node's own folder (index.md, tools, guardrails, references)
+  moves onto the first inlined entry node, ahead of that node's own
+
+@timeout and @retry on the sub-agent node bound the sub-agent as a whole
+and have no per-node equivalent; they are dropped and listed in the report.
+
+    flat = flatten_agent(load_agent(agent_dir), report := FlattenReport())
+"""
+
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from parser import AgentGraph, EdgeMeta, NodeMeta
+
+
+SEPARATOR = "__"
+
+
+@dataclass
+class FlattenReport:
+    subagents: list = field(default_factory=list)     # namespaced IDs of inlined sub-agent nodes
+    removed_nodes: list = field(default_factory=list)  # sub-agent nodes, STARTs and exits removed
+    dropped: list = field(default_factory=list)        # metadata with no flattened equivalent
+    nodes_before: int = 0
+    nodes_after: int = 0
+    edges_before: int = 0
+    edges_after: int = 0
+
+    def to_dict(self):
+        return {
+            "subagents": self.subagents,
+            "removed_nodes": self.removed_nodes,
+            "dropped": self.dropped,
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "edges_before": self.edges_before,
+            "edges_after": self.edges_after,
+        }
+
+
+def node_data_for(nodes: dict, node_id: str) -> dict:
+    """A node's folder data (folders may use '-' for '_')."""
+    return nodes.get(node_id.replace("_", "-"), nodes.get(node_id, {}))
+
+
+def subagent_of(nodes: dict, node_id: str) -> Optional[dict]:
+    """The loaded sub-agent behind a node, if it has a graph to inline."""
+    sub = node_data_for(nodes, node_id).get("sub_agent")
+    if not sub:
+        return None
+    graph = sub.get("graph")
+    return sub if graph is not None and graph.start_node else None
+
+
+def _and(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if a and b:
+        return f"({a}) AND ({b})"
+    return a or b
+
+
+def splice(outer: EdgeMeta, inner: EdgeMeta, source: str, target: str) -> EdgeMeta:
+    """One edge source -> target standing for the path outer + inner."""
+    limits = [n for n in (outer.max_iterations, inner.max_iterations) if n]
+    return EdgeMeta(
+        source=source,
+        target=target,
+        condition=_and(outer.condition, inner.condition),
+        pass_fields=outer.pass_fields or inner.pass_fields,
+        transform=outer.transform or inner.transform,
+        fallback=outer.fallback or inner.fallback,
+        on_error=outer.on_error or inner.on_error,
+        max_iterations=min(limits) if limits else None,
+    )
+
+
+def flatten_agent(agent: dict, report: FlattenReport = None) -> dict:
+    """A copy of `agent` (see parser.load_agent) with every sub-agent inlined."""
+    graph = agent.get("graph")
+    if graph is None:
+        return agent
+    report = report if report is not None else FlattenReport()
+    if not report.nodes_before:
+        report.nodes_before, report.edges_before = len(graph.nodes), len(graph.edges)
+
+    nodes_data = dict(agent.get("nodes") or {})
+    default_model = ((agent.get("config") or {}).get("defaults") or {}).get("model")
+    new_nodes, edges = dict(graph.nodes), list(graph.edges)
+    terminals = list(graph.terminal_nodes)
+
+    for node_id, meta in graph.nodes.items():
+        sub = subagent_of(nodes_data, node_id)
+        if sub is None:
+            continue
+        nested = FlattenReport()
+        sub = flatten_agent(sub, nested)
+        for name in nested.subagents:
+            report.subagents.append(f"{node_id}{SEPARATOR}{name}")
+        report.subagents.append(node_id)
+        report.removed_nodes.append(node_id)
+        report.removed_nodes.extend(f"{node_id}{SEPARATOR}{n}" for n in nested.removed_nodes)
+        report.dropped.extend(f"{node_id}{SEPARATOR}{d}" for d in nested.dropped)
+        for key in ("timeout", "retry"):
+            value = getattr(meta, key)
+            if value and not (key == "retry" and value == 1):
+                report.dropped.append(f"{node_id}: @{key} {value}")
+
+        incoming = [e for e in edges if e.target == node_id]
+        outgoing = [e for e in edges if e.source == node_id]
+        exits = [e for e in outgoing if not e.on_error]
+        errors = [e for e in outgoing if e.on_error]
+        inlined = _inline(node_id, meta, sub, default_model, keep_exits=not exits)
+        for ns_id, inner_meta in inlined["nodes"].items():
+            if ns_id in new_nodes:
+                raise ValueError(f"Flattening '{node_id}': node ID '{ns_id}' already exists")
+            new_nodes[ns_id] = inner_meta
+            nodes_data[ns_id] = inlined["data"].get(ns_id, {})
+        report.removed_nodes.extend(inlined["removed"])
+        hosts = [e.target for e in inlined["entry"] if e.target in inlined["nodes"]]
+        if hosts:
+            nodes_data[hosts[0]] = _carry(node_data_for(nodes_data, node_id), nodes_data[hosts[0]])
+        terminals.extend(inlined["terminals"])
+
+        rewired = [e for e in edges if e.source != node_id and e.target != node_id]
+        for outer in incoming:
+            for inner in inlined["entry"]:
+                if inner.target in inlined["removed"]:
+                    # START leads straight to an exit: the sub-agent is a pass-through
+                    through = splice(outer, inner, outer.source, node_id)
+                    rewired.extend(splice(through, after, outer.source, after.target) for after in exits)
+                else:
+                    rewired.append(splice(outer, inner, outer.source, inner.target))
+        for inner in inlined["exit"]:
+            rewired.extend(splice(outer, inner, inner.source, outer.target) for outer in exits)
+        rewired.extend(inlined["edges"])
+        for error in errors:
+            handled = {e.source for e in inlined["edges"] + inlined["exit"] if e.on_error}
+            for ns_id, inner_meta in inlined["nodes"].items():
+                if ns_id not in handled and inner_meta.node_type != "terminal":
+                    rewired.append(replace(error, source=ns_id))
+        edges = rewired
+        del new_nodes[node_id]
+        nodes_data.pop(node_id, None)
+        nodes_data.pop(node_id.replace("_", "-"), None)
+
+    flat = AgentGraph(nodes=new_nodes, edges=edges, start_node=graph.start_node, terminal_nodes=terminals)
+    report.nodes_after, report.edges_after = len(flat.nodes), len(flat.edges)
+    return {**agent, "graph": flat, "nodes": nodes_data}
+
+
+def _carry(outer: dict, inner: dict) -> dict:
+    """Node data of `inner` with the sub-agent node's own folder prepended."""
+    data = dict(inner)
+    if outer.get("instructions"):
+        data["instructions"] = "\n\n".join(filter(None, (outer["instructions"], inner.get("instructions"))))
+    for key in ("tools", "guardrails", "references"):
+        if isinstance(outer.get(key), list) and isinstance(inner.get(key, []), list):
+            data[key] = outer[key] + inner.get(key, [])
+        elif outer.get(key) and key not in inner:
+            data[key] = outer[key]
+    return data
+
+
+def _inline(node_id: str, meta: NodeMeta, sub: dict, default_model: Optional[str],
+            keep_exits: bool = False) -> dict:
+    """Namespaced nodes and edges of a (flattened) sub-agent.
+
+    `entry` are START's outgoing edges, `exit` the edges into its terminals,
+    `edges` everything internal; entry and exit edges still need splicing
+    with the parent's edges. With `keep_exits` the terminals stay (their
+    edges are internal) and are listed in `terminals`.
+    """
+    graph = sub["graph"]
+    sub_nodes = sub.get("nodes") or {}
+    sub_model = ((sub.get("config") or {}).get("defaults") or {}).get("model")
+    inherited = sub_model or meta.model
+    ns = lambda inner_id: f"{node_id}{SEPARATOR}{inner_id}"
+
+    start = graph.start_node
+    terminals = [ns(n) for n, m in graph.nodes.items() if m.node_type == "terminal" and n != start]
+    exits = set() if keep_exits else {n for n, m in graph.nodes.items()
+                                      if m.node_type == "terminal" and n != start}
+
+    nodes, data, removed = {}, {}, [ns(start)]
+    for inner_id, inner in graph.nodes.items():
+        if inner_id == start or inner_id in exits:
+            continue
+        model = inner.model
+        if model is None and inner.node_type not in ("terminal", "fork", "human_input") \
+                and inherited and inherited != default_model:
+            model = inherited
+        nodes[ns(inner_id)] = replace(inner, id=ns(inner_id), model=model,
+                                      display_name=f"{meta.display_name} › {inner.display_name}")
+        data[ns(inner_id)] = node_data_for(sub_nodes, inner_id)
+    removed.extend(ns(n) for n in sorted(exits))
+
+    entry, exit_, internal = [], [], []
+    for edge in graph.edges:
+        if edge.source == start:
+            entry.append(replace(edge, target=ns(edge.target)))
+        elif edge.target in exits:
+            exit_.append(replace(edge, source=ns(edge.source), target=ns(edge.target)))
+        else:
+            internal.append(replace(edge, source=ns(edge.source), target=ns(edge.target)))
+    return {"nodes": nodes, "data": data, "entry": entry, "exit": exit_, "edges": internal,
+            "removed": removed, "terminals": terminals if keep_exits else []}
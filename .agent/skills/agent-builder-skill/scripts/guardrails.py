@@ -0,0 +1,441 @@
+"""
+Guardrail Engine
+
+Executes the rules in a node's guardrails.yaml instead of only pasting them
+into the prompt. Both file layouts are accepted:
+
+    input_guardrails:                 input:
+      - name: response_not_empty        - "report field must be a non-empty string"
+        check: "response_text is not null and length > 0"
+        action: fail
+
+Each `check` is compiled into a local predicate when it matches one of the
+deterministic forms below; everything else is delegated to a model in a
+single batched call per run. Until the model answers, a delegated rule is
+pending and the report's `passed` is None rather than True.
+
+Fields are named as in the payload. Given the node's declared fields (edge
+@pass fields and schema properties), a name that is not declared resolves
+to the one declared field it prefixes, so `response` in a check means
+`response_text` when that is the node's only `response_*` field.
+
+The ExecutionHost runs the `input` stage before a node's handler and the
+`output` stage after it, and acts on the report's action: `warn` is only
+traced, `revise` re-runs the handler once with the failed checks as
+feedback (output stage only), and `escalate` or `fail` stop the step.
+
+    <field> is not null [and length > 0]      <field> must be a non-empty string
+    <field> is not empty                      <field> must be a string|number|boolean|array|object
+    length(<field>) <op> N                    <field> length <op> N
+    <field> <op> <number>                     <field> must be a number between A and B
+    <field> matches /regex/                   <field> does not match /regex/
+    <field> does not contain "a", "b"         <field> must be an array with at least N entries
+    <field> language matches <other>'s language
+    language of <field> is <code>
+"""
+
+import asyncio
+import inspect
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+# Severity order used to pick the overall action when several rules fail
+ACTIONS = ("warn", "revise", "escalate", "fail")
+
+PASS, FAIL, DELEGATED, SKIPPED = "pass", "fail", "delegated", "skipped"
+
+
+@dataclass
+class GuardrailRule:
+    name: str
+    check: str
+    action: str = "fail"
+    stage: str = "input"                           # input | output
+    predicate: Optional[Callable] = field(default=None, repr=False)
+
+    @property
+    def deterministic(self) -> bool:
+        return self.predicate is not None
+
+
+@dataclass
+class GuardrailResult:
+    name: str
+    status: str
+    action: str
+    detail: str = ""
+
+
+@dataclass
+class GuardrailReport:
+    stage: str
+    results: list = field(default_factory=list)
+
+    @property
+    def failures(self) -> list:
+        return [r for r in self.results if r.status == FAIL]
+
+    @property
+    def pending(self) -> list:
+        """Delegated rules still waiting for the model's verdict."""
+        return [r for r in self.results if r.status == DELEGATED]
+
+    @property
+    def passed(self) -> Optional[bool]:
+        """False if a rule failed, None while delegated rules are unanswered,
+        else True."""
+        if self.failures:
+            return False
+        return None if self.pending else True
+
+    @property
+    def action(self) -> Optional[str]:
+        """Most severe action among failed rules, or None if all passed."""
+        failed = [r.action for r in self.failures]
+        if not failed:
+            return None
+        return max(failed, key=lambda a: ACTIONS.index(a) if a in ACTIONS else len(ACTIONS))
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "passed": self.passed,
+            "action": self.action,
+            "results": [r.__dict__ for r in self.results],
+        }
+
+
+# ── Field helpers ──
+
+def _lookup(payload: dict, name: str):
+    """Resolve a field by dotted path."""
+    value = payload
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _resolver(fields) -> Callable:
+    """Map a field named in a check to a declared field (see module docstring)."""
+    fields = set(fields or ())
+
+    def resolve(name: str) -> str:
+        head, dot, rest = name.partition(".")
+        if not fields or head in fields:
+            return name
+        matches = [f for f in fields if f.startswith(head + "_")]
+        return matches[0] + dot + rest if len(matches) == 1 else name
+    return resolve
+
+
+def _length(value) -> int:
+    return len(value) if hasattr(value, "__len__") else 0
+
+
+_OPS = {
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+}
+
+_TYPES = {
+    "string": str,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "list": list,
+    "object": dict,
+}
+
+
+# ── Language detection ──
+
+_STOPWORDS = {
+    "en": "the and is are you your to of for we with this that have be it not on please thank",
+    "es": "el la los las de que y en es un una por para con su sus no gracias usted le se",
+    "fr": "le la les de des et est un une pour vous votre nous avec pas que qui merci dans",
+    "de": "der die das und ist nicht sie ihr wir mit für ein eine zu den danke bitte",
+    "it": "il lo la gli le di che e è un una per con non sono grazie suo sua",
+    "pt": "o a os as de que e é um uma para com não você seu sua obrigado",
+    "nl": "de het een en is niet u uw wij met voor van dat dank",
+}
+_STOPWORD_SETS = {lang: set(words.split()) for lang, words in _STOPWORDS.items()}
+_SCRIPTS = [
+    ("ja", re.compile(r"[぀-ヿ]")),
+    ("zh", re.compile(r"[一-鿿]")),
+    ("ko", re.compile(r"[가-힯]")),
+    ("ru", re.compile(r"[Ѐ-ӿ]")),
+    ("ar", re.compile(r"[؀-ۿ]")),
+]
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def detect_language(text: str) -> Optional[str]:
+    """ISO 639-1 code by script or stopword frequency; None when unsure."""
+    if not isinstance(text, str) or not text.strip():
+        return None
+    for lang, pattern in _SCRIPTS:
+        if pattern.search(text):
+            return lang
+    words = _WORD_RE.findall(text.lower())
+    scores = sorted(((sum(w in s for w in words), lang) for lang, s in _STOPWORD_SETS.items()),
+                    reverse=True)
+    best, runner_up = scores[0], scores[1]
+    if best[0] >= 2 and best[0] >= 1.5 * runner_up[0]:
+        return best[1]
+    return None
+
+
+def _normalize_language(value) -> Optional[str]:
+    names = {"english": "en", "spanish": "es", "french": "fr", "german": "de",
+             "italian": "it", "portuguese": "pt", "dutch": "nl", "japanese": "ja",
+             "chinese": "zh", "korean": "ko", "russian": "ru", "arabic": "ar"}
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return names.get(value, value[:2] if value else None)
+
+
+# ── Check compilation ──
+
+_F = r"([A-Za-z_][\w.]*)"
+
+_PATTERNS = []
+
+
+def _pattern(regex):
+    def register(builder):
+        _PATTERNS.append((re.compile(regex, re.IGNORECASE), builder))
+        return builder
+    return register
+
+
+@_pattern(rf"^{_F} is not null(?: and length > 0)?$")
+def _not_null(m, resolve):
+    name, needs_length = resolve(m.group(1)), "length" in m.group(0)
+    return lambda p: _lookup(p, name) is not None and (not needs_length or _length(_lookup(p, name)) > 0)
+
+
+@_pattern(rf"^{_F}(?: field)? (?:is not empty|must be non-empty|must be a non-empty string)$")
+def _non_empty(m, resolve):
+    name, is_string = resolve(m.group(1)), m.group(0).endswith("string")
+
+    def check(p):
+        value = _lookup(p, name)
+        if value is None or (is_string and not isinstance(value, str)):
+            return False
+        return _length(value) > 0 if hasattr(value, "__len__") else True
+    return check
+
+
+@_pattern(rf"^{_F}(?: field)? must be an? (string|number|boolean|array|list|object)$")
+def _is_type(m, resolve):
+    name, expected = resolve(m.group(1)), _TYPES[m.group(2).lower()]
+
+    def check(p):
+        value = _lookup(p, name)
+        if expected is not bool and isinstance(value, bool):
+            return False
+        return isinstance(value, expected)
+    return check
+
+
+@_pattern(rf"^(?:length\({_F}\)|{_F} length) (<=|>=|<|>|==|!=) (\d+)$")
+def _length_cmp(m, resolve):
+    name = resolve(m.group(1) or m.group(2))
+    op, bound = _OPS[m.group(3)], int(m.group(4))
+    return lambda p: _lookup(p, name) is not None and op(_length(_lookup(p, name)), bound)
+
+
+@_pattern(rf"^{_F}(?: score)? (<=|>=|<|>|==|!=) (-?\d+(?:\.\d+)?)$")
+def _number_cmp(m, resolve):
+    name, op, bound = resolve(m.group(1)), _OPS[m.group(2)], float(m.group(3))
+
+    def check(p):
+        value = _lookup(p, name)
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and op(value, bound)
+    return check
+
+
+@_pattern(rf"^{_F}(?: score)? must be (?:a number )?between (-?\d+(?:\.\d+)?) and (-?\d+(?:\.\d+)?)$")
+def _between(m, resolve):
+    name, low, high = resolve(m.group(1)), float(m.group(2)), float(m.group(3))
+
+    def check(p):
+        value = _lookup(p, name)
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high
+    return check
+
+
+@_pattern(rf"^{_F} (does not match|matches) /(.+)/(i?)$")
+def _regex(m, resolve):
+    name, negate = resolve(m.group(1)), m.group(2).lower().startswith("does")
+    pattern = re.compile(m.group(3), re.IGNORECASE if m.group(4) else 0)
+
+    def check(p):
+        value = _lookup(p, name)
+        found = isinstance(value, str) and pattern.search(value) is not None
+        return not found if negate else found
+    return check
+
+
+@_pattern(rf'^{_F} does not contain ((?:"[^"]+"(?:,\s*|\s+or\s+|,\s*or\s+)?)+)$')
+def _denylist(m, resolve):
+    name = resolve(m.group(1))
+    terms = [t.lower() for t in re.findall(r'"([^"]+)"', m.group(2))]
+
+    def check(p):
+        value = _lookup(p, name)
+        text = value.lower() if isinstance(value, str) else ""
+        return not any(t in text for t in terms)
+    return check
+
+
+@_pattern(rf"^{_F} must be an? (?:array|list) with at least (\d+) (?:entry|entries|items?)$")
+def _min_items(m, resolve):
+    name, bound = resolve(m.group(1)), int(m.group(2))
+    return lambda p: isinstance(_lookup(p, name), list) and len(_lookup(p, name)) >= bound
+
+
+@_pattern(rf"^{_F} language matches (?:the )?{_F}(?:'s)? language$")
+def _language_match(m, resolve):
+    name, other = resolve(m.group(1)), m.group(2)
+
+    def check(p):
+        expected = _normalize_language(_lookup(p, f"{other}_language") or _lookup(p, "language"))
+        detected = detect_language(_lookup(p, name))
+        if expected is None or detected is None:
+            return None      # inconclusive — delegate
+        return detected == expected
+    return check
+
+
+@_pattern(rf"^language of {_F} is ([A-Za-z]+|{_F})$")
+def _language_is(m, resolve):
+    name, target = resolve(m.group(1)), resolve(m.group(2))
+
+    def check(p):
+        expected = _normalize_language(_lookup(p, target) if _lookup(p, target) else target)
+        detected = detect_language(_lookup(p, name))
+        if detected is None:
+            return None
+        return detected == expected
+    return check
+
+
+def compile_check(check: str, fields=()) -> Optional[Callable]:
+    """Compile a check string into `predicate(payload) -> True | False | None`
+    (None = inconclusive), or return None if it needs a model. `fields` are
+    the node's declared field names."""
+    text = " ".join(str(check).split()).rstrip(".")
+    resolve = _resolver(fields)
+    for regex, builder in _PATTERNS:
+        match = regex.match(text)
+        if match:
+            return builder(match, resolve)
+    return None
+
+
+def load_rules(spec: dict, fields=()) -> list:
+    """Normalize a guardrails.yaml mapping into compiled GuardrailRules."""
+    rules = []
+    if not isinstance(spec, dict):
+        return rules
+    for stage in ("input", "output"):
+        entries = list(spec.get(f"{stage}_guardrails") or []) + list(spec.get(stage) or [])
+        for i, entry in enumerate(entries, 1):
+            if isinstance(entry, str):
+                entry = {"check": entry}
+            if not isinstance(entry, dict) or not entry.get("check"):
+                continue
+            rules.append(GuardrailRule(
+                name=entry.get("name") or f"{stage}_{i}",
+                check=entry["check"],
+                action=entry.get("action", "fail"),
+                stage=stage,
+                predicate=compile_check(entry["check"], fields),
+            ))
+    return rules
+
+
+class GuardrailEngine:
+    """Runs a node's guardrails locally, delegating only what it cannot decide.
+
+    `model_check(rules, payload)` is called at most once per run with every
+    rule that needs a model and must return {rule name: bool}. arun() awaits
+    it when it is a coroutine function and otherwise runs it in a worker
+    thread, so a model call never blocks the event loop.
+    """
+
+    def __init__(self, rules: list, model_check: Optional[Callable] = None):
+        self.rules = rules
+        self.model_check = model_check
+
+    @classmethod
+    def from_spec(cls, spec: dict, model_check: Optional[Callable] = None, fields=()) -> "GuardrailEngine":
+        return cls(load_rules(spec, fields), model_check)
+
+    def stage_rules(self, stage: str) -> list:
+        return [r for r in self.rules if r.stage == stage]
+
+    def run(self, stage: str, payload: dict) -> GuardrailReport:
+        """Run a stage synchronously; needs a plain (not async) model_check."""
+        report, delegated = self._local(stage, payload)
+        if delegated:
+            if inspect.iscoroutinefunction(self.model_check):
+                raise TypeError("model_check is a coroutine function; use arun()")
+            self._answer(report, delegated, self.model_check(delegated, payload))
+        return report
+
+    async def arun(self, stage: str, payload: dict) -> GuardrailReport:
+        """Run a stage, awaiting the model's verdicts on delegated rules."""
+        report, delegated = self._local(stage, payload)
+        if delegated:
+            if inspect.iscoroutinefunction(self.model_check):
+                verdicts = await self.model_check(delegated, payload)
+            else:
+                verdicts = await asyncio.to_thread(self.model_check, delegated, payload)
+            self._answer(report, delegated, verdicts)
+        return report
+
+    def _local(self, stage: str, payload: dict) -> tuple:
+        """Decide what the local predicates can. Returns the report and the
+        rules still to ask the model about (empty when no model is needed)."""
+        report = GuardrailReport(stage=stage)
+        delegated = []
+        for rule in self.stage_rules(stage):
+            outcome = None
+            if rule.predicate is not None:
+                try:
+                    outcome = rule.predicate(payload or {})
+                except Exception as e:
+                    report.results.append(GuardrailResult(rule.name, FAIL, rule.action, f"check raised: {e}"))
+                    continue
+            if outcome is None:
+                delegated.append(rule)
+                continue
+            report.results.append(GuardrailResult(rule.name, PASS if outcome else FAIL, rule.action))
+
+        # A hard local failure already decides the outcome; skip the model call
+        if delegated and any(r.action == "fail" for r in report.failures):
+            report.results.extend(GuardrailResult(r.name, SKIPPED, r.action) for r in delegated)
+            return report, []
+        if delegated and self.model_check is None:
+            report.results.extend(GuardrailResult(r.name, DELEGATED, r.action, r.check) for r in delegated)
+            return report, []
+        return report, delegated
+
+    @staticmethod
+    def _answer(report: GuardrailReport, delegated: list, verdicts: Optional[dict]) -> None:
+        verdicts = verdicts or {}
+        for rule in delegated:
+            verdict = verdicts.get(rule.name)
+            status = DELEGATED if verdict is None else PASS if verdict else FAIL
+            report.results.append(GuardrailResult(rule.name, status, rule.action, "model"))
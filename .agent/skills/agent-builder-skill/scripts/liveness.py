@@ -0,0 +1,208 @@
+"""
+Context Liveness Analysis
+
+Backward dataflow pass over the AgentGraph that computes which context keys
+are live — read by a node or by some node later on any path before being
+redefined. The runtime only needs to carry the keys live across an edge, so
+each edge gets a minimal projection of the context.
+
+Liveness is edge-sensitive, because a join node (e.g. a drafting node fed
+by several branches) only receives one branch's @pass fields at a time:
+
+    live(u → v) = pass(u → v) ∪ use(v) ∪ (live_out(v) − def(v))
+    live_out(v) = ∪ live(v → w) over v's outgoing edges
+    def(v)      = fields v emits on outgoing @pass that no incoming edge passes
+    use(v)      = keys read by v's guardrails; `output_schema` properties for
+                  terminals; every key if no incoming edge declares @pass
+
+@cond expressions are evaluated against the source node's own output, so
+they are not context reads. The START node defines the `input_schema`
+properties, and `@pass: *` stands for every known key.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+
+from parser import AgentGraph
+from guardrails import load_rules
+
+
+_IDENT_RE = re.compile(r"[A-Za-z_]\w*")
+
+
+def parse_fields(pass_fields) -> tuple:
+    """Split an @pass value into field names (`*` is kept as-is)."""
+    if not pass_fields:
+        return ()
+    return tuple(f.strip() for f in str(pass_fields).split(",") if f.strip())
+
+
+@dataclass
+class Liveness:
+    universe: set = field(default_factory=set)
+    uses: dict = field(default_factory=dict)          # node -> set
+    defs: dict = field(default_factory=dict)          # node -> set
+    live_in: dict = field(default_factory=dict)       # node -> union over incoming edges
+    live_out: dict = field(default_factory=dict)      # node -> set
+    edges: dict = field(default_factory=dict)         # (source, target) -> frozenset
+
+    def projection(self, source: str, target: str) -> tuple:
+        """Keys to carry along source → target, sorted."""
+        keys = self.edges.get((source, target))
+        if keys is None:
+            keys = self.live_in.get(target, ())
+        return tuple(sorted(keys))
+
+    def project(self, context: dict, target: str, source: str = None) -> dict:
+        """Slice a context down to the keys live on entry to `target`
+        (across the edge from `source` when given)."""
+        live = self.edges.get((source, target)) if source else None
+        if live is None:
+            live = self.live_in.get(target)
+        if live is None:
+            return dict(context)
+        return {k: v for k, v in context.items() if k in live}
+
+    def to_dict(self):
+        return {
+            "live_in": {n: sorted(v) for n, v in self.live_in.items()},
+            "live_out": {n: sorted(v) for n, v in self.live_out.items()},
+            "edges": [{"source": s, "target": t, "keys": sorted(keys)}
+                      for (s, t), keys in self.edges.items()],
+        }
+
+
+def analyze(graph: AgentGraph, config: dict = None, nodes: dict = None) -> Liveness:
+    """Compute live context keys for every edge and node of `graph`.
+
+    `config` (agent-config.yaml) seeds agent inputs and outputs; `nodes`
+    (load_agent()["nodes"]) adds keys referenced by guardrails.
+    """
+    config = config or {}
+    nodes = nodes or {}
+    result = Liveness()
+
+    inputs = set((config.get("input_schema") or {}).get("properties") or {})
+    outputs = set((config.get("output_schema") or {}).get("properties") or {})
+
+    edge_fields = {}
+    incoming = {nid: set() for nid in graph.nodes}
+    outgoing = {nid: set() for nid in graph.nodes}
+    out_edges = {nid: [] for nid in graph.nodes}
+    in_edges = {nid: [] for nid in graph.nodes}
+    for edge in graph.edges:
+        key = (edge.source, edge.target)
+        fields = set(parse_fields(edge.pass_fields))
+        edge_fields[key] = edge_fields.get(key, set()) | fields
+        incoming.setdefault(edge.target, set()).update(fields)
+        outgoing.setdefault(edge.source, set()).update(fields)
+        if edge.target not in out_edges.setdefault(edge.source, []):
+            out_edges[edge.source].append(edge.target)
+            in_edges.setdefault(edge.target, []).append(edge.source)
+        result.universe |= fields
+    result.universe |= inputs | outputs
+    result.universe.discard("*")
+
+    def expand(fields):
+        return set(result.universe) if "*" in fields else set(fields)
+
+    edge_fields = {k: expand(v) for k, v in edge_fields.items()}
+    for nid in out_edges:
+        node = graph.nodes.get(nid)
+        received = expand(incoming.get(nid, set()))
+        if nid == graph.start_node:
+            uses, defs = set(), inputs | expand(outgoing.get(nid, set()))
+        elif node is not None and node.node_type == "terminal":
+            uses, defs = set(outputs or result.universe), set()
+        elif received:
+            uses, defs = set(), expand(outgoing.get(nid, set())) - received
+        else:
+            # No @pass on any incoming edge: the node may read anything
+            uses, defs = set(result.universe), set()
+        result.uses[nid] = uses | _guardrail_fields(nodes, nid, result.universe)
+        result.defs[nid] = defs
+        result.live_out[nid] = set()
+
+    def through(nid):
+        return result.uses[nid] | (result.live_out[nid] - result.defs[nid])
+
+    # Iterate to a fixpoint: a node is revisited whenever a successor's
+    # live set grows
+    worklist = list(out_edges)
+    queued = set(worklist)
+    while worklist:
+        nid = worklist.pop()
+        queued.discard(nid)
+        live_out = set()
+        for succ in out_edges[nid]:
+            live_out |= edge_fields.get((nid, succ), set()) | through(succ)
+        if live_out != result.live_out[nid]:
+            result.live_out[nid] = live_out
+        before = result.live_in.get(nid)
+        after = through(nid)
+        if after != before:
+            result.live_in[nid] = after
+            for pred in in_edges.get(nid, ()):
+                if pred not in queued:
+                    queued.add(pred)
+                    worklist.append(pred)
+
+    for (source, target), fields in edge_fields.items():
+        result.edges[(source, target)] = frozenset(fields | through(target))
+    for nid in out_edges:
+        incoming_live = [result.edges[(p, nid)] for p in in_edges.get(nid, ())]
+        result.live_in[nid] = set().union(*incoming_live) if incoming_live else through(nid)
+    return result
+
+
+def _guardrail_fields(nodes: dict, node_id: str, universe: set) -> set:
+    """Known context keys read by a node's guardrails. Free-text checks only
+    contribute snake_case identifiers, so prose words are not taken as keys."""
+    node_data = nodes.get(node_id.replace("_", "-"), nodes.get(node_id, {}))
+    fields = set()
+    for rule in load_rules(node_data.get("guardrails")):
+        for token in _IDENT_RE.findall(rule.check):
+            if token in universe and (rule.deterministic or "_" in token):
+                fields.add(token)
+    return fields
+
+
+def bytes_saved(liveness: Liveness, files: list) -> dict:
+    """Replay trace files and measure context bytes with and without projection.
+
+    The context at each `enter` is everything the session has seen so far
+    (all input_data and output_data); the projection keeps only the keys live
+    across the edge just taken. Returns per-node totals.
+    """
+    report = {}
+    for path in files:
+        context, previous = {}, None
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                action = event.get("action")
+                if action == "enter":
+                    node_id = event.get("node")
+                    context.update(event.get("input_data") or {})
+                    full = len(json.dumps(context, default=str))
+                    projected = len(json.dumps(liveness.project(context, node_id, previous), default=str))
+                    previous = node_id
+                    entry = report.setdefault(node_id, {"visits": 0, "full_bytes": 0, "projected_bytes": 0})
+                    entry["visits"] += 1
+                    entry["full_bytes"] += full
+                    entry["projected_bytes"] += projected
+                elif action == "complete":
+                    context.update(event.get("output_data") or {})
+                elif action == "route":
+                    context.update(event.get("data_passed") or {})
+
+    for entry in report.values():
+        entry["saved_bytes"] = entry["full_bytes"] - entry["projected_bytes"]
+        entry["saved_per_visit"] = round(entry["saved_bytes"] / entry["visits"], 1)
+    return report
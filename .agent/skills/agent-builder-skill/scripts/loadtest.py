@@ -0,0 +1,481 @@
+"""
+Load-Testing Harness
+
+Drives an agent through the ExecutionHost with stubbed models and tools, so
+the whole stack can be exercised offline. Each node visit makes one call to
+its model (@model, else defaults.model) and one call per tools.yaml function
+(per @tools server when it declares none); calls sleep for a latency sampled from a log-normal fitted to the configured
+median and p95. Each model has a fixed number of concurrent slots, and the
+time spent waiting for a slot is reported as the node's queueing delay.
+With a dispatcher, model calls go through model_dispatcher.ModelDispatcher
+(limits from agent-config.yaml) and StubBackend serves them as batches.
+The host enforces @timeout, @retry and execution.max_total_time (scaled
+with the simulated time), and with `hedge` sends hedged requests. With
+`prefetch`, tool calls go through a prefetch.Prefetcher that starts them
+speculatively at router nodes; either way, tools with a `cache` policy are
+answered from the host's ToolCache when they can be. With `spans`, sampled sessions export
+node, routing, model and tool call spans (see spans.py).
+
+Stub latencies come from an optional YAML/JSON file:
+
+    models:
+      claude-haiku-4-5-20251001: {median: 300ms, p95: 900ms, concurrency: 16}
+      default: 1s                  # fixed latency
+    tools:
+      booking_db: {median: 40ms, p95: 150ms}
+      default: 50ms
+    human: 0s                      # reply delay at human_input nodes
+    batch_cost: 0.1                # extra latency per additional batch item
+
+Inputs are replayed from a JSONL file (one payload per line, or trace files
+whose START `enter` events carry the input) or synthesized from
+`input_schema`. Routers pick branches uniformly, or with the edge
+frequencies of recorded traces when given; validators score randomly so
+their @cond edges decide. Load is either closed-loop (`concurrency`
+sessions in flight) or open-loop (Poisson arrivals at `rate` per second).
+"""
+
+import asyncio
+import json
+import math
+import random
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from types import MappingProxyType
+from typing import Optional
+
+import yaml
+
+from parser import parse_duration
+from execution_host import CompiledAgent, ExecutionHost, dispatch_tool, hedge_delays
+from loop_analysis import MODEL_FREE_TYPES
+from model_dispatcher import ModelDispatcher
+from prefetch import Prefetcher
+from spans import KIND_CLIENT, SpanRecorder, annotate, exporter_for, span
+from trace_stats import find_trace_files, load_stats
+
+
+# (median, p95) by model family, used when no stub is configured
+DEFAULT_MODEL_LATENCY = {"haiku": (0.4, 1.0), "sonnet": (1.5, 4.0), "opus": (3.0, 8.0)}
+DEFAULT_TOOL_LATENCY = (0.05, 0.2)
+DEFAULT_MODEL_CONCURRENCY = 32
+DEFAULT_BATCH_COST = 0.1
+
+_WORDS = ("booking flight hotel change refund cancel trip visa baggage delay "
+          "upgrade seat invoice complaint question weekend tomorrow urgent please").split()
+
+
+def _tokens(data) -> int:
+    """Rough token count of a payload (~4 characters per token)."""
+    return max(1, len(json.dumps(data, default=str)) // 4)
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, math.ceil(q / 100.0 * len(values)) - 1))
+    return values[rank]
+
+
+def _summary(values: list, scale: float = 1.0) -> dict:
+    values = sorted(values)
+    mean = sum(values) / len(values) if values else 0.0
+    return {
+        "mean": round(mean * scale, 3),
+        "p50": round(percentile(values, 50) * scale, 3),
+        "p95": round(percentile(values, 95) * scale, 3),
+        "p99": round(percentile(values, 99) * scale, 3),
+    }
+
+
+@dataclass
+class LatencyModel:
+    median: float
+    p95: float
+
+    @classmethod
+    def parse(cls, spec, default: tuple) -> "LatencyModel":
+        """`300ms`, a number of seconds, or {median, p95}."""
+        if isinstance(spec, dict):
+            median = parse_duration(spec.get("median"))
+            median = default[0] if median is None else median
+            p95 = parse_duration(spec.get("p95"))
+            return cls(median, median if p95 is None else p95)
+        fixed = parse_duration(spec)
+        return cls(*default) if fixed is None else cls(fixed, fixed)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.p95 <= self.median or self.median <= 0:
+            return self.median
+        sigma = math.log(self.p95 / self.median) / 1.645
+        return self.median * math.exp(rng.gauss(0.0, sigma))
+
+
+@dataclass
+class StubConfig:
+    models: dict = field(default_factory=dict)        # name -> LatencyModel
+    tools: dict = field(default_factory=dict)
+    concurrency: dict = field(default_factory=dict)   # model -> slots
+    human: LatencyModel = field(default_factory=lambda: LatencyModel(0.0, 0.0))
+    batch_cost: float = DEFAULT_BATCH_COST
+
+    @classmethod
+    def load(cls, path: str = None) -> "StubConfig":
+        spec = yaml.safe_load(Path(path).read_text()) if path else {}
+        spec = spec or {}
+        stubs = cls()
+        for name, model in (spec.get("models") or {}).items():
+            stubs.models[name] = LatencyModel.parse(model, _model_default(name))
+            if isinstance(model, dict) and model.get("concurrency"):
+                stubs.concurrency[name] = int(model["concurrency"])
+        for name, tool in (spec.get("tools") or {}).items():
+            stubs.tools[name] = LatencyModel.parse(tool, DEFAULT_TOOL_LATENCY)
+        if "human" in spec:
+            stubs.human = LatencyModel.parse(spec["human"], (0.0, 0.0))
+        if spec.get("batch_cost") is not None:
+            stubs.batch_cost = float(spec["batch_cost"])
+        return stubs
+
+    def model_latency(self, model: str) -> LatencyModel:
+        stub = self.models.get(model) or self.models.get("default")
+        return stub or LatencyModel(*_model_default(model))
+
+    def tool_latency(self, tool: str) -> LatencyModel:
+        stub = self.tools.get(tool) or self.tools.get("default")
+        return stub or LatencyModel(*DEFAULT_TOOL_LATENCY)
+
+    def slots(self, model: str) -> int:
+        return self.concurrency.get(model) or self.concurrency.get("default") or DEFAULT_MODEL_CONCURRENCY
+
+
+def _model_default(model: str) -> tuple:
+    for family, latency in DEFAULT_MODEL_LATENCY.items():
+        if family in (model or ""):
+            return latency
+    return (1.0, 3.0)
+
+
+class StubBackend:
+    """Local stand-in for the model API and MCP tools (the stub model server).
+    Without `record_samples` only counters are kept, not per-call delays."""
+
+    def __init__(self, stubs: StubConfig, rng: random.Random, time_scale: float = 1.0,
+                 record_samples: bool = True):
+        self.stubs = stubs
+        self.rng = rng
+        self.time_scale = time_scale
+        self.record_samples = record_samples
+        self._slots = {}
+        self.calls = {}          # model -> count
+        self.batches = {}        # model -> batch calls
+        self.queue = {}          # model -> [seconds waited]
+        self._busy = {}
+        self.peak = {}           # model -> most calls in service at once
+
+    async def _serve(self, model: str, size: int) -> tuple:
+        """Wait for a slot, then serve `size` requests as one call.
+        Returns (queueing delay, service time), unscaled."""
+        slots = self._slots.get(model)
+        if slots is None:
+            slots = self._slots[model] = asyncio.Semaphore(self.stubs.slots(model))
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        async with slots:
+            waited = (loop.time() - queued_at) / self.time_scale
+            service = self.stubs.model_latency(model).sample(self.rng)
+            service *= 1.0 + self.stubs.batch_cost * (size - 1)
+            self._busy[model] = busy = self._busy.get(model, 0) + 1
+            self.peak[model] = max(self.peak.get(model, 0), busy)
+            try:
+                await asyncio.sleep(service * self.time_scale)
+            finally:
+                self._busy[model] -= 1
+        self.calls[model] = self.calls.get(model, 0) + size
+        self.batches[model] = self.batches.get(model, 0) + 1
+        if self.record_samples:
+            self.queue.setdefault(model, []).append(waited)
+        return waited, service
+
+    async def call_model(self, model: str) -> float:
+        """One unbatched call. Returns the queueing delay."""
+        waited, _ = await self._serve(model, 1)
+        return waited
+
+    async def complete(self, model: str, requests: list) -> list:
+        """Batch endpoint used by ModelDispatcher: one result per request."""
+        _, service = await self._serve(model, len(requests))
+        return [{"service_s": service, "batch": len(requests)} for _ in requests]
+
+    async def call_tool(self, tool: str, args: dict = None) -> dict:
+        await asyncio.sleep(self.stubs.tool_latency(tool).sample(self.rng) * self.time_scale)
+        return {"tool": tool, "args": args or {}}
+
+
+def synthesize(schema: dict, rng: random.Random, name: str = ""):
+    """A random value matching a (DSL subset) JSON schema."""
+    schema = schema or {}
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type", "string")
+    if isinstance(kind, list):
+        kind = rng.choice([k for k in kind if k != "null"] or ["null"])
+    if kind == "object":
+        required = set(schema.get("required") or ())
+        return {key: synthesize(sub, rng, key)
+                for key, sub in (schema.get("properties") or {}).items()
+                if key in required or rng.random() < 0.5}
+    if kind == "array":
+        return [synthesize(schema.get("items") or {}, rng, name) for _ in range(rng.randint(1, 3))]
+    if kind == "integer":
+        return rng.randint(int(schema.get("minimum", 0)), int(schema.get("maximum", 1000)))
+    if kind == "number":
+        return round(rng.uniform(schema.get("minimum", 0.0), schema.get("maximum", 1000.0)), 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    if name.endswith("_id") or name.endswith("_ref"):
+        return f"{name.split('_')[0].upper()[:3]}-{rng.randint(10000, 99999)}"
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 16)))
+
+
+def recorded_inputs(path: str, start_node: str) -> list:
+    """Input payloads from a JSONL file of payloads or from trace files."""
+    inputs = []
+    for file in find_trace_files(path):
+        with open(file, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                if "action" not in record:
+                    inputs.append(record)
+                elif record.get("action") == "enter" and record.get("node") == start_node:
+                    inputs.append(record.get("input_data") or {})
+    return inputs
+
+
+class LoadTest:
+    """One load run of an agent against stub backends. `record_samples=False`
+    drops the per-call latency samples the load report is built from, for
+    long runs that only use the stubs (see batch_run.py)."""
+
+    def __init__(self, agent: CompiledAgent, stubs: StubConfig = None, inputs: list = None,
+                 routing=None, seed: int = 0, time_scale: float = 1.0, dispatcher: dict = None,
+                 hedge: bool = False, hedge_after: dict = None, prefetch: bool = False,
+                 spans: SpanRecorder = None, record_samples: bool = True):
+        self.agent = agent
+        self.rng = random.Random(seed)
+        self.stubs = stubs or StubConfig()
+        self.inputs = inputs or []
+        self.routing = routing               # TraceStats, for branch probabilities
+        self.time_scale = time_scale
+        self.record_samples = record_samples
+        self.backend = StubBackend(self.stubs, self.rng, time_scale, record_samples)
+        self.dispatcher = None
+        if dispatcher is not None:
+            self.dispatcher = ModelDispatcher.from_config(
+                self.backend, agent.config, dispatcher.get("batch_window"), dispatcher.get("max_batch"))
+            for limits in [self.dispatcher.default, *self.dispatcher.limits.values()]:
+                limits.batch_window *= time_scale
+        self.prefetcher = Prefetcher(agent, self.backend.call_tool, stats=routing) if prefetch else None
+        self.spans = spans
+        self.host = ExecutionHost(_scaled(agent, time_scale), self.handle, hedge=hedge,
+                                  hedge_after={node_id: seconds * time_scale
+                                               for node_id, seconds in (hedge_after or {}).items()},
+                                  rng=self.rng, prefetcher=self.prefetcher, spans=spans,
+                                  call_tool=self.backend.call_tool)
+        self.node_queue = {}                 # node -> [seconds]
+        self.node_service = {}
+        self.latencies = []
+        self.statuses = {}
+        self._issued = 0
+
+    def next_input(self) -> dict:
+        self._issued += 1
+        if self.inputs:
+            return dict(self.inputs[(self._issued - 1) % len(self.inputs)])
+        schema = self.agent.config.get("input_schema") or {"type": "object", "properties": {"message": {}}}
+        return synthesize(schema, self.rng)
+
+    def _branch(self, session, node) -> Optional[str]:
+        """Pick the next node like a model would (None lets @cond decide)."""
+        nodes = self.agent.nodes
+        if node.max_iterations and session.iterations.get(node.id, 0) >= node.max_iterations:
+            return None    # last allowed visit: the exit @cond decides
+        branches = [e.target for e in node.edges if not e.on_error and not (
+            nodes[e.target].max_iterations and
+            session.iterations.get(e.target, 0) >= nodes[e.target].max_iterations)]
+        if len(branches) < 2:
+            return None
+        if self.routing is not None:
+            weights = [self.routing.edge_probability(node.id, t) for t in branches]
+            if sum(weights) > 0:
+                return self.rng.choices(branches, weights)[0]
+        if node.node_type == "validator":
+            return None
+        return self.rng.choice(branches)
+
+    async def handle(self, session, node, inputs) -> dict:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        queued = 0.0
+        if node.node_type not in MODEL_FREE_TYPES:
+            model = self.agent.model_for(node)
+            with span(f"model {model}", {"gen_ai.request.model": model,
+                                         "gen_ai.usage.input_tokens": _tokens(inputs)}, KIND_CLIENT) as call:
+                if self.dispatcher is not None:
+                    result = await self.dispatcher.submit(model, inputs, group=node.id)
+                    queued = max((loop.time() - started) / self.time_scale - result["service_s"], 0.0)
+                    if call is not None:
+                        call.set("agent.dispatch.batch", result["batch"])
+                else:
+                    queued = await self.backend.call_model(model)
+                if call is not None:
+                    call.set("agent.queue_ms", round(queued * 1000, 1))
+        tools = [self.agent.tools[name] for name in node.tools if name in self.agent.tools]
+        for tool in tools:
+            args = {k: inputs[k] for k in (tool.get("parameters") or {}) if inputs.get(k) is not None}
+            with span(f"tool {tool['name']}", {"agent.tool.name": tool["name"]}, KIND_CLIENT):
+                await dispatch_tool(tool["name"], args)
+        if not tools:
+            for server in node.servers:
+                with span(f"tool {server}", {"agent.tool.server": server}, KIND_CLIENT):
+                    await self.backend.call_tool(server)
+        elapsed = (loop.time() - started) / self.time_scale
+        if self.record_samples:
+            self.node_queue.setdefault(node.id, []).append(queued)
+            self.node_service.setdefault(node.id, []).append(elapsed - queued)
+
+        # Fields the outgoing edges @pass, distinct per session like real model output
+        output = {name: f"{name} from {node.id} ({session.id})"
+                  for edge in node.edges for name in edge.pass_fields if name not in session.context}
+        output[f"{node.id}_output"] = f"{node.id} handled {len(inputs)} fields"
+        if node.node_type == "validator":
+            output["quality"] = self.rng.random()
+        route = self._branch(session, node)
+        if route is not None:
+            output["_route"] = route
+        if node.node_type not in MODEL_FREE_TYPES:
+            annotate({"gen_ai.usage.output_tokens": _tokens(output)})
+        return output
+
+    async def one(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        session = await self.host.start(self.next_input())
+        while session.status == "waiting":
+            await asyncio.sleep(self.stubs.human.sample(self.rng) * self.time_scale)
+            session = await self.host.resume(session.id, {"human_decision": "approve"})
+        self.latencies.append((loop.time() - started) / self.time_scale)
+        self.statuses[session.status] = self.statuses.get(session.status, 0) + 1
+        self.host.close(session.id)
+
+    async def run(self, concurrency: int = None, rate: float = None, requests: int = 200,
+                  duration: float = None) -> dict:
+        """Closed loop with `concurrency` workers, or open loop at `rate`/s.
+        Stops after `requests` sessions or `duration` (unscaled) seconds."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + duration * self.time_scale if duration else None
+
+        def more() -> bool:
+            return self._issued < requests and (deadline is None or loop.time() < deadline)
+
+        if rate:
+            tasks = []
+            while more():
+                tasks.append(asyncio.create_task(self.one()))
+                await asyncio.sleep(self.rng.expovariate(rate) * self.time_scale)
+            await asyncio.gather(*tasks)
+        else:
+            async def worker():
+                while more():
+                    await self.one()
+            await asyncio.gather(*(worker() for _ in range(concurrency or 1)))
+
+        wall = (loop.time() - started) / self.time_scale
+        return self.report(wall, concurrency=None if rate else (concurrency or 1), rate=rate)
+
+    def report(self, wall: float, concurrency=None, rate=None) -> dict:
+        completed = self.statuses.get("done", 0)
+        dispatch = self.dispatcher.report() if self.dispatcher is not None else None
+        return {
+            "agent": self.agent.name,
+            "mode": "rate" if rate else "concurrency",
+            "concurrency": concurrency,
+            "rate": rate,
+            "sessions": len(self.latencies),
+            "statuses": self.statuses,
+            "wall_s": round(wall, 3),
+            "throughput_per_s": round(completed / wall, 3) if wall else 0.0,
+            "latency_s": _summary(self.latencies),
+            "nodes": {
+                node_id: {
+                    "visits": len(self.node_queue[node_id]),
+                    "queue_ms": _summary(self.node_queue[node_id], 1000),
+                    "service_ms": _summary(self.node_service[node_id], 1000),
+                }
+                for node_id in self.node_queue
+            },
+            "models": {
+                model: {
+                    "calls": self.backend.calls.get(model, 0),
+                    "batches": self.backend.batches.get(model, 0),
+                    "slots": self.stubs.slots(model),
+                    "peak_in_flight": self.backend.peak.get(model, 0),
+                    "queue_ms": _summary(waits, 1000),
+                }
+                for model, waits in self.backend.queue.items()
+            },
+            "dispatch": dispatch,
+            "hedges": self.host.hedges,
+            "hedge_wins": self.host.hedge_wins,
+            "prefetch": self.prefetcher.stats() if self.prefetcher is not None else None,
+            "tool_cache": self.host.tool_cache.stats()["total"],
+            "spans": self.spans.stats() if self.spans is not None else None,
+        }
+
+
+def _scaled(agent: CompiledAgent, time_scale: float) -> CompiledAgent:
+    """The agent with @timeout and max_total_time in simulated time."""
+    if time_scale == 1:
+        return agent
+    nodes = {node_id: replace(node, timeout=node.timeout * time_scale) if node.timeout else node
+             for node_id, node in agent.nodes.items()}
+    config = dict(agent.config)
+    execution = dict(config.get("execution") or {})
+    max_total_time = parse_duration(execution.get("max_total_time"))
+    if max_total_time is not None:
+        execution["max_total_time"] = max_total_time * time_scale
+        config["execution"] = execution
+    return replace(agent, nodes=MappingProxyType(nodes), config=MappingProxyType(config))
+
+
+def run_loadtest(agent_dir: str, stubs: str = None, inputs: str = None, traces: str = None,
+                 concurrency: int = None, rate: float = None, requests: int = 200,
+                 duration: float = None, seed: int = 0, time_scale: float = 1.0,
+                 dispatcher: dict = None, hedge: bool = False, prefetch: bool = False,
+                 spans: str = None, sample_rate: float = 1.0) -> dict:
+    """Load an agent and run one load test; see LoadTest.run(). `dispatcher`
+    ({batch_window, max_batch}, either may be None) routes model calls
+    through a ModelDispatcher; `hedge` seeds thresholds from `traces`;
+    `spans` is an OTLP/JSON file or collector URL to export spans to."""
+    agent = CompiledAgent.from_dir(agent_dir)
+    routing = load_stats(traces) if traces else None
+    payloads = recorded_inputs(inputs, agent.start) if inputs else None
+    recorder = SpanRecorder(exporter_for(spans), service=agent.name, sample_rate=sample_rate) if spans else None
+    test = LoadTest(agent, StubConfig.load(stubs), payloads, routing, seed, time_scale, dispatcher,
+                    hedge=hedge, hedge_after=hedge_delays(routing) if hedge and routing else None,
+                    prefetch=prefetch, spans=recorder)
+    try:
+        return asyncio.run(test.run(concurrency=concurrency, rate=rate, requests=requests, duration=duration))
+    finally:
+        if recorder is not None:
+            recorder.close()
@@ -0,0 +1,330 @@
+"""
+Loop Analysis & Execution Bounds
+
+Finds every cycle of an AgentGraph with Tarjan's strongly connected
+components algorithm (linear in nodes + edges) and checks that each cycle is
+bounded: every cycle must pass through an edge or node carrying
+@max_iterations. Within a component, edges with @max_iterations and edges
+into nodes with @max_iterations are cut; if what remains is acyclic, every
+cycle is bounded, otherwise the remaining components are reported as
+unbounded loops. @cond alone does not bound a loop.
+
+From the bounds it derives worst-case totals per run, by a longest-path pass
+over the component DAG:
+
+    max_steps        node executions (sub-agents count their own steps)
+    max_model_calls  model turns, including @retry attempts
+    max_latency      seconds, from @timeout per attempt; capped by
+                     execution.max_total_time
+
+Semantics used for the bounds: edge and node @max_iterations limit traversals
+or visits per run; each visit of a node makes up to @retry attempts (the
+default of 1 means no retry, as in the compiled prompt); a fork runs
+all its branches and they meet at the next aggregator; human_input waits are
+not counted towards latency.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Optional
+
+from parser import AgentGraph, parse_duration
+
+
+# Node types that never call a model
+MODEL_FREE_TYPES = {"terminal", "human_input", "fork"}
+
+
+def strongly_connected_components(nodes, successors: dict) -> list:
+    """Tarjan's algorithm, iterative. Components are returned in reverse
+    topological order: every component comes after all components it reaches."""
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    counter = 0
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors.get(child, ()))))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+@dataclass
+class LoopInfo:
+    nodes: list
+    bounds: list = field(default_factory=list)       # e.g. "review @max_iterations: 2"
+    unbounded: list = field(default_factory=list)    # nodes on cycles no bound cuts
+    max_visits: dict = field(default_factory=dict)   # node -> visits per run
+
+    @property
+    def bounded(self) -> bool:
+        return not self.unbounded
+
+    def to_dict(self):
+        return {
+            "nodes": self.nodes,
+            "bounded": self.bounded,
+            "bounds": self.bounds,
+            "unbounded": self.unbounded,
+            "max_visits": self.max_visits,
+        }
+
+
+@dataclass
+class ExecutionBounds:
+    loops: list = field(default_factory=list)        # LoopInfo per cyclic component
+    max_steps: Optional[int] = None                  # None = unbounded
+    max_model_calls: Optional[int] = None
+    max_latency: Optional[float] = None              # seconds; None = unknown
+    latency_capped: bool = False                     # max_total_time was applied
+    untimed: list = field(default_factory=list)      # reachable nodes without @timeout
+
+    @property
+    def unbounded(self) -> list:
+        return [loop for loop in self.loops if not loop.bounded]
+
+    def to_dict(self):
+        return {
+            "loops": [loop.to_dict() for loop in self.loops],
+            "max_steps": self.max_steps,
+            "max_model_calls": self.max_model_calls,
+            "max_latency_s": self.max_latency,
+            "latency_capped": self.latency_capped,
+            "untimed": self.untimed,
+        }
+
+
+def _analyze_loop(component: list, successors: dict, graph: AgentGraph, edge_caps: dict) -> LoopInfo:
+    members = set(component)
+    loop = LoopInfo(nodes=sorted(component))
+    budget = 0
+    remaining = {}
+    for node_id in component:
+        node = graph.nodes.get(node_id)
+        if node is not None and node.max_iterations:
+            loop.bounds.append(f"{node_id} @max_iterations: {node.max_iterations}")
+            budget += node.max_iterations
+        for target in successors.get(node_id, ()):
+            if target not in members:
+                continue
+            cap = edge_caps.get((node_id, target))
+            if cap:
+                loop.bounds.append(f"{node_id} → {target} @max_iterations: {cap}")
+                budget += cap
+                continue
+            target_node = graph.nodes.get(target)
+            if target_node is not None and target_node.max_iterations:
+                continue
+            remaining.setdefault(node_id, []).append(target)
+
+    for sub in strongly_connected_components(component, remaining):
+        if len(sub) > 1 or sub[0] in remaining.get(sub[0], ()):
+            loop.unbounded.extend(sorted(sub))
+    if loop.unbounded:
+        return loop
+
+    # Bounded traversals split any walk into acyclic segments, and a
+    # segment visits each node at most once
+    for node_id in component:
+        node = graph.nodes.get(node_id)
+        visits = 1 + budget
+        if node is not None and node.max_iterations:
+            visits = min(visits, node.max_iterations)
+        loop.max_visits[node_id] = visits
+    return loop
+
+
+def _node_costs(graph: AgentGraph, node_id: str, nodes: dict, untimed: list) -> tuple:
+    """(steps, model calls, latency) for one visit of a node."""
+    node = graph.nodes.get(node_id)
+    if node is None or node.node_type == "terminal":
+        return 0, 0, 0.0
+    attempts = max(node.retry or 1, 1)
+    timeout = parse_duration(node.timeout)
+
+    node_data = nodes.get(node_id.replace("_", "-"), nodes.get(node_id, {}))
+    sub_agent = node_data.get("sub_agent")
+    if sub_agent and sub_agent.get("graph"):
+        sub = analyze_bounds(sub_agent["graph"], sub_agent.get("config"), sub_agent.get("nodes"))
+        steps = math.inf if sub.max_steps is None else max(sub.max_steps, 1)
+        calls = math.inf if sub.max_model_calls is None else sub.max_model_calls
+        if timeout is None:
+            timeout = sub.max_latency
+        if timeout is None:
+            untimed.append(node_id)
+        latency = math.inf if timeout is None else timeout
+        return steps, attempts * calls, attempts * latency
+
+    calls = 0 if node.node_type in MODEL_FREE_TYPES else attempts
+    if timeout is None:
+        if node.node_type in MODEL_FREE_TYPES:
+            return 1, calls, 0.0
+        untimed.append(node_id)
+        return 1, calls, math.inf
+    return 1, calls, attempts * timeout
+
+
+def best(values):
+    return max(values, default=0)
+
+
+def _finite(value):
+    return None if value == math.inf else value
+
+
+def analyze_bounds(graph: AgentGraph, config: dict = None, nodes: dict = None) -> ExecutionBounds:
+    """Check that every loop is bounded and compute worst-case totals per run.
+
+    `nodes` (load_agent()["nodes"]) lets sub-agent nodes contribute their own
+    bounds; `config` supplies execution.max_total_time.
+    """
+    config = config or {}
+    nodes = nodes or {}
+    result = ExecutionBounds()
+
+    successors = {nid: [] for nid in graph.nodes}
+    edge_caps = {}
+    for edge in graph.edges:
+        targets = successors.setdefault(edge.source, [])
+        successors.setdefault(edge.target, [])
+        if edge.target not in targets:
+            targets.append(edge.target)
+        if edge.max_iterations:
+            key = (edge.source, edge.target)
+            edge_caps[key] = max(edge_caps.get(key, 0), edge.max_iterations)
+
+    components = strongly_connected_components(successors, successors)
+    component_of = {}
+    for i, component in enumerate(components):
+        for node_id in component:
+            component_of[node_id] = i
+
+    # Reachable from START (all nodes when there is none)
+    if graph.start_node in successors:
+        reachable, frontier = {graph.start_node}, [graph.start_node]
+        while frontier:
+            for target in successors[frontier.pop()]:
+                if target not in reachable:
+                    reachable.add(target)
+                    frontier.append(target)
+    else:
+        reachable = set(successors)
+
+    # Per-component weights: (steps, calls, latency) summed over member visits
+    weights, kinds, fan_out = [], [], []
+    for component in components:
+        node_id = component[0]
+        cyclic = len(component) > 1 or node_id in successors[node_id]
+        if cyclic:
+            loop = _analyze_loop(component, successors, graph, edge_caps)
+            result.loops.append(loop)
+            visits = loop.max_visits or {n: math.inf for n in component}
+        else:
+            visits = {node_id: 1}
+
+        total = [0, 0, 0.0]
+        forks = 0
+        for member, count in visits.items():
+            untimed = result.untimed if member in reachable else []
+            costs = _node_costs(graph, member, nodes, untimed)
+            for i, cost in enumerate(costs):
+                if cost:
+                    total[i] += count * cost
+            node = graph.nodes.get(member)
+            if node is not None and node.node_type == "fork":
+                forks = max(forks, count)
+        weights.append(total)
+        node = graph.nodes.get(node_id)
+        if cyclic:
+            kinds.append("loop")
+        else:
+            kinds.append(node.node_type if node is not None else "executor")
+        fan_out.append(forks)
+
+    # Longest paths over the component DAG, sinks first. For a fork, `till`
+    # is the cost of each branch up to its aggregator and `joined` the cost
+    # from that aggregator on; parallel branches add up for steps and calls
+    # and overlap for latency.
+    if graph.start_node in component_of:
+        starts = [component_of[graph.start_node]]
+    else:
+        starts = range(len(components))
+    component_succ = [{component_of[t] for n in component for t in successors[n]} - {i}
+                      for i, component in enumerate(components)]
+    totals = []
+    for metric, parallel in ((0, sum), (1, sum), (2, max)):
+        full, till, joined = [], [], []
+        for i, succ in enumerate(component_succ):
+            w = weights[i][metric]
+            if kinds[i] == "aggregator":
+                f = w + best(full[s] for s in succ)
+                full.append(f); till.append(0); joined.append(f)
+            elif kinds[i] == "fork":
+                full.append(w + parallel([till[s] for s in succ] or [0]) + best(joined[s] for s in succ))
+                till.append(w + parallel([full[s] for s in succ] or [0]))
+                joined.append(0)
+            elif kinds[i] == "loop" and fan_out[i] and parallel is sum:
+                # A fork inside a loop may leave it through every exit on each visit
+                f = w + fan_out[i] * sum(full[s] for s in succ)
+                full.append(f); till.append(f); joined.append(0)
+            else:
+                full.append(w + best(full[s] for s in succ))
+                till.append(w + best(till[s] for s in succ))
+                joined.append(best(joined[s] for s in succ))
+        totals.append(max((full[i] for i in starts), default=0))
+
+    steps, calls, latency = totals
+    result.max_steps = _finite(steps)
+    result.max_model_calls = _finite(calls)
+    result.max_latency = _finite(latency)
+    max_total_time = parse_duration((config.get("execution") or {}).get("max_total_time"))
+    if max_total_time is not None and (result.max_latency is None or max_total_time < result.max_latency):
+        result.max_latency = max_total_time
+        result.latency_capped = True
+    result.untimed = sorted(set(result.untimed))
+    return result
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    from fast_loader import load_agent_fast
+
+    if len(sys.argv) < 2:
+        print("Usage: python loop_analysis.py <agent-directory>")
+        sys.exit(1)
+    agent = load_agent_fast(sys.argv[1], lazy=True)
+    if agent["graph"] is None:
+        print("No agent-mermaid.md found")
+        sys.exit(1)
+    print(json.dumps(analyze_bounds(agent["graph"], agent["config"], agent["nodes"]).to_dict(), indent=2))
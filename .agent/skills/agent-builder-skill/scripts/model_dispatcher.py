@@ -0,0 +1,228 @@
+"""
+Per-Model Request Dispatcher
+
+Sits between node handlers and the model API, shared by every session in a
+process. A request goes through three stages:
+
+    coalescing      a request identical to one already in flight (same
+                    model, node and payload) awaits that call instead of
+                    issuing its own
+    micro-batching  compatible requests (same model and node, so same
+                    system prompt and parameters) are held for up to
+                    `batch_window` or until `max_batch` have gathered, then
+                    sent as one batch call
+    limits          at most `max_concurrency` batch calls per model are in
+                    flight; a batch waiting for a slot keeps accepting
+                    requests until it is full, so batches grow under load
+
+Limits are read from agent-config.yaml; `default` applies to models that
+are not listed:
+
+    models:
+      claude-haiku-4-5-20251001: {max_concurrency: 16, batch_window: 10ms, max_batch: 16}
+      default: {max_concurrency: 8}
+
+The backend is any object with `async complete(model, requests)` returning
+one result per request, in order. loadtest.StubBackend is a local stub
+model server implementing it.
+"""
+
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass, field
+
+from parser import parse_duration
+
+
+DEFAULT_BATCH_WINDOW = 0.01     # seconds
+DEFAULT_MAX_BATCH = 16
+DEFAULT_MAX_CONCURRENCY = 32
+
+
+@dataclass(frozen=True)
+class ModelRequest:
+    model: str
+    group: str          # batching compatibility, normally the node ID
+    payload: dict
+
+    @property
+    def key(self) -> str:
+        body = json.dumps(self.payload, sort_keys=True, default=str)
+        return hashlib.sha1(f"{self.model}\0{self.group}\0{body}".encode()).hexdigest()
+
+
+@dataclass
+class ModelLimits:
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    batch_window: float = DEFAULT_BATCH_WINDOW
+    max_batch: int = DEFAULT_MAX_BATCH
+
+    @classmethod
+    def parse(cls, spec: dict, base: "ModelLimits" = None) -> "ModelLimits":
+        base = base or cls()
+        spec = spec or {}
+        window = parse_duration(spec.get("batch_window"))
+        return cls(
+            max_concurrency=max(int(spec.get("max_concurrency") or base.max_concurrency), 1),
+            batch_window=base.batch_window if window is None else window,
+            max_batch=max(int(spec.get("max_batch") or base.max_batch), 1),
+        )
+
+
+@dataclass
+class DispatchStats:
+    requests: int = 0
+    coalesced: int = 0
+    batches: int = 0
+    batched: int = 0            # requests sent in batches (excludes coalesced)
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    errors: int = 0
+    waits: list = field(default_factory=list)   # seconds from submit to send
+
+    def to_dict(self):
+        waits = sorted(self.waits)
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "mean_batch": round(self.batched / self.batches, 2) if self.batches else 0.0,
+            "peak_in_flight": self.peak_in_flight,
+            "errors": self.errors,
+            "wait_p95_ms": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else 0.0,
+        }
+
+
+class _Batch:
+    __slots__ = ("requests", "futures", "queued", "timer", "task")
+
+    def __init__(self):
+        self.requests, self.futures, self.queued = [], [], []
+        self.timer = self.task = None
+
+
+class ModelDispatcher:
+    """Coalesces, micro-batches and rate-limits model calls per model."""
+
+    def __init__(self, backend, limits: dict = None, default: ModelLimits = None):
+        self.backend = backend
+        self.default = default or ModelLimits()
+        self.limits = limits or {}        # model -> ModelLimits
+        self.stats = {}                   # model -> DispatchStats
+        self._inflight = {}               # request key -> Future
+        self._pending = {}                # (model, group) -> _Batch
+        self._slots = {}                  # model -> Semaphore
+        self._tasks = set()
+
+    @classmethod
+    def from_config(cls, backend, config: dict, batch_window: float = None,
+                    max_batch: int = None) -> "ModelDispatcher":
+        """Limits from the `models` section of agent-config.yaml; explicit
+        arguments override the window and batch size for every model."""
+        specs = dict((config or {}).get("models") or {})
+        default = ModelLimits.parse(specs.pop("default", None))
+        limits = {name: ModelLimits.parse(spec, default) for name, spec in specs.items()}
+        for limit in [default, *limits.values()]:
+            if batch_window is not None:
+                limit.batch_window = batch_window
+            if max_batch is not None:
+                limit.max_batch = max(int(max_batch), 1)
+        return cls(backend, limits, default)
+
+    def limits_for(self, model: str) -> ModelLimits:
+        return self.limits.get(model, self.default)
+
+    async def submit(self, model: str, payload: dict, group: str = ""):
+        """Result of one model call for `payload`."""
+        request = ModelRequest(model, group, payload)
+        stats = self.stats.setdefault(model, DispatchStats())
+        stats.requests += 1
+        key = request.key
+        future = self._inflight.get(key)
+        if future is not None:
+            stats.coalesced += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+        self._enqueue(request, future, loop)
+        # Shielded: a cancelled caller must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def _done(self, key: str, future: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            future.exception()    # retrieved here so an unawaited failure stays quiet
+
+    def _enqueue(self, request: ModelRequest, future, loop) -> None:
+        limits = self.limits_for(request.model)
+        group = (request.model, request.group)
+        batch = self._pending.get(group)
+        if batch is None:
+            batch = self._pending[group] = _Batch()
+            batch.timer = loop.call_later(limits.batch_window, self._flush, group, batch)
+        batch.requests.append(request)
+        batch.futures.append(future)
+        batch.queued.append(loop.time())
+        if len(batch.requests) >= limits.max_batch:
+            self._seal(group, batch)
+            self._flush(group, batch)
+
+    def _seal(self, group: tuple, batch: _Batch) -> None:
+        """Stop the batch from accepting requests."""
+        if self._pending.get(group) is batch:
+            del self._pending[group]
+
+    def _flush(self, group: tuple, batch: _Batch) -> None:
+        """Start sending once the window closes; the batch stays open until
+        a slot is free or it is full."""
+        batch.timer.cancel()
+        if batch.task is None:
+            batch.task = asyncio.get_running_loop().create_task(self._send(group, batch))
+            self._tasks.add(batch.task)
+            batch.task.add_done_callback(self._tasks.discard)
+
+    def _slot(self, model: str) -> asyncio.Semaphore:
+        slots = self._slots.get(model)
+        if slots is None:
+            slots = self._slots[model] = asyncio.Semaphore(self.limits_for(model).max_concurrency)
+        return slots
+
+    async def _send(self, group: tuple, batch: _Batch) -> None:
+        model = group[0]
+        stats = self.stats[model]
+        try:
+            async with self._slot(model):
+                self._seal(group, batch)
+                now = asyncio.get_running_loop().time()
+                stats.waits.extend(now - queued for queued in batch.queued)
+                stats.batches += 1
+                stats.batched += len(batch.requests)
+                stats.in_flight += 1
+                stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+                try:
+                    results = await self.backend.complete(model, batch.requests)
+                finally:
+                    stats.in_flight -= 1
+            if len(results) != len(batch.requests):
+                raise RuntimeError(f"{model}: {len(results)} results for {len(batch.requests)} requests")
+        except asyncio.CancelledError:
+            for future in batch.futures:
+                future.cancel()
+            raise
+        except Exception as exc:
+            stats.errors += 1
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def report(self) -> dict:
+        return {model: {**stats.to_dict(), "max_concurrency": self.limits_for(model).max_concurrency}
+                for model, stats in self.stats.items()}
@@ -7,7 +7,10 @@ Extracts node metadata (@type, @model, etc.) and edge conditions (@cond, @pass,
 
 import re
 import json
+import threading
 import yaml
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field, asdict
 from typing import Optional
 from pathlib import Path
@@ -95,6 +98,22 @@ class AgentGraph:
         return order
 
 
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value) -> Optional[float]:
+    """Parse a DSL duration like `30s`, `500ms`, `5m` or `1h` into seconds.
+    Bare numbers are seconds; None and unparseable values return None."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*', str(value))
+    if not match:
+        return None
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or "s"]
+
+
 def parse_node_metadata(label: str) -> dict:
     """Extract @key: value pairs from a node label."""
     meta = {}
@@ -323,8 +342,99 @@ def parse_mermaid(content: str) -> AgentGraph:
     return graph
 
 
-def load_agent(agent_dir: str) -> dict:
-    """Load a complete agent definition from a directory."""
+# References at or above this size are replaced by a placeholder
+LARGE_REFERENCE_BYTES = 50000
+
+# libyaml's C loader is several times faster when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_yaml(text: str):
+    """yaml.safe_load, using the C-accelerated loader when available."""
+    return yaml.load(text, Loader=_YAML_LOADER)
+
+
+class LazySubAgent(Mapping):
+    """Stand-in for a nested load_agent() result that loads on first access.
+
+    Behaves like the loaded dict (`sub["graph"]`, `sub.get("config")`, ...);
+    truthiness and `path` do not trigger a load. Nested sub-agents of the
+    loaded agent are lazy as well.
+    """
+
+    def __init__(self, agent_dir: str, loader=None):
+        self.path = agent_dir
+        self._loader = loader
+        self._agent = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._agent is not None
+
+    def load(self) -> dict:
+        if self._agent is None:
+            with self._lock:
+                if self._agent is None:
+                    loader = self._loader or load_agent
+                    self._agent = loader(self.path, lazy=True)
+        return self._agent
+
+    def prefetch(self):
+        """Start loading in the background; returns a Future."""
+        return _prefetch_pool().submit(self.load)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"LazySubAgent({self.path!r}, {state})"
+
+
+_PREFETCH_POOL = None
+
+
+def _prefetch_pool() -> ThreadPoolExecutor:
+    global _PREFETCH_POOL
+    if _PREFETCH_POOL is None:
+        _PREFETCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="subagent-prefetch")
+    return _PREFETCH_POOL
+
+
+def prefetch_subagents(agent: dict, node_id: str, depth: int = 1) -> list:
+    """Prefetch lazy sub-agents of the nodes reachable from `node_id` within
+    `depth` edges — the likely next steps. Returns the started futures."""
+    graph = agent.get("graph")
+    if not graph:
+        return []
+    frontier, seen, futures = {node_id}, {node_id}, []
+    for _ in range(depth):
+        frontier = {e.target for n in frontier for e in graph.get_children(n)} - seen
+        seen |= frontier
+        for nid in frontier:
+            node_data = agent["nodes"].get(nid.replace("_", "-"), agent["nodes"].get(nid, {}))
+            sub = node_data.get("sub_agent")
+            if isinstance(sub, LazySubAgent) and not sub.loaded:
+                futures.append(sub.prefetch())
+    return futures
+
+
+def load_agent(agent_dir: str, lazy: bool = False) -> dict:
+    """Load a complete agent definition from a directory.
+
+    With `lazy=True`, nested sub-agents are LazySubAgent proxies that load
+    only when first accessed.
+    """
     agent_path = Path(agent_dir)
 
     result = {
@@ -344,7 +454,7 @@ def load_agent(agent_dir: str) -> dict:
     # Load config
     config_file = agent_path / "agent-config.yaml"
     if config_file.exists():
-        result["config"] = yaml.safe_load(config_file.read_text())
+        result["config"] = load_yaml(config_file.read_text())
 
     # Load index
     index_file = agent_path / "index.md"
@@ -364,16 +474,21 @@ def load_agent(agent_dir: str) -> dict:
 
                 tools_file = node_dir / "tools.yaml"
                 if tools_file.exists():
-                    node_data["tools"] = yaml.safe_load(tools_file.read_text())
+                    node_data["tools"] = load_yaml(tools_file.read_text())
 
                 guardrails_file = node_dir / "guardrails.yaml"
                 if guardrails_file.exists():
-                    node_data["guardrails"] = yaml.safe_load(guardrails_file.read_text())
+                    node_data["guardrails"] = load_yaml(guardrails_file.read_text())
+
+                # Trained fast-path router model (see router_classifier.py)
+                classifier_file = node_dir / "classifier.npz"
+                if classifier_file.exists():
+                    node_data["classifier"] = str(classifier_file)
 
                 # Check for recursive sub-agent
                 sub_mermaid = node_dir / "agent-mermaid.md"
                 if sub_mermaid.exists():
-                    node_data["sub_agent"] = load_agent(str(node_dir))
+                    node_data["sub_agent"] = LazySubAgent(str(node_dir)) if lazy else load_agent(str(node_dir))
 
                 # Load references
                 refs_dir = node_dir / "references"
@@ -383,7 +498,7 @@ def load_agent(agent_dir: str) -> dict:
                         if ref.is_file():
                             node_data["references"].append({
                                 "name": ref.name,
-                                "content": ref.read_text() if ref.stat().st_size < 50000 else f"[Large file: {ref.name}]"
+                                "content": ref.read_text() if ref.stat().st_size < LARGE_REFERENCE_BYTES else f"[Large file: {ref.name}]"
                             })
 
                 result["nodes"][node_dir.name] = node_data
@@ -0,0 +1,248 @@
+"""
+Speculative Tool Prefetch
+
+While a router node is waiting for its model, the branches it is likely to
+take are already known from recorded traces. The Prefetcher starts the tool
+calls of the most likely successors in parallel with the router, so that
+when the branch is taken the tool result is ready (or in flight) instead of
+being fetched after the routing decision. Results of branches not taken are
+discarded: calls still running are cancelled.
+
+Only tools that opt in are prefetched. They must be both cacheable and
+declared free of side effects in tools.yaml:
+
+    - type: function
+      name: get_booking_details
+      side_effect_free: true       # safe to call speculatively
+      cache: {ttl: 5m, key: [booking_ref, customer_id]}
+
+Arguments are taken from the data the successor will receive (the edge's
+@pass fields of the session context). A call is only prefetched when its
+arguments are known up front: at least one `cache.key` field, or else every
+parameter without a default, and only when they pass the tool's parameter
+schema. Handlers fetch tools through Prefetcher.call(), which checks the
+arguments (raising validators.ValidationError) and then joins a prefetch in
+flight or reads its cached result.
+
+    prefetcher = Prefetcher(agent, call_tool, stats=load_stats(traces))
+    host = ExecutionHost(agent, handler, prefetcher=prefetcher)
+"""
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from spans import annotate
+from tool_cache import ToolCache, parse_cache_policy
+
+
+DEFAULT_MIN_PROBABILITY = 0.2
+DEFAULT_MAX_BRANCHES = 2
+MAX_SPECULATIVE_KEYS = 4096
+
+
+def is_prefetchable(tool: dict) -> bool:
+    """A tools.yaml entry that may be called speculatively."""
+    return bool(tool and tool.get("side_effect_free") is True and parse_cache_policy(tool))
+
+
+def tool_args(tool: dict, inputs: dict) -> Optional[dict]:
+    """Arguments for `tool` taken from `inputs`, or None when they are not
+    all known (see module docstring)."""
+    params = tool.get("parameters") or {}
+    args = {name: inputs[name] for name in params if inputs.get(name) is not None}
+    policy = parse_cache_policy(tool)
+    if policy is not None and policy.key_fields:
+        return args if any(k in args for k in policy.key_fields) else None
+    required = [name for name, spec in params.items()
+                if not (isinstance(spec, dict) and "default" in spec)]
+    return args if all(name in args for name in required) and args else None
+
+
+@dataclass
+class PrefetchMetrics:
+    started: int = 0
+    used: int = 0           # prefetched results a handler consumed
+    discarded: int = 0      # results of branches not taken
+    cancelled: int = 0      # discarded while still in flight
+    failed: int = 0
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "used": self.used,
+            "discarded": self.discarded,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "hit_rate": round(self.used / self.started, 4) if self.started else 0.0,
+        }
+
+
+@dataclass
+class _Branch:
+    probability: float
+    edge: object            # CompiledEdge from the router
+    tools: tuple            # tools.yaml entries of the target
+
+
+class _Flight:
+    __slots__ = ("task", "refs")
+
+    def __init__(self, task):
+        self.task = task
+        self.refs = 1
+
+
+class Prefetcher:
+    """Speculative tool calls for the likely successors of router nodes.
+
+    `call_tool(name, args)` is the coroutine that performs a real tool call;
+    `stats` (a TraceStats) supplies edge probabilities, without it every
+    branch of a router is equally likely.
+    """
+
+    def __init__(self, agent, call_tool, cache: ToolCache = None, stats=None,
+                 min_probability: float = DEFAULT_MIN_PROBABILITY,
+                 max_branches: int = DEFAULT_MAX_BRANCHES):
+        self.agent = agent
+        self.call_tool = call_tool
+        self.cache = cache or ToolCache()
+        for tool in agent.tools.values():
+            policy = parse_cache_policy(tool)
+            if policy is not None:
+                self.cache.policies.setdefault(policy.tool, policy)
+        self.metrics = PrefetchMetrics()
+        self.plans = self._plan(stats, min_probability, max_branches)
+        self._inflight = {}                  # cache key -> _Flight
+        self._speculative = OrderedDict()    # cache keys prefetched and not yet used
+
+    def _plan(self, stats, min_probability: float, max_branches: int) -> dict:
+        """router id -> [_Branch], most likely first."""
+        plans = {}
+        for node in self.agent.nodes.values():
+            if node.node_type != "router":
+                continue
+            edges = [e for e in node.edges if not e.on_error]
+            branches = []
+            for edge in edges:
+                target = self.agent.nodes.get(edge.target)
+                tools = tuple(self.agent.tools[name] for name in (target.tools if target else ())
+                              if is_prefetchable(self.agent.tools.get(name)))
+                if not tools:
+                    continue
+                probability = stats.edge_probability(node.id, edge.target) if stats else 1.0 / len(edges)
+                if probability >= min_probability:
+                    branches.append(_Branch(probability, edge, tools))
+            branches.sort(key=lambda b: -b.probability)
+            if branches:
+                plans[node.id] = branches[:max_branches]
+        return plans
+
+    def start(self, session, node, inputs: dict) -> list:
+        """Start prefetches for a router about to run. Returns a token for settle()."""
+        started = []
+        for branch in self.plans.get(node.id, ()):
+            predicted = self._predict(session, branch.edge, inputs)
+            for tool in branch.tools:
+                name = tool["name"]
+                args = tool_args(tool, predicted)
+                validator = self.agent.validators.tools.get(name)
+                if args is None or (validator is not None and not validator.is_valid(args)):
+                    continue
+                key = self.cache.make_key(name, args)
+                flight = self._inflight.get(key)
+                if flight is not None:
+                    flight.refs += 1
+                elif key in self._speculative or self.cache.get(name, args)[0]:
+                    continue
+                else:
+                    task = asyncio.ensure_future(self._fetch(name, args, key))
+                    self._inflight[key] = _Flight(task)
+                    self.metrics.started += 1
+                    self._remember(key)
+                started.append((branch.edge.target, key))
+        return started
+
+    def settle(self, started: list, target: Optional[str]) -> None:
+        """The router chose `target` (None on error): discard the other branches."""
+        chosen = {key for branch_target, key in started if branch_target == target}
+        for branch_target, key in started:
+            if branch_target == target:
+                continue
+            flight = self._inflight.get(key)
+            if flight is not None:
+                flight.refs -= 1
+            if key in chosen:
+                continue    # the same call is needed on the chosen branch too
+            self._speculative.pop(key, None)
+            self.metrics.discarded += 1
+            if flight is None:
+                continue
+            if flight.refs <= 0 and not flight.task.done():
+                del self._inflight[key]
+                flight.task.cancel()
+                self.metrics.cancelled += 1
+
+    async def call(self, name: str, args: dict):
+        """A tool call from a handler: joins a prefetch or reuses its result."""
+        args = self.agent.validators.check_tool_args(name, args)
+        key = self.cache.make_key(name, args) if self.cache.is_cacheable(name) else None
+        flight = self._inflight.get(key) if key else None
+        if flight is not None:
+            flight.refs += 1
+            try:
+                ok, value = await asyncio.shield(flight.task)
+            finally:
+                flight.refs -= 1
+            if ok:
+                self._used(key)
+                annotate({"agent.cache.hit": True, "agent.prefetch.joined": True})
+                return value
+        hit, value = self.cache.get(name, args)
+        annotate({"agent.cache.hit": hit})
+        if hit:
+            self._used(key)
+            return value
+        value = await self.call_tool(name, args)
+        self.cache.put(name, args, value)
+        return value
+
+    async def _fetch(self, name: str, args: dict, key: str) -> tuple:
+        """(ok, value); a failed prefetch is left for the handler to retry."""
+        try:
+            value = await self.call_tool(name, args)
+        except Exception:
+            self.metrics.failed += 1
+            self._speculative.pop(key, None)
+            return False, None
+        finally:
+            if self._inflight.get(key) is not None and self._inflight[key].task is asyncio.current_task():
+                del self._inflight[key]
+        self.cache.put(name, args, value)
+        return True, value
+
+    def _predict(self, session, edge, inputs: dict) -> dict:
+        """What the successor will probably receive over `edge`."""
+        context = {**session.context, **inputs}
+        if not edge.pass_fields or "*" in edge.pass_fields:
+            return context
+        return {k: context[k] for k in edge.pass_fields if k in context}
+
+    def _remember(self, key: str) -> None:
+        self._speculative[key] = True
+        while len(self._speculative) > MAX_SPECULATIVE_KEYS:
+            self._speculative.popitem(last=False)
+
+    def _used(self, key: str) -> None:
+        if self._speculative.pop(key, None) is not None:
+            self.metrics.used += 1
+
+    def stats(self) -> dict:
+        return {
+            "routers": {router: [{"target": b.edge.target, "p": round(b.probability, 3),
+                                  "tools": [t["name"] for t in b.tools]} for b in branches]
+                        for router, branches in self.plans.items()},
+            **self.metrics.to_dict(),
+            "cache": self.cache.stats()["total"],
+        }
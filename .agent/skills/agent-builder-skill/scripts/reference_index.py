@@ -0,0 +1,387 @@
+"""
+Reference Index (BM25)
+
+Node reference files (nodes/<id>/references/) and agent-wide references
+(references/ at the agent root) are split into chunks of about
+CHUNK_WORDS words along headings and paragraphs, and indexed with BM25.
+Node files below LARGE_REFERENCE_BYTES are still pasted
+into the compiled prompt in full; files above it (which used to become a
+`[Large file: ...]` placeholder) and the agent-wide references are served
+from the index instead: the ExecutionHost injects the top-k chunks
+relevant to the current input (see inject()).
+
+The index is only built on request (`compile --index`, or this script)
+and is written to `.reference-index/` in the agent directory as flat
+numpy arrays plus the chunk text, and opened with memory mapping, so
+loading it costs a few file opens regardless of corpus size:
+
+    terms.txt            vocabulary, one term per line (term id = line)
+    postings.npy         uint32 chunk ids, grouped by term
+    tf.npy               uint16 term frequency per posting
+    offsets.npy          int64 start of each term's postings (n_terms + 1)
+    doc_len.npy          uint32 tokens per chunk
+    doc_scope.npy        uint16 scope per chunk (0 = agent-wide)
+    doc_inline.npy       uint8 1 if the compiled prompt carries the chunk's file in full
+    chunks.txt           chunk text, UTF-8, back to back
+    chunk_offsets.npy    int64 byte offsets into chunks.txt (n_chunks + 1)
+    meta.json            scopes, chunk sources/headings, avgdl, sources,
+                         size and mtime of each indexed file
+
+An index whose files no longer match the references on disk is stale:
+ReferenceIndex.load() refuses it, or rebuilds it with `rebuild=True`.
+A node's searches cover its own references and the agent-wide ones.
+
+    python reference_index.py <agent-dir>                     # build
+    python reference_index.py <agent-dir> --node kb_search --query "baggage fees"
+"""
+
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the reference index
+    np = None
+
+from fast_loader import scan_agent_tree
+from parser import LARGE_REFERENCE_BYTES
+
+
+INDEX_DIR = ".reference-index"
+CHUNK_WORDS = 160
+DEFAULT_TOP_K = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+AGENT_SCOPE = ""        # scope name of agent-wide references
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_HEADING = re.compile(r"^#{1,6}\s+(.*)")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have if in into is it its of on or "
+    "that the their this to was were will with not no can may our you your".split()
+)
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The reference index requires numpy: pip install numpy")
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_text(text: str, max_words: int = CHUNK_WORDS) -> list:
+    """Split markdown/plain text into (heading, text) chunks of at most
+    about `max_words` words; a chunk never spans two sections."""
+    chunks = []
+    heading, parts, words = "", [], 0
+
+    def flush():
+        nonlocal parts, words
+        if parts:
+            chunks.append((heading, "\n\n".join(parts)))
+        parts, words = [], 0
+
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        match = _HEADING.match(block)
+        if match:
+            flush()
+            heading = match.group(1).strip()
+            block = block[match.end():].strip()
+            if not block:
+                continue
+        size = len(block.split())
+        if size > max_words:
+            flush()
+            tokens = block.split()
+            for i in range(0, len(tokens), max_words):
+                chunks.append((heading, " ".join(tokens[i:i + max_words])))
+            continue
+        if words + size > max_words:
+            flush()
+        parts.append(block)
+        words += size
+    flush()
+    return chunks
+
+
+def _read_text(path: str) -> Optional[str]:
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if b"\0" in data[:1024]:
+        return None    # binary
+    return data.decode("utf-8", errors="replace")
+
+
+def reference_files(agent_dir: str) -> list:
+    """(scope, path) for every reference file of the agent and its nodes."""
+    files = []
+    root = Path(agent_dir) / "references"
+    if root.is_dir():
+        files.extend((AGENT_SCOPE, str(p)) for p in sorted(root.rglob("*")) if p.is_file())
+    tree = scan_agent_tree(agent_dir)
+    for name in sorted(tree.references):
+        listing = tree.references[name]
+        files.extend((name, listing.join(f)) for f in sorted(listing.files))
+    return files
+
+
+def source_stats(agent_dir: str) -> dict:
+    """{path relative to the agent: [size, mtime_ns]} for every reference file."""
+    stats = {}
+    for _, path in reference_files(agent_dir):
+        st = os.stat(path)
+        stats[os.path.relpath(path, agent_dir)] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def is_inlined(scope: str, size: int) -> bool:
+    """Whether the compiled prompt pastes a reference file in full."""
+    return scope != AGENT_SCOPE and size < LARGE_REFERENCE_BYTES
+
+
+@dataclass
+class Excerpt:
+    score: float
+    scope: str
+    source: str          # file name
+    heading: str
+    text: str
+
+    def render(self) -> str:
+        section = f' section="{self.heading}"' if self.heading else ""
+        return f'<reference name="{self.source}"{section}>\n{self.text}\n</reference>'
+
+
+def build_index(agent_dir: str, chunk_words: int = CHUNK_WORDS) -> Optional[Path]:
+    """Chunk and index every reference file; None (and no index) when the
+    agent has no references."""
+    _require_numpy()
+    out = Path(agent_dir) / INDEX_DIR
+    files = reference_files(agent_dir)
+    if not files:
+        shutil.rmtree(out, ignore_errors=True)
+        return None
+
+    scopes = [AGENT_SCOPE] + sorted({scope for scope, _ in files if scope != AGENT_SCOPE})
+    scope_ids = {scope: i for i, scope in enumerate(scopes)}
+    vocab = {}
+    postings = []        # per term: {chunk id: tf}
+    doc_len, doc_scope, doc_inline, sources, headings, texts = [], [], [], [], [], []
+    stats = source_stats(agent_dir)
+    for scope, path in files:
+        text = _read_text(path)
+        if text is None:
+            continue
+        inline = is_inlined(scope, stats[os.path.relpath(path, agent_dir)][0])
+        for heading, chunk in chunk_text(text, chunk_words):
+            doc = len(texts)
+            counts = {}
+            for term in tokenize(f"{heading} {chunk}"):
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                tid = vocab.get(term)
+                if tid is None:
+                    tid = vocab[term] = len(postings)
+                    postings.append({})
+                postings[tid][doc] = min(tf, 65535)
+            doc_len.append(sum(counts.values()))
+            doc_scope.append(scope_ids[scope])
+            doc_inline.append(inline)
+            sources.append(os.path.basename(path))
+            headings.append(heading)
+            texts.append(chunk.encode("utf-8"))
+
+    tmp = out.with_name(INDEX_DIR + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    np.save(tmp / "postings.npy", np.fromiter((d for p in postings for d in p), dtype=np.uint32, count=int(offsets[-1])))
+    np.save(tmp / "tf.npy", np.fromiter((t for p in postings for t in p.values()), dtype=np.uint16, count=int(offsets[-1])))
+    np.save(tmp / "offsets.npy", offsets)
+    np.save(tmp / "doc_len.npy", np.asarray(doc_len, dtype=np.uint32))
+    np.save(tmp / "doc_scope.npy", np.asarray(doc_scope, dtype=np.uint16))
+    np.save(tmp / "doc_inline.npy", np.asarray(doc_inline, dtype=np.uint8))
+    chunk_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    chunk_offsets[1:] = np.cumsum([len(t) for t in texts])
+    np.save(tmp / "chunk_offsets.npy", chunk_offsets)
+    (tmp / "chunks.txt").write_bytes(b"".join(texts))
+    (tmp / "terms.txt").write_text("\n".join(vocab), encoding="utf-8")
+    (tmp / "meta.json").write_text(json.dumps({
+        "chunk_words": chunk_words,
+        "chunks": len(texts),
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 0.0,
+        "scopes": scopes,
+        "sources": sources,
+        "headings": headings,
+        "files": stats,
+    }))
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return out
+
+
+class ReferenceIndex:
+    """A built index, memory-mapped read-only."""
+
+    def __init__(self, path: Path):
+        _require_numpy()
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text())
+        self.scopes = meta["scopes"]
+        self.scope_ids = {scope: i for i, scope in enumerate(self.scopes)}
+        self.sources = meta["sources"]
+        self.headings = meta["headings"]
+        self.avgdl = meta["avgdl"] or 1.0
+        self.files = meta.get("files", {})
+        terms = (self.path / "terms.txt").read_text(encoding="utf-8")
+        self.terms = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+        load = lambda name: np.load(self.path / name, mmap_mode="r")
+        self.postings = load("postings.npy")
+        self.tf = load("tf.npy")
+        self.offsets = load("offsets.npy")
+        self.doc_len = load("doc_len.npy")
+        self.doc_scope = load("doc_scope.npy")
+        # Indexes built before doc_inline existed: nothing counts as inlined
+        inline = self.path / "doc_inline.npy"
+        self.doc_inline = np.load(inline, mmap_mode="r") if inline.exists() else np.zeros(len(self.doc_len), np.uint8)
+        self.chunk_offsets = load("chunk_offsets.npy")
+        self._fh = open(self.path / "chunks.txt", "rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        self._text = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @classmethod
+    def load(cls, agent_dir: str, rebuild: bool = False) -> Optional["ReferenceIndex"]:
+        """The agent's index, or None if it has none (or numpy is missing).
+
+        A stale index (see is_stale) is rebuilt with `rebuild`, else None.
+        """
+        path = Path(agent_dir) / INDEX_DIR
+        if np is None or not (path / "meta.json").exists():
+            return None
+        index = cls(path)
+        if not index.is_stale(agent_dir):
+            return index
+        index.close()
+        if not rebuild:
+            return None
+        path = build_index(agent_dir)
+        return cls(path) if path is not None else None
+
+    def is_stale(self, agent_dir: str) -> bool:
+        """Whether reference files were added, removed or changed since the build."""
+        return self.files != source_stats(agent_dir)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._fh.close()
+
+    def chunk(self, doc: int) -> str:
+        return bytes(self._text[int(self.chunk_offsets[doc]):int(self.chunk_offsets[doc + 1])]).decode("utf-8")
+
+    def scope_size(self, scope: str) -> int:
+        sid = self.scope_ids.get(scope)
+        return 0 if sid is None else int(np.count_nonzero(self.doc_scope == sid))
+
+    def search(self, query: str, scopes=None, k: int = DEFAULT_TOP_K, indexed_only: bool = False) -> list:
+        """Top-k Excerpts for `query`, restricted to `scopes` (scope names);
+        with `indexed_only`, to chunks the compiled prompt does not carry."""
+        n_docs = len(self.doc_len)
+        terms = [self.terms[t] for t in set(tokenize(query)) if t in self.terms]
+        if not n_docs or not terms or k <= 0:
+            return []
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for tid in terms:
+            lo, hi = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            docs = self.postings[lo:hi]
+            tf = self.tf[lo:hi].astype(np.float32)
+            df = hi - lo
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_len[docs] / self.avgdl)
+            scores[docs] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        if scopes is not None:
+            allowed = [self.scope_ids[s] for s in scopes if s in self.scope_ids]
+            scores[~np.isin(self.doc_scope, allowed)] = 0.0
+        if indexed_only:
+            scores[self.doc_inline.astype(bool)] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = sorted(candidates.tolist(), key=lambda d: -scores[d])
+        return [Excerpt(float(scores[d]), self.scopes[int(self.doc_scope[d])], self.sources[d],
+                        self.headings[d], self.chunk(d)) for d in ranked]
+
+    def node_scope(self, node_id: str) -> Optional[str]:
+        """Scope name of a node (its folder may use '-' for '_')."""
+        for name in (node_id, node_id.replace("_", "-")):
+            if name in self.scope_ids:
+                return name
+        return None
+
+    def excerpts_for(self, node_id: str, query: str, k: int = DEFAULT_TOP_K, indexed_only: bool = False) -> list:
+        """Top-k chunks for a node: its own references and the agent-wide ones."""
+        scopes = [AGENT_SCOPE]
+        scope = self.node_scope(node_id)
+        if scope is not None:
+            scopes.append(scope)
+        return self.search(query, scopes, k, indexed_only)
+
+    def inject(self, node_id: str, inputs, k: int = DEFAULT_TOP_K) -> str:
+        """Reference text to add to a node's prompt for the current input:
+        the best chunks the compiled prompt does not already carry."""
+        query = inputs if isinstance(inputs, str) else " ".join(
+            str(v) for v in (inputs or {}).values() if isinstance(v, (str, int, float)))
+        return "\n".join(e.render() for e in self.excerpts_for(node_id, query, k, indexed_only=True))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Build or query an agent's reference index")
+    ap.add_argument("agent_dir")
+    ap.add_argument("--node", default=None)
+    ap.add_argument("--query", default=None)
+    ap.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    args = ap.parse_args()
+
+    if args.query is None:
+        started = time.perf_counter()
+        path = build_index(args.agent_dir)
+        if path is None:
+            print("No references found")
+        else:
+            index = ReferenceIndex(path)
+            size = sum(f.stat().st_size for f in path.iterdir())
+            print(f"Indexed {len(index)} chunks, {len(index.terms)} terms in "
+                  f"{time.perf_counter() - started:.2f}s → {path} ({size / 1024:.0f} KB)")
+    else:
+        index = ReferenceIndex.load(args.agent_dir)
+        if index is None:
+            raise SystemExit("No index, or the references changed since it was built; build it first")
+        started = time.perf_counter()
+        if args.node:
+            hits = index.excerpts_for(args.node, args.query, args.k)
+        else:
+            hits = index.search(args.query, None, args.k)
+        elapsed = time.perf_counter() - started
+        for hit in hits:
+            print(f"[{hit.score:.2f}] {hit.scope or '(agent)'}/{hit.source} § {hit.heading}")
+            print("   " + hit.text[:200].replace("\n", " "))
+        print(f"{len(hits)} results in {elapsed * 1000:.2f} ms")
@@ -0,0 +1,239 @@
+"""
+Router Fast-Path Classifier
+
+A small local classifier that picks the outgoing edge of a router node
+without a model call. Inputs are turned into hashed word n-gram and
+character trigram features and scored by a multinomial linear model in
+pure NumPy; training uses recorded runs (the node's `enter` input and the
+node entered next).
+
+The model is stored next to the node as `nodes/<id>/classifier.npz`. At
+runtime the classifier decides the branch when its confidence reaches the
+node's `@threshold` (DEFAULT_THRESHOLD if unset) and returns None otherwise,
+so the caller falls back to the model; the ExecutionHost attaches a
+FastPathRouter to every router node that has a classifier.
+"""
+
+import json
+import re
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for local routing
+    np = None
+
+from parser import AgentGraph
+
+
+CLASSIFIER_FILE = "classifier.npz"
+DEFAULT_DIM = 1 << 16
+DEFAULT_THRESHOLD = 0.9
+# Traced inputs timed for the decision latency reported by train_router()
+LATENCY_SAMPLES = 1000
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Router classifiers require numpy: pip install numpy")
+
+
+def input_text(inputs) -> str:
+    """Flatten a node's input payload to text; `message` leads when present."""
+    if isinstance(inputs, str):
+        return inputs
+    if not isinstance(inputs, dict):
+        return json.dumps(inputs, default=str)
+    parts = []
+    if isinstance(inputs.get("message"), str):
+        parts.append(inputs["message"])
+    for key, value in inputs.items():
+        if key != "message" and isinstance(value, str):
+            parts.append(value)
+    return " ".join(parts)
+
+
+def hash_features(text: str, dim: int = DEFAULT_DIM) -> "np.ndarray":
+    """Unique hashed feature indices: word unigrams, bigrams and char trigrams.
+    crc32 keeps the hashing stable across processes."""
+    text = text.lower()
+    words = _TOKEN_RE.findall(text)
+    grams = ["w:" + w for w in words]
+    grams += ["b:" + a + " " + b for a, b in zip(words, words[1:])]
+    padded = " " + " ".join(words) + " "
+    grams += ["c:" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    if not grams:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) % dim for g in grams),
+                                 dtype=np.int64, count=len(grams)))
+
+
+class RouterClassifier:
+    """Multinomial logistic regression over hashed features."""
+
+    def __init__(self, labels: list, dim: int = DEFAULT_DIM, weights=None, bias=None):
+        _require_numpy()
+        self.labels = list(labels)
+        self.dim = dim
+        k = len(self.labels)
+        self.weights = weights if weights is not None else np.zeros((dim, k), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(k, dtype=np.float32)
+
+    def _scores(self, idx) -> "np.ndarray":
+        logits = self.weights[idx].sum(axis=0) + self.bias
+        logits = logits - logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, inputs) -> tuple:
+        """Return (label, confidence) for a node input payload."""
+        probs = self._scores(hash_features(input_text(inputs), self.dim))
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def fit(self, texts: list, labels: list, epochs: int = 10, lr: float = 0.5,
+            l2: float = 1e-6, seed: int = 0) -> "RouterClassifier":
+        """Train with per-example SGD on the softmax cross-entropy loss."""
+        rng = np.random.default_rng(seed)
+        features = [hash_features(t, self.dim) for t in texts]
+        targets = np.array([self.labels.index(l) for l in labels])
+        for epoch in range(epochs):
+            step = lr / (1.0 + epoch)
+            for i in rng.permutation(len(features)):
+                idx = features[i]
+                grad = self._scores(idx)
+                grad[targets[i]] -= 1.0
+                if l2:
+                    self.weights[idx] *= (1.0 - step * l2)
+                self.weights[idx] -= step * grad
+                self.bias -= step * grad
+        return self
+
+    def evaluate(self, texts: list, labels: list, threshold: float) -> dict:
+        """Accuracy overall and on the confident (fast-path) subset."""
+        total = confident = correct = confident_correct = 0
+        for text, label in zip(texts, labels):
+            predicted, confidence = self.predict(text)
+            total += 1
+            correct += predicted == label
+            if confidence >= threshold:
+                confident += 1
+                confident_correct += predicted == label
+        return {
+            "examples": total,
+            "accuracy": round(correct / total, 4) if total else 0.0,
+            "coverage": round(confident / total, 4) if total else 0.0,
+            "fast_path_accuracy": round(confident_correct / confident, 4) if confident else 0.0,
+        }
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            labels=np.array(self.labels), dim=np.array(self.dim))
+
+    @classmethod
+    def load(cls, path: str) -> "RouterClassifier":
+        _require_numpy()
+        data = np.load(path)
+        return cls(labels=[str(l) for l in data["labels"]], dim=int(data["dim"]),
+                   weights=data["weights"], bias=data["bias"])
+
+
+class FastPathRouter:
+    """Decides a router node's outgoing edge locally when confident.
+
+    `node` is a NodeMeta or an execution_host.CompiledNode, `edges` its
+    outgoing edges of either kind; @on_error edges are never chosen.
+    """
+
+    def __init__(self, node, edges: list, classifier: RouterClassifier):
+        self.node = node
+        self.edges = {}
+        for edge in edges:
+            if not edge.on_error:
+                self.edges.setdefault(edge.target, edge)
+        self.classifier = classifier
+        self.threshold = node.threshold if node.threshold is not None else DEFAULT_THRESHOLD
+        self.decided = 0
+        self.deferred = 0
+
+    @classmethod
+    def for_node(cls, graph: AgentGraph, node_id: str, node_dir: str) -> Optional["FastPathRouter"]:
+        """Attach the node's trained classifier, if one exists."""
+        path = Path(node_dir) / CLASSIFIER_FILE
+        if not path.exists() or node_id not in graph.nodes:
+            return None
+        return cls(graph.nodes[node_id], graph.get_children(node_id), RouterClassifier.load(str(path)))
+
+    def route(self, inputs):
+        """Return (edge, confidence) when confident, else (None, confidence)."""
+        label, confidence = self.classifier.predict(inputs)
+        edge = self.edges.get(label)
+        if edge is not None and confidence >= self.threshold:
+            self.decided += 1
+            return edge, confidence
+        self.deferred += 1
+        return None, confidence
+
+
+def extract_examples(files: list, node_id: str) -> tuple:
+    """Collect (input text, next node) pairs for `node_id` from trace files."""
+    texts, labels = [], []
+    for path in files:
+        pending = None
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if event.get("action") != "enter":
+                    continue
+                if pending is not None:
+                    texts.append(pending)
+                    labels.append(event.get("node"))
+                    pending = None
+                if event.get("node") == node_id:
+                    pending = input_text(event.get("input_data") or {})
+    return texts, labels
+
+
+def train_router(graph: AgentGraph, node_id: str, files: list, epochs: int = 10,
+                 holdout: float = 0.2, seed: int = 0) -> tuple:
+    """Train a classifier for `node_id` on traced decisions.
+
+    Only decisions that follow an outgoing edge of the node (other than an
+    @on_error edge, which the runtime takes on failure) are used. Returns
+    (classifier, holdout evaluation); the evaluation includes the mean
+    decision latency over up to LATENCY_SAMPLES traced inputs.
+    """
+    _require_numpy()
+    targets = sorted({e.target for e in graph.get_children(node_id) if not e.on_error})
+    texts, labels = extract_examples(files, node_id)
+    pairs = [(t, l) for t, l in zip(texts, labels) if l in targets]
+    if not pairs:
+        raise ValueError(f"No traced decisions found for router '{node_id}'")
+
+    order = np.random.default_rng(seed).permutation(len(pairs))
+    n_test = int(len(pairs) * holdout) if len(pairs) >= 10 else 0
+    test = [pairs[i] for i in order[:n_test]]
+    train = [pairs[i] for i in order[n_test:]]
+
+    node = graph.nodes[node_id]
+    threshold = node.threshold if node.threshold is not None else DEFAULT_THRESHOLD
+    clf = RouterClassifier(targets).fit([t for t, _ in train], [l for _, l in train], epochs=epochs)
+    evaluation = clf.evaluate([t for t, _ in test], [l for _, l in test], threshold) if test else {}
+    evaluation["train_examples"] = len(train)
+    evaluation["threshold"] = threshold
+    samples = [t for t, _ in pairs[:LATENCY_SAMPLES]]
+    started = time.perf_counter()
+    for text in samples:
+        clf.predict(text)
+    evaluation["decision_us"] = round((time.perf_counter() - started) / len(samples) * 1e6, 1)
+    return clf, evaluation
@@ -0,0 +1,399 @@
+"""
+Span Instrumentation
+
+The ExecutionHost records a root span per run of a session, a span per node
+execution (`node <id>`) and per edge decision (`route <from> -> <to>`);
+handlers wrap their model and tool calls in span(), which parents them under
+the node being executed. Attributes follow OpenTelemetry conventions:
+
+    agent.node.id, agent.node.type, agent.node.iteration, agent.retries,
+    agent.edge.condition, agent.tool.name, agent.cache.hit,
+    gen_ai.request.model, gen_ai.usage.input_tokens, gen_ai.usage.output_tokens
+
+Sampling is per conversation: the trace ID is derived from the session ID,
+so the start and every resume of a session land in one trace, and a session
+is recorded when its trace ID falls under `sample_rate`. Outside a sampled
+run span() and annotate() do nothing.
+
+Finished spans are queued and exported in batches by a background thread as
+OTLP/JSON ExportTraceServiceRequest payloads:
+
+    SpanRecorder(OTLPFileExporter("spans.jsonl"))             one payload per line
+    SpanRecorder(OTLPHttpExporter("http://localhost:4318"))   POST /v1/traces
+
+A local collector stand-in and a flamegraph view of recorded spans:
+
+    python spans.py collect --port 4318 --out spans.jsonl
+    python spans.py fold spans.jsonl > spans.folded     # collapsed stacks, self time in µs
+"""
+
+import contextvars
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import Optional
+
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_BATCH_SIZE = 512
+DEFAULT_FLUSH_INTERVAL = 2.0      # seconds
+DEFAULT_MAX_QUEUE = 8192          # spans buffered before new ones are dropped
+SCOPE_NAME = "agent-builder.execution_host"
+OTLP_TRACES_PATH = "/v1/traces"
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar("agent_span", default=None)
+_ids = random.Random()
+
+
+class Span:
+    __slots__ = ("recorder", "trace_id", "span_id", "parent_id", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, recorder, trace_id: str, parent_id: Optional[str], name: str,
+                 kind: int = KIND_INTERNAL, attributes: dict = None):
+        self.recorder = recorder
+        self.trace_id = trace_id
+        self.span_id = f"{_ids.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.error = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def fail(self, error: BaseException) -> None:
+        self.error = str(error) or type(error).__name__
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.recorder._finish(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    return {"stringValue": json.dumps(value, default=str)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()
+            if value is not None]
+
+
+# ---------------------------------------------------------------------------
+# Scopes
+# ---------------------------------------------------------------------------
+
+class _Scope:
+    """Makes a span current for a `with` block and ends it on exit."""
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Optional[Span]):
+        self.span = span
+        self.token = None
+
+    def __enter__(self) -> Optional[Span]:
+        if self.span is not None:
+            self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            _current.reset(self.token)
+            if exc is not None:
+                self.span.fail(exc)
+            self.span.end()
+        return False
+
+
+_NO_SCOPE = _Scope(None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def span(name: str, attributes: dict = None, kind: int = KIND_INTERNAL) -> _Scope:
+    """`with span("tool kb_search", {...}) as s:` — a child of the current
+    span, or a no-op (s is None) outside a sampled run."""
+    parent = _current.get()
+    if parent is None:
+        return _NO_SCOPE
+    return _Scope(Span(parent.recorder, parent.trace_id, parent.span_id, name, kind, attributes))
+
+
+def annotate(attributes: dict) -> None:
+    """Set attributes on the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+# ---------------------------------------------------------------------------
+# Recorder and exporters
+# ---------------------------------------------------------------------------
+
+class SpanRecorder:
+    """Samples sessions and exports their finished spans in batches."""
+
+    def __init__(self, exporter, service: str = "agent", sample_rate: float = DEFAULT_SAMPLE_RATE,
+                 batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_queue: int = DEFAULT_MAX_QUEUE):
+        self.exporter = exporter
+        self.service = service
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._threshold = int(min(max(sample_rate, 0.0), 1.0) * 0xFFFFFFFFFFFFFFFF)
+        self._queue = []
+        self._cond = threading.Condition()
+        self._export_lock = threading.Lock()
+        self._closed = False
+        self.traces = 0
+        self.spans = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def trace_id(self, session_id: str) -> str:
+        return hashlib.sha256(f"{self.service}\0{session_id}".encode()).hexdigest()[:32]
+
+    def trace(self, session_id: str, name: str, attributes: dict = None) -> _Scope:
+        """Root span of one run of a session, if the session is sampled."""
+        trace_id = self.trace_id(session_id)
+        if int(trace_id[:16], 16) >= self._threshold:
+            return _NO_SCOPE
+        self.traces += 1
+        return _Scope(Span(self, trace_id, None, name, KIND_INTERNAL, attributes))
+
+    def _finish(self, span: Span) -> None:
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+            self.spans += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """Export every queued span now; returns how many were exported."""
+        with self._export_lock:
+            with self._cond:
+                batch, self._queue = self._queue, []
+            for start in range(0, len(batch), self.batch_size):
+                chunk = batch[start:start + self.batch_size]
+                try:
+                    self.exporter.export(self._request(chunk))
+                    self.batches += 1
+                except Exception:
+                    self.failed += len(chunk)
+        return len(batch)
+
+    def _request(self, spans: list) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service})},
+            "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.exporter.close()
+
+    def stats(self) -> dict:
+        return {"sample_rate": self.sample_rate, "traces": self.traces, "spans": self.spans,
+                "batches": self.batches, "dropped": self.dropped, "failed": self.failed}
+
+
+class OTLPFileExporter:
+    """Appends one OTLP/JSON export request per line."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._fh = open(path, "a")
+
+    def export(self, request: dict) -> None:
+        self._fh.write(json.dumps(request, separators=(",", ":")) + "\n")
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class OTLPHttpExporter:
+    """POSTs OTLP/JSON to a collector (e.g. `python spans.py collect`)."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        endpoint = endpoint.rstrip("/")
+        self.url = endpoint if endpoint.endswith(OTLP_TRACES_PATH) else endpoint + OTLP_TRACES_PATH
+        self.timeout = timeout
+
+    def export(self, request: dict) -> None:
+        body = json.dumps(request, separators=(",", ":")).encode()
+        req = urllib.request.Request(self.url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+    def close(self) -> None:
+        pass
+
+
+def exporter_for(target: str):
+    """An HTTP exporter for http(s) URLs, else a file exporter."""
+    if target.startswith(("http://", "https://")):
+        return OTLPHttpExporter(target)
+    return OTLPFileExporter(target)
+
+
+# ---------------------------------------------------------------------------
+# Reading spans back
+# ---------------------------------------------------------------------------
+
+def read_spans(path: str) -> list:
+    """Every span in an OTLP/JSON lines file."""
+    spans = []
+    with open(path) as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            for resource in json.loads(line).get("resourceSpans", ()):
+                for scope in resource.get("scopeSpans", ()):
+                    spans.extend(scope.get("spans", ()))
+    return spans
+
+
+def fold(spans: list) -> dict:
+    """Collapsed stacks ("run;node classify;model ...") -> self time in µs,
+    summed over traces; the input format of flamegraph.pl and speedscope."""
+    by_id = {(s["traceId"], s["spanId"]): s for s in spans}
+    child_time = {}
+    for s in spans:
+        parent = (s["traceId"], s.get("parentSpanId"))
+        if parent in by_id:
+            child_time[parent] = child_time.get(parent, 0) + _duration(s)
+    stacks = {}
+    for key, s in by_id.items():
+        names = []
+        node = s
+        while node is not None:
+            names.append(node["name"].replace(";", ","))
+            node = by_id.get((node["traceId"], node.get("parentSpanId")))
+        stack = ";".join(reversed(names))
+        self_ns = max(_duration(s) - child_time.get(key, 0), 0)
+        stacks[stack] = stacks.get(stack, 0) + self_ns // 1000
+    return stacks
+
+
+def _duration(span: dict) -> int:
+    return int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+
+
+def serve_collector(port: int, out: str) -> None:
+    """Accept OTLP/JSON on /v1/traces and append each request to `out`."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    exporter = OTLPFileExporter(out)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != OTLP_TRACES_PATH:
+                self.send_error(404)
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except json.JSONDecodeError:
+                self.send_error(400)
+                return
+            with lock:
+                exporter.export(request)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"📡 Collecting spans on http://127.0.0.1:{port}{OTLP_TRACES_PATH} → {out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        exporter.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Local span collector and flamegraph folding")
+    sub = ap.add_subparsers(dest="command", required=True)
+    collect = sub.add_parser("collect", help="Run a local OTLP/JSON collector stand-in")
+    collect.add_argument("--port", type=int, default=4318)
+    collect.add_argument("--out", default="spans.jsonl")
+    folded = sub.add_parser("fold", help="Print collapsed stacks with self time in µs")
+    folded.add_argument("spans")
+    args = ap.parse_args()
+
+    if args.command == "collect":
+        serve_collector(args.port, args.out)
+    else:
+        for stack, micros in sorted(fold(read_spans(args.spans)).items()):
+            print(f"{stack} {micros}")
@@ -0,0 +1,226 @@
+"""
+Tool Result Cache
+
+Memoizes tool invocations keyed on tool name plus normalized arguments.
+Caching is opt-in per tool through a `cache` block in the node's tools.yaml:
+
+    - type: function
+      name: get_booking_details
+      cache:
+        ttl: 5m                      # entry lifetime (DSL duration)
+        key: [booking_ref]           # optional: only these args form the key
+
+`cache: true` enables caching with the cache-wide default TTL, and a bare
+duration (`cache: 5m`) sets the TTL alone; any other value is rejected with
+a ValueError (reported by `agent_cli.py validate`). Tools without a `cache`
+block are never cached. The ExecutionHost sends every dispatched call of a
+cacheable tool through its ToolCache. Memory is bounded by an LRU limit on the
+number of entries, and hit/miss/eviction counters are kept per tool.
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from parser import parse_duration
+
+
+@dataclass
+class CachePolicy:
+    tool: str
+    ttl: Optional[float] = None          # seconds; None = cache-wide default
+    key_fields: Optional[tuple] = None   # None = all arguments
+    defaults: dict = field(default_factory=dict)
+
+
+@dataclass
+class CacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    expirations: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+def iter_tool_defs(nodes: dict):
+    """Yield (node_name, tool_def) for every function declared in node tools.yaml files."""
+    for node_name, node_data in nodes.items():
+        tools = node_data.get("tools")
+        if not tools:
+            continue
+        for tool in (tools if isinstance(tools, list) else [tools]):
+            if isinstance(tool, dict) and tool.get("name"):
+                yield node_name, tool
+
+
+def parse_cache_policy(tool: dict) -> Optional[CachePolicy]:
+    """Build a CachePolicy from a tools.yaml entry, or None if not cacheable.
+    Raises ValueError for a `cache` value that is not true, a duration or a mapping."""
+    spec = tool.get("cache")
+    if not spec:
+        return None
+    if spec is True:
+        spec = {}
+    elif not isinstance(spec, dict):
+        if parse_duration(spec) is None:
+            raise ValueError(f"tool '{tool['name']}': cache must be true, a duration (e.g. 5m) "
+                             f"or a mapping, got {spec!r}")
+        spec = {"ttl": spec}
+    if spec.get("enabled") is False:
+        return None
+    ttl = parse_duration(spec.get("ttl"))
+    if spec.get("ttl") is not None and ttl is None:
+        raise ValueError(f"tool '{tool['name']}': cache ttl {spec['ttl']!r} is not a duration (e.g. 5m)")
+
+    key = spec.get("key")
+    if isinstance(key, str):
+        key = [k.strip() for k in key.split(",") if k.strip()]
+
+    defaults = {
+        name: param["default"]
+        for name, param in (tool.get("parameters") or {}).items()
+        if isinstance(param, dict) and "default" in param
+    }
+    return CachePolicy(
+        tool=tool["name"],
+        ttl=ttl,
+        key_fields=tuple(key) if key else None,
+        defaults=defaults,
+    )
+
+
+class ToolCache:
+    """Thread-safe TTL + LRU cache for tool results shared across sessions."""
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.policies = {}
+        self.metrics = {}
+        self._entries = OrderedDict()    # key -> (tool, expires_at, value)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_agent(cls, agent: dict, **kwargs) -> "ToolCache":
+        """Create a cache configured from every tools.yaml in a loaded agent."""
+        return cls.from_tools((tool for _, tool in iter_tool_defs(agent.get("nodes", {}))), **kwargs)
+
+    @classmethod
+    def from_tools(cls, tools, **kwargs) -> "ToolCache":
+        """Create a cache configured from tools.yaml entries (first policy per name wins)."""
+        cache = cls(**kwargs)
+        for tool in tools:
+            policy = parse_cache_policy(tool)
+            if policy and policy.tool not in cache.policies:
+                cache.policies[policy.tool] = policy
+        return cache
+
+    def is_cacheable(self, tool: str) -> bool:
+        return tool in self.policies
+
+    def make_key(self, tool: str, args: dict) -> str:
+        """Canonical key: declared defaults applied, None values dropped,
+        restricted to the policy's key fields, JSON with sorted keys."""
+        policy = self.policies.get(tool)
+        merged = dict(policy.defaults) if policy else {}
+        merged.update(args or {})
+        if policy and policy.key_fields:
+            merged = {k: merged.get(k) for k in policy.key_fields}
+        merged = {k: v for k, v in merged.items() if v is not None}
+        return tool + ":" + json.dumps(merged, sort_keys=True, separators=(",", ":"), default=str)
+
+    def get(self, tool: str, args: dict) -> tuple:
+        """Return (hit, value). Uncacheable tools always miss without counting."""
+        if tool not in self.policies:
+            return False, None
+        key = self.make_key(tool, args)
+        with self._lock:
+            metrics = self.metrics.setdefault(tool, CacheMetrics())
+            entry = self._entries.get(key)
+            if entry is not None:
+                _, expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    metrics.hits += 1
+                    return True, value
+                del self._entries[key]
+                metrics.expirations += 1
+            metrics.misses += 1
+        return False, None
+
+    def put(self, tool: str, args: dict, value) -> None:
+        policy = self.policies.get(tool)
+        if policy is None:
+            return
+        ttl = policy.ttl if policy.ttl is not None else self.default_ttl
+        key = self.make_key(tool, args)
+        with self._lock:
+            self._entries[key] = (tool, self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.metrics.setdefault(evicted, CacheMetrics()).evictions += 1
+
+    def call(self, tool: str, args: dict, fn):
+        """Return the cached result for (tool, args) or call `fn(**args)` and cache it."""
+        hit, value = self.get(tool, args)
+        if hit:
+            return value
+        value = fn(**(args or {}))
+        self.put(tool, args, value)
+        return value
+
+    async def acall(self, tool: str, args: dict, fn):
+        """Async variant of call() for coroutine tool backends."""
+        hit, value = self.get(tool, args)
+        if hit:
+            return value
+        value = await fn(**(args or {}))
+        self.put(tool, args, value)
+        return value
+
+    def invalidate(self, tool: str = None) -> int:
+        """Drop all entries, or only those of one tool. Returns the count removed."""
+        with self._lock:
+            if tool is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            stale = [k for k, entry in self._entries.items() if entry[0] == tool]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = CacheMetrics()
+        for m in self.metrics.values():
+            total.hits += m.hits
+            total.misses += m.misses
+            total.expirations += m.expirations
+            total.evictions += m.evictions
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "total": total.to_dict(),
+            "tools": {name: m.to_dict() for name, m in self.metrics.items()},
+        }
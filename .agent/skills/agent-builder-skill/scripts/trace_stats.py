@@ -0,0 +1,337 @@
+"""
+Trace Analytics
+
+Aggregates recorded execution traces into per-node and per-edge statistics
+and overlays them onto the parsed AgentGraph.
+
+Traces are the JSONL files written by the agent runtime into
+`<agent-dir>/.agent-sessions/<session>.trace.jsonl`, one event per line:
+
+    {"action": "enter", "node": "classify", "iteration": 1, "ts": "..."}
+    {"action": "complete", "node": "classify", "ts": "..."}
+    {"action": "route", "from": "classify", "to": "kb_search", "ts": "..."}
+
+Events are loaded once into flat NumPy columns (session, action, node, ts)
+and every statistic is computed with array operations over those columns,
+so a million-event trace set aggregates in a few seconds.
+"""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for trace analytics
+    np = None
+
+from parser import AgentGraph
+
+
+ACTIONS = ["enter", "complete", "route", "retry", "error", "iteration_limit"]
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+OTHER_ACTION = len(ACTIONS)
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class TraceColumns:
+    """Columnar view of a trace set. Row i is the i-th event in file order."""
+    session: "np.ndarray"          # int32 index into `sessions`
+    action: "np.ndarray"           # int8 code from ACTION_CODES
+    node: "np.ndarray"             # int32 index into `node_names` (-1 if none)
+    target: "np.ndarray"           # int32 index into `node_names` (route events)
+    ts: "np.ndarray"               # float64 seconds (NaN if missing or unparseable)
+    node_names: list = field(default_factory=list)
+    sessions: list = field(default_factory=list)
+    bad_timestamps: int = 0        # events whose `ts` could not be parsed
+
+    def __len__(self):
+        return len(self.action)
+
+
+@dataclass
+class TraceStats:
+    sessions: int = 0
+    events: int = 0
+    bad_timestamps: int = 0
+    nodes: dict = field(default_factory=dict)        # node_id -> stats dict
+    edges: list = field(default_factory=list)        # list of edge stats dicts
+    loops: dict = field(default_factory=dict)        # node_id -> {iterations: sessions}
+
+    def to_dict(self):
+        return {
+            "sessions": self.sessions,
+            "events": self.events,
+            "bad_timestamps": self.bad_timestamps,
+            "nodes": self.nodes,
+            "edges": self.edges,
+            "loops": self.loops,
+        }
+
+    def edge_probability(self, source: str, target: str) -> float:
+        for e in self.edges:
+            if e["source"] == source and e["target"] == target:
+                return e["probability"]
+        return 0.0
+
+    def hot_nodes(self) -> list:
+        """Node IDs ordered by visit count, most visited first."""
+        return sorted(self.nodes, key=lambda n: -self.nodes[n]["visits"])
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Trace analytics require numpy: pip install numpy")
+
+
+def find_trace_files(path: str) -> list:
+    """Resolve an agent directory, a trace directory or a single file to
+    trace files (`*.trace.jsonl`; other JSONL files are not traces)."""
+    p = Path(path)
+    if p.is_file():
+        return [p]
+    sessions_dir = p / ".agent-sessions"
+    if sessions_dir.is_dir():
+        p = sessions_dir
+    return sorted(p.rglob("*.trace.jsonl"))
+
+
+def load_trace_columns(files: list) -> TraceColumns:
+    """Parse trace files into flat columns. Each file is a session unless
+    its events carry an explicit `session_id`."""
+    _require_numpy()
+    node_index = {}
+    session_index = {}
+    sessions, actions, nodes, targets, stamps = [], [], [], [], []
+
+    def intern(name):
+        if name is None:
+            return -1
+        idx = node_index.get(name)
+        if idx is None:
+            idx = node_index[name] = len(node_index)
+        return idx
+
+    for path in files:
+        default_session = str(path)
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                sid = event.get("session_id", default_session)
+                s = session_index.get(sid)
+                if s is None:
+                    s = session_index[sid] = len(session_index)
+
+                action = event.get("action")
+                sessions.append(s)
+                actions.append(ACTION_CODES.get(action, OTHER_ACTION))
+                if action == "route":
+                    nodes.append(intern(event.get("from")))
+                    targets.append(intern(event.get("to")))
+                else:
+                    nodes.append(intern(event.get("node")))
+                    targets.append(-1)
+                stamps.append(event.get("ts"))
+
+    ts, bad = _to_seconds(stamps)
+    return TraceColumns(
+        session=np.asarray(sessions, dtype=np.int32),
+        action=np.asarray(actions, dtype=np.int8),
+        node=np.asarray(nodes, dtype=np.int32),
+        target=np.asarray(targets, dtype=np.int32),
+        ts=ts,
+        node_names=list(node_index),
+        sessions=list(session_index),
+        bad_timestamps=bad,
+    )
+
+
+def _to_seconds(stamps: list) -> tuple:
+    """Convert ISO-8601 strings or epoch numbers to float seconds.
+
+    Returns (seconds, bad): missing stamps are NaN, and so are the `bad`
+    ones that are present but not a number or a parseable timestamp.
+    """
+    out = np.full(len(stamps), np.nan, dtype=np.float64)
+    bad = 0
+    iso_idx, iso_vals = [], []
+    for i, v in enumerate(stamps):
+        if v is None:
+            continue
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[i] = v
+        elif isinstance(v, str) and v:
+            iso_idx.append(i)
+            # numpy parses naive ISO timestamps; traces are written in UTC
+            iso_vals.append(v[:-1] if v.endswith("Z") else v)
+        else:
+            bad += 1
+    if iso_vals:
+        try:
+            parsed = np.array(iso_vals, dtype="datetime64[us]").astype(np.int64) / 1e6
+        except ValueError:
+            # One bad string fails the batch; parse one by one to find it
+            parsed = np.full(len(iso_vals), np.nan)
+            for j, v in enumerate(iso_vals):
+                try:
+                    parsed[j] = np.datetime64(v, "us").astype(np.int64) / 1e6
+                except ValueError:
+                    bad += 1
+        out[np.asarray(iso_idx)] = parsed
+    return out, bad
+
+
+def compute_stats(cols: TraceColumns) -> TraceStats:
+    """Aggregate columns into visit counts, edge probabilities, duration
+    percentiles, retry rates and loop iteration distributions."""
+    _require_numpy()
+    stats = TraceStats(sessions=len(cols.sessions), events=len(cols), bad_timestamps=cols.bad_timestamps)
+    n_nodes = len(cols.node_names)
+    if n_nodes == 0:
+        return stats
+
+    # Group events by session while keeping file order within a session
+    order = np.argsort(cols.session, kind="stable")
+    session = cols.session[order]
+    action = cols.action[order]
+    node = cols.node[order]
+    ts = cols.ts[order]
+
+    # An enter without a node cannot be attributed to one
+    enter = (action == ACTION_CODES["enter"]) & (node >= 0)
+    e_session, e_node = session[enter], node[enter]
+    visits = np.bincount(e_node, minlength=n_nodes)
+
+    # Sessions that visited each node at least once
+    pair = np.unique(e_session.astype(np.int64) * n_nodes + e_node)
+    session_reach = np.bincount(pair % n_nodes, minlength=n_nodes)
+
+    # Transitions: consecutive enters within the same session
+    same = e_session[:-1] == e_session[1:]
+    src, dst = e_node[:-1][same], e_node[1:][same]
+    codes, counts = np.unique(src.astype(np.int64) * n_nodes + dst, return_counts=True)
+    out_total = np.bincount(src, minlength=n_nodes)
+
+    # Durations: from an enter to the next enter/complete in the same session
+    timed = enter | (action == ACTION_CODES["complete"])
+    t_session, t_node, t_ts, t_enter = session[timed], node[timed], ts[timed], enter[timed]
+    starts = t_enter[:-1] & (t_session[:-1] == t_session[1:])
+    durations = (t_ts[1:] - t_ts[:-1])[starts]
+    d_node = t_node[:-1][starts]
+    valid = ~np.isnan(durations)
+    durations, d_node = durations[valid], d_node[valid]
+
+    # Retries: the host's retry events (a self-loop re-entry is a new visit, not a retry)
+    retries = np.bincount(node[(action == ACTION_CODES["retry"]) & (node >= 0)], minlength=n_nodes)
+
+    percentiles = _grouped_percentiles(d_node, durations, n_nodes)
+
+    for idx, name in enumerate(cols.node_names):
+        if visits[idx] == 0:
+            continue
+        p = percentiles.get(idx)
+        stats.nodes[name] = {
+            "visits": int(visits[idx]),
+            "sessions": int(session_reach[idx]),
+            "session_rate": round(float(session_reach[idx]) / max(stats.sessions, 1), 4),
+            "retries": int(retries[idx]),
+            "retry_rate": round(float(retries[idx]) / float(visits[idx]), 4),
+            "p50_ms": p[0] if p else None,
+            "p95_ms": p[1] if p else None,
+            "p99_ms": p[2] if p else None,
+        }
+
+    for code, count in zip(codes.tolist(), counts.tolist()):
+        s, t = divmod(code, n_nodes)
+        stats.edges.append({
+            "source": cols.node_names[s],
+            "target": cols.node_names[t],
+            "count": int(count),
+            "probability": round(count / int(out_total[s]), 4),
+        })
+    stats.edges.sort(key=lambda e: -e["count"])
+
+    # Loop iteration distribution: enters per (session, node), histogrammed per node
+    pairs, per_pair = np.unique(e_session.astype(np.int64) * n_nodes + e_node, return_counts=True)
+    looping = per_pair > 1
+    for idx in np.unique(pairs[looping] % n_nodes).tolist():
+        iterations, freq = np.unique(per_pair[pairs % n_nodes == idx], return_counts=True)
+        stats.loops[cols.node_names[idx]] = {int(i): int(f) for i, f in zip(iterations, freq)}
+
+    return stats
+
+
+def _grouped_percentiles(groups, values, n_groups: int) -> dict:
+    """p50/p95/p99 (ms) of `values` per group id, via one sort and splits."""
+    if len(values) == 0:
+        return {}
+    order = np.argsort(groups, kind="stable")
+    groups, values = groups[order], values[order] * 1000.0
+    bounds = np.flatnonzero(np.diff(groups)) + 1
+    result = {}
+    for chunk_groups, chunk in zip(np.split(groups, bounds), np.split(values, bounds)):
+        pct = np.percentile(chunk, PERCENTILES)
+        result[int(chunk_groups[0])] = [round(float(v), 1) for v in pct]
+    return result
+
+
+def overlay(stats: TraceStats, graph: AgentGraph) -> dict:
+    """Project trace statistics onto the graph: every graph node and edge gets
+    an entry (zero when never observed), and observed transitions that are
+    not edges in the graph are reported separately."""
+    empty = {"visits": 0, "sessions": 0, "session_rate": 0.0, "retries": 0,
+             "retry_rate": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    nodes = {nid: dict(stats.nodes.get(nid, empty)) for nid in graph.nodes}
+
+    observed = {(e["source"], e["target"]): e for e in stats.edges}
+    edges = []
+    declared = set()
+    for edge in graph.edges:
+        key = (edge.source, edge.target)
+        if key in declared:
+            continue
+        declared.add(key)
+        seen = observed.get(key, {})
+        edges.append({
+            "source": edge.source,
+            "target": edge.target,
+            "condition": edge.condition,
+            "count": seen.get("count", 0),
+            "probability": seen.get("probability", 0.0),
+        })
+
+    unexpected = [e for key, e in observed.items()
+                  if key not in declared and key[0] != key[1]]
+
+    return {
+        "sessions": stats.sessions,
+        "events": stats.events,
+        "bad_timestamps": stats.bad_timestamps,
+        "nodes": nodes,
+        "edges": edges,
+        "loops": stats.loops,
+        "unexpected_transitions": unexpected,
+        "unknown_nodes": sorted(set(stats.nodes) - set(graph.nodes)),
+    }
+
+
+def load_stats(path: str) -> TraceStats:
+    """Find, load and aggregate all traces under `path`."""
+    return compute_stats(load_trace_columns(find_trace_files(path)))
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        print(json.dumps(load_stats(sys.argv[1]).to_dict(), indent=2))
+    else:
+        print("Usage: python trace_stats.py <agent-or-trace-directory>")
@@ -0,0 +1,261 @@
+"""
+Precompiled Payload Validators
+
+Compiles the schemas declared by an agent — tool `parameters` in
+tools.yaml and `input_schema` / `output_schema` in agent-config.yaml — into
+validator objects once, so each check is a chain of plain closures rather
+than a walk over the schema dict.
+
+Supported keywords (the JSON-Schema subset the DSL uses): type, enum,
+required, properties, additionalProperties, items, default, minimum,
+maximum, minLength, maxLength, pattern. Tool parameters are optional unless
+they declare `required: true`.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from tool_cache import iter_tool_defs
+
+
+class ValidationError(ValueError):
+    """Raised when a payload does not match its schema."""
+
+    def __init__(self, name: str, errors: list):
+        self.name = name
+        self.errors = errors
+        super().__init__(f"{name}: " + "; ".join(errors))
+
+
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "null": lambda v: v is None,
+}
+
+
+def _compile(schema: dict, path: str):
+    """Compile a schema into `check(value, errors)` that appends error strings."""
+    if not isinstance(schema, dict):
+        return lambda value, errors: None
+
+    checks = []
+
+    types = schema.get("type")
+    if types:
+        names = types if isinstance(types, list) else [types]
+        type_fns = [_TYPE_CHECKS[t] for t in names if t in _TYPE_CHECKS]
+        if type_fns:
+            expected = " | ".join(names)
+
+            def check_type(value, errors, type_fns=type_fns, expected=expected):
+                if not any(fn(value) for fn in type_fns):
+                    errors.append(f"{path or '$'}: expected {expected}, got {type(value).__name__}")
+                    return False
+                return True
+            checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+        allowed_set = {repr(a) for a in allowed}
+
+        def check_enum(value, errors):
+            if repr(value) not in allowed_set:
+                errors.append(f"{path or '$'}: {value!r} not in {allowed}")
+        checks.append(check_enum)
+
+    for key, op, message in (("minimum", lambda v, b: v >= b, "below minimum"),
+                             ("maximum", lambda v, b: v <= b, "above maximum")):
+        if key in schema:
+            bound = schema[key]
+
+            def check_bound(value, errors, bound=bound, op=op, message=message):
+                if _TYPE_CHECKS["number"](value) and not op(value, bound):
+                    errors.append(f"{path or '$'}: {value} {message} {bound}")
+            checks.append(check_bound)
+
+    for key, op, message in (("minLength", lambda n, b: n >= b, "shorter than"),
+                             ("maxLength", lambda n, b: n <= b, "longer than")):
+        if key in schema:
+            bound = schema[key]
+
+            def check_length(value, errors, bound=bound, op=op, message=message):
+                if isinstance(value, str) and not op(len(value), bound):
+                    errors.append(f"{path or '$'}: {message} {bound} characters")
+            checks.append(check_length)
+
+    if "pattern" in schema:
+        pattern = re.compile(schema["pattern"])
+
+        def check_pattern(value, errors):
+            if isinstance(value, str) and not pattern.search(value):
+                errors.append(f"{path or '$'}: does not match /{pattern.pattern}/")
+        checks.append(check_pattern)
+
+    properties = schema.get("properties")
+    # `required` lists names on an object; tools.yaml also writes `required: true` on a property
+    listed = schema.get("required")
+    required = tuple(listed) if isinstance(listed, (list, tuple)) else ()
+    required += tuple(name for name, sub in (properties or {}).items()
+                      if isinstance(sub, dict) and sub.get("required") is True and name not in required)
+    additional = schema.get("additionalProperties", True)
+    if properties or required or additional is False:
+        props = {name: _compile(sub, f"{path}.{name}" if path else name)
+                 for name, sub in (properties or {}).items()}
+
+        def check_object(value, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if value.get(name) is None:
+                    errors.append(f"{path + '.' if path else ''}{name}: required")
+            for name, item in value.items():
+                fn = props.get(name)
+                if fn is not None:
+                    if item is not None:
+                        fn(item, errors)
+                elif additional is False:
+                    errors.append(f"{path + '.' if path else ''}{name}: unexpected field")
+        checks.append(check_object)
+
+    if isinstance(schema.get("items"), dict):
+        item_check = _compile(schema["items"], f"{path}[]")
+
+        def check_items(value, errors):
+            if isinstance(value, list):
+                for item in value:
+                    item_check(item, errors)
+        checks.append(check_items)
+
+    def check(value, errors):
+        for fn in checks:
+            # A failed type check makes the remaining checks meaningless
+            if fn(value, errors) is False:
+                return
+    return check
+
+
+def tool_parameters_schema(tool: dict) -> dict:
+    """Object schema for a tools.yaml `parameters` block."""
+    params = tool.get("parameters") or {}
+    return {
+        "type": "object",
+        "properties": params,
+        "required": [name for name, p in params.items() if isinstance(p, dict) and p.get("required") is True],
+    }
+
+
+@dataclass
+class Validator:
+    """A compiled schema. Build with Validator.compile()."""
+    name: str
+    schema: dict
+    _check: object = field(default=None, repr=False)
+    _defaults: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def compile(cls, name: str, schema: dict) -> "Validator":
+        schema = schema or {}
+        defaults = {
+            key: sub["default"]
+            for key, sub in (schema.get("properties") or {}).items()
+            if isinstance(sub, dict) and "default" in sub
+        }
+        return cls(name=name, schema=schema, _check=_compile(schema, ""), _defaults=defaults)
+
+    def errors(self, payload) -> list:
+        errors = []
+        self._check(payload, errors)
+        return errors
+
+    def is_valid(self, payload) -> bool:
+        return not self.errors(payload)
+
+    def apply_defaults(self, payload: dict) -> dict:
+        """Return a copy of `payload` with declared defaults filled in."""
+        if not self._defaults or not isinstance(payload, dict):
+            return payload
+        merged = dict(self._defaults)
+        merged.update({k: v for k, v in payload.items() if v is not None})
+        return merged
+
+    def check(self, payload) -> dict:
+        """Apply defaults and validate; raise ValidationError on failure."""
+        payload = self.apply_defaults(payload)
+        errors = self.errors(payload)
+        if errors:
+            raise ValidationError(self.name, errors)
+        return payload
+
+    def validate_many(self, payloads) -> list:
+        """Validate each payload in turn; returns [(index, errors)] for the invalid ones."""
+        check = self._check
+        failures = []
+        for i, payload in enumerate(payloads):
+            errors = []
+            check(self.apply_defaults(payload), errors)
+            if errors:
+                failures.append((i, errors))
+        return failures
+
+
+@dataclass
+class AgentValidators:
+    input: Optional[Validator] = None
+    output: Optional[Validator] = None
+    tools: dict = field(default_factory=dict)      # tool name -> Validator
+
+    @classmethod
+    def from_agent(cls, agent: dict) -> "AgentValidators":
+        """Compile all schemas of a loaded agent (see parser.load_agent)."""
+        config = agent.get("config") or {}
+        validators = cls()
+        if config.get("input_schema"):
+            validators.input = Validator.compile("input", config["input_schema"])
+        if config.get("output_schema"):
+            validators.output = Validator.compile("output", config["output_schema"])
+        for _, tool in iter_tool_defs(agent.get("nodes", {})):
+            if tool.get("type", "function") == "function" and tool["name"] not in validators.tools:
+                validators.tools[tool["name"]] = Validator.compile(
+                    f"tool {tool['name']}", tool_parameters_schema(tool))
+        return validators
+
+    def check_input(self, payload: dict) -> dict:
+        return self.input.check(payload) if self.input else payload
+
+    def check_output(self, payload: dict) -> dict:
+        return self.output.check(payload) if self.output else payload
+
+    def check_tool_args(self, tool: str, args: dict) -> dict:
+        validator = self.tools.get(tool)
+        return validator.check(args) if validator else args
+
+
+def schema_problems(name: str, schema: dict) -> list:
+    """Static checks on a schema: unknown types and defaults that violate it."""
+    problems = []
+    if not isinstance(schema, dict):
+        return [f"{name}: schema is not a mapping"]
+
+    def walk(sub, path):
+        if not isinstance(sub, dict):
+            return
+        types = sub.get("type")
+        for t in (types if isinstance(types, list) else [types] if types else []):
+            if t not in _TYPE_CHECKS:
+                problems.append(f"{name} {path or '$'}: unknown type '{t}'")
+        if "default" in sub:
+            errors = []
+            _compile({k: v for k, v in sub.items() if k != "default"}, path)(sub["default"], errors)
+            problems.extend(f"{name} default {e}" for e in errors)
+        for key, prop in (sub.get("properties") or {}).items():
+            walk(prop, f"{path}.{key}" if path else key)
+        walk(sub.get("items"), f"{path}[]")
+
+    walk(schema, "")
+    return problems
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+SKILL_DIR = Path(__file__).resolve().parents[1]
+REPO_ROOT = SKILL_DIR.parents[2]
+
+# The scripts are flat modules that import each other by name
+sys.path.insert(0, str(SKILL_DIR / "scripts"))
+
+
+@pytest.fixture
+def travel_agent_dir():
+    return REPO_ROOT / "agents" / "travel-support"
+
+
+@pytest.fixture
+def research_agent_dir():
+    return SKILL_DIR / "references" / "examples" / "research-agent"
@@ -0,0 +1,55 @@
+import inspect
+import sys
+
+import pytest
+
+import agent_cli
+from agent_cli import BOOLEAN_FLAGS, _split_args
+
+
+def run_cli(monkeypatch, capsys, name, fake, *argv):
+    """Run main() with the command function `cmd_<name>` replaced by `fake`."""
+    monkeypatch.setattr(agent_cli, f"cmd_{name}", fake)
+    monkeypatch.setattr(sys, "argv", ["agent_cli.py", *argv])
+    agent_cli.main()
+    return capsys.readouterr().out
+
+
+def test_options_are_passed_by_name(monkeypatch, capsys):
+    calls = []
+    run_cli(monkeypatch, capsys, "stats", lambda agent_dir, traces=None, out=None: calls.append((agent_dir, traces, out)),
+            "stats", "agents/x", "--out", "report.json", "--traces", "runs")
+    assert calls == [("agents/x", "runs", "report.json")]
+
+
+@pytest.mark.parametrize("argv, message", [
+    (("stats", "agents/x", "--bogus", "1"), "Unknown option --bogus"),
+    (("stats", "agents/x", "agents/y"), "Unexpected argument: agents/y"),
+    (("stats", "agents/x", "--traces"), "--traces needs a value"),
+])
+def test_bad_arguments_print_usage(monkeypatch, capsys, argv, message):
+    calls = []
+    out = run_cli(monkeypatch, capsys, "stats", lambda agent_dir, traces=None, out=None: calls.append(agent_dir), *argv)
+    assert not calls
+    assert message in out and "Usage: python agent_cli.py stats" in out
+
+
+def test_split_args():
+    assert _split_args(["a", "--seed", "-1", "--hedge", "b"], {"hedge"}) == (["a", "b"], {"seed": "-1", "hedge": True})
+    with pytest.raises(ValueError):
+        _split_args(["a", "--hedge"])
+
+
+def test_boolean_flags_are_parameters_of_their_commands():
+    for cmd, flags in BOOLEAN_FLAGS.items():
+        func = getattr(agent_cli, "cmd_" + cmd.replace("-", "_"))
+        assert flags <= set(inspect.signature(func).parameters), cmd
+
+
+def test_boolean_flag_does_not_swallow_the_next_argument(monkeypatch, capsys):
+    calls = []
+    run_cli(monkeypatch, capsys, "compile",
+            lambda agent_dir, profile=None, cold=None, flatten=None, merge_chains=None:
+            calls.append((agent_dir, profile, flatten, merge_chains)),
+            "compile", "--flatten", "agents/x", "--profile", "runs")
+    assert calls == [("agents/x", "runs", True, None)]
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import batch_run
+from batch_run import BatchRun, completed_ids
+from execution_host import CompiledAgent
+from loadtest import LoadTest, StubConfig
+
+REVIEWED = {"clarity": 0.9, "quality": 0.9, "report": "Findings.", "citations": ["[1]"],
+            "confidence": 0.8, "approved": True}
+
+
+async def handler(session, node, inputs):
+    return {**inputs, **REVIEWED}
+
+
+def write_inputs(path, n=6):
+    lines = [json.dumps({"id": f"r{i}", "query": f"question {i}"}) for i in range(n)]
+    lines += [json.dumps({"id": "r0", "query": "duplicate"}), "{not json", json.dumps({"id": "bad", "depth": "deep"})]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def batch(agent_dir, **options):
+    return BatchRun(CompiledAgent.from_dir(str(agent_dir)), handler, workers=3, **options)
+
+
+def read_results(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_batch_writes_one_result_per_record(research_agent_dir, tmp_path):
+    inputs, output = tmp_path / "inputs.jsonl", tmp_path / "out" / "results.jsonl"
+    write_inputs(inputs)
+    report = asyncio.run(batch(research_agent_dir).run(str(inputs), str(output)))
+
+    results = {r["id"]: r for r in read_results(output)}
+    assert report["records"] == 8 and report["duplicates"] == 1
+    assert report["statuses"] == {"done": 6, "invalid": 2}
+    assert results["r3"]["output"] == {"report": "Findings.", "citations": ["[1]"]}
+    intake = next(e for e in results["r3"]["trace"] if e["action"] == "enter" and e["node"] == "intake")
+    assert intake["input_data"] == {"query": "question 3", "depth": "standard", "format": "report"}
+    assert results["bad"]["errors"] == ["query: required"]
+    assert results["line:8"]["errors"][0].startswith("invalid JSON")
+
+
+def test_line_number_keys_do_not_collide_with_ids(research_agent_dir, tmp_path):
+    inputs, output = tmp_path / "inputs.jsonl", tmp_path / "results.jsonl"
+    inputs.write_text(json.dumps({"query": "no id"}) + "\n" + json.dumps({"id": "1", "query": "id one"}) + "\n")
+    report = asyncio.run(batch(research_agent_dir).run(str(inputs), str(output)))
+    assert report["duplicates"] == 0
+    assert sorted(r["id"] for r in read_results(output)) == ["1", "line:1"]
+
+
+def test_latency_reservoir_stays_bounded(research_agent_dir, monkeypatch):
+    monkeypatch.setattr(batch_run, "LATENCY_SAMPLES", 10)
+    run = batch(research_agent_dir)
+    for ms in range(1, 101):
+        run._count({"status": "done", "elapsed_ms": ms * 1000.0})
+    assert len(run.latencies) == 10 and run.statuses == {"done": 100}
+    assert run.latency_summary()["mean"] == 50.5
+
+
+def test_resume_skips_finished_records_and_cuts_a_torn_line(research_agent_dir, tmp_path):
+    inputs, output = tmp_path / "inputs.jsonl", tmp_path / "results.jsonl"
+    write_inputs(inputs)
+    asyncio.run(batch(research_agent_dir, traces=False).run(str(inputs), str(output)))
+    lines = output.read_text().splitlines(keepends=True)
+    output.write_text("".join(lines[:3]) + lines[3][:20])
+    kept = {json.loads(line)["id"] for line in lines[:3]}
+
+    assert completed_ids(str(output)) == kept
+    assert output.read_text() == "".join(lines[:3])
+
+    report = asyncio.run(batch(research_agent_dir, traces=False).run(str(inputs), str(output)))
+    assert report["records"] == 5
+    assert report["resumed"] == 3 + ("r0" in kept)        # the duplicate r0 line is skipped too
+    ids = [r["id"] for r in read_results(output)]
+    assert sorted(ids) == sorted({r["id"] for r in map(json.loads, lines)})
+
+
+def test_stub_without_samples_keeps_no_latency_lists(travel_agent_dir):
+    stub = LoadTest(CompiledAgent.from_dir(str(travel_agent_dir)), StubConfig(), time_scale=1e-4,
+                    record_samples=False)
+
+    async def go():
+        for i in range(5):
+            await stub.host.start({"message": f"my booking {i} needs new dates"})
+
+    asyncio.run(go())
+    assert sum(stub.backend.calls.values()) > 0
+    assert stub.node_queue == {} and stub.node_service == {} and stub.backend.queue == {}
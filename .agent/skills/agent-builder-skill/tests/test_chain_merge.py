@@ -0,0 +1,89 @@
+from chain_merge import MergeReport, expand_events, find_chains, merge_chains
+from parser import load_agent, parse_mermaid
+
+PIPELINE = '''```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    a["A
+    @type: executor
+    @model: m1"]
+    t["Reshape
+    @type: transformer"]
+    b["B
+    @type: executor
+    @model: m1"]
+    c["C
+    @type: executor
+    @model: m2"]
+    d["D
+    @type: executor
+    @model: m2"]
+    e["E
+    @type: executor
+    @model: m2"]
+    oops["Apologize
+    @type: executor"]
+    end_(("END
+    @type: terminal"))
+    start --> a
+    a -->|"@pass: x"| t
+    t --> b
+    b --> c
+    c --> d
+    d -->|"@cond: x > 1"| e
+    e --> end_
+    a -->|"@on_error: true"| oops
+    t -->|"@on_error: true"| oops
+    b -->|"@on_error: true"| oops
+    c -->|"@on_error: true"| oops
+    d -->|"@on_error: true"| oops
+    oops --> end_
+```'''
+
+
+def test_chains_split_on_model_and_stop_at_conditions():
+    graph = parse_mermaid(PIPELINE)
+    assert find_chains(graph) == [["a", "t", "b"], ["c", "d"]]
+
+    report = MergeReport()
+    merged = merge_chains({"graph": graph, "nodes": {"a": {"instructions": "Do A."}}}, report)
+    nodes, edges = merged["graph"].nodes, [(e.source, e.target, e.condition, e.on_error)
+                                           for e in merged["graph"].edges]
+    assert report.chains == {"a+t+b": ["a", "t", "b"], "c+d": ["c", "d"]}
+    assert nodes["a+t+b"].model == "m1" and nodes["c+d"].model == "m2"
+    assert ("start", "a+t+b", None, False) in edges
+    assert ("a+t+b", "c+d", None, False) in edges
+    assert ("c+d", "e", "x > 1", False) in edges
+    assert edges.count(("a+t+b", "oops", None, True)) == 1
+    assert edges.count(("c+d", "oops", None, True)) == 1
+    assert not any(n in ("a", "t", "b", "c", "d") for edge in edges for n in edge[:2])
+    data = merged["nodes"]["a+t+b"]
+    assert data["steps"] == ["a", "t", "b"]
+    assert "#### Step 1: A (`a`)\n\nDo A." in data["instructions"]
+    assert "Carry `x` into step 2." in data["instructions"]
+
+
+def test_research_agent_merges_analyze_and_synthesize(research_agent_dir):
+    merged = merge_chains(load_agent(str(research_agent_dir)), report := MergeReport())
+    assert report.chains == {"analyze+synthesize": ["analyze", "synthesize"]}
+    loops = [e for e in merged["graph"].edges if e.source == "review" and e.target == "analyze+synthesize"]
+    assert loops and loops[0].condition == "quality < threshold AND iterations < max"
+    assert report.nodes_after == report.nodes_before - 1
+
+
+def test_expand_events_restores_member_ids():
+    chains = {"a+t+b": ["a", "t", "b"]}
+    events = [
+        {"action": "route", "from": "start", "to": "a+t+b"},
+        {"action": "enter", "node": "a+t+b", "iteration": 1},
+        {"action": "complete", "node": "a+t+b", "output_data": {"y": 1}},
+        {"action": "route", "from": "a+t+b", "to": "c"},
+    ]
+    expanded = [(e["action"], e.get("node") or (e["from"], e["to"])) for e in expand_events(events, chains)]
+    assert expanded == [
+        ("route", ("start", "a")), ("enter", "a"), ("complete", "a"),
+        ("route", ("a", "t")), ("enter", "t"), ("complete", "t"),
+        ("route", ("t", "b")), ("enter", "b"), ("complete", "b"),
+        ("route", ("b", "c")),
+    ]
@@ -0,0 +1,56 @@
+import sqlite3
+import time
+
+import pytest
+
+from checkpoint_store import CheckpointStore
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_transitions_survive_reopening(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    with CheckpointStore(path) as store:
+        store.transition("s-1", node="classify", status="running", context={"intent": "refund"},
+                         iterations={"classify": 1}, agent="travel")
+        store.transition("s-1", node="escalate", status="waiting", removed=("intent",),
+                         context={"reason": "refund > 500"})
+    with CheckpointStore(path) as store:
+        state = store.load("s-1")
+        assert (state.current_node, state.status) == ("escalate", "waiting")
+        assert state.context == {"reason": "refund > 500"}
+        assert state.iterations == {"classify": 1}
+        assert store.sessions("waiting") == ["s-1"]
+
+
+def test_background_flush_failure_is_raised_and_the_batch_kept(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    store = CheckpointStore(path, flush_interval=0.01)
+    write, failures = store._write, []
+
+    def failing_once(batch):
+        if not failures:
+            failures.append(batch)
+            raise sqlite3.OperationalError("disk I/O error")
+        write(batch)
+
+    store._write = failing_once
+    store.transition("s-1", node="intake", status="running", context={"message": "hi"})
+    wait_for(lambda: store._error is not None)
+
+    with pytest.raises(sqlite3.OperationalError, match="disk I/O error"):
+        store.transition("s-1", context={"intent": "refund"})
+    assert store._thread.is_alive()
+
+    store.transition("s-1", node="classify", context={"intent": "refund"})
+    store.flush()
+    store.close()
+    with CheckpointStore(path) as reopened:
+        state = reopened.load("s-1")
+    assert state.current_node == "classify"
+    assert state.context == {"message": "hi", "intent": "refund"}
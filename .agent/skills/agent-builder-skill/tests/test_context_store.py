@@ -0,0 +1,56 @@
+import pickle
+import random
+
+import pytest
+
+from context_store import SMALL_CONTEXT, Context, merge_branches
+
+
+@pytest.mark.parametrize("size", [5, 3000])
+def test_writes_leave_snapshots_untouched(size):
+    data = {f"k{i}": i for i in range(size)}
+    base = Context(data)
+    changed = base.updated({"k1": -1, "new": "x"}).without(["k2"])
+
+    assert base.to_dict() == data
+    assert changed["k1"] == -1 and changed["new"] == "x" and "k2" not in changed
+    assert len(changed) == size
+    diff = base.diff(changed)
+    assert (diff.added, diff.changed, diff.removed) == ({"new": "x"}, {"k1": -1}, ["k2"])
+    assert diff.apply(base).to_dict() == changed.to_dict()
+    assert not base.diff(base)
+    assert pickle.loads(pickle.dumps(changed)).to_dict() == changed.to_dict()
+
+
+def test_matches_a_dict_under_random_edits():
+    rng = random.Random(7)
+    expected, context = {}, Context()
+    for _ in range(5000):
+        key = rng.randrange(SMALL_CONTEXT * 40)
+        if rng.random() < 0.2:
+            expected.pop(key, None)
+            context = context.without([key])
+        else:
+            expected[key] = rng.random()
+            context = context.set(key, expected[key])
+    assert context.to_dict() == expected and len(context) == len(expected)
+    assert context.pick([1, 2, -1]) == {k: expected[k] for k in (1, 2) if k in expected}
+
+
+def test_merge_strategies():
+    base = Context({"tags": ["a"], "meta": {"n": 1}, "answer": None, "stale": 1})
+    left = base.updated({"tags": ["a", "b"], "meta": {"n": 1, "left": True}, "answer": "yes"})
+    right = base.updated({"tags": ["a", "c"], "meta": {"n": 1, "right": True}, "answer": "no"}).without(["stale"])
+    middle = base.updated({"answer": "no"})
+
+    merged, conflicts = merge_branches(base, [left, right])
+    assert merged.to_dict() == {"tags": ["a", "b", "c"], "meta": {"n": 1, "left": True, "right": True},
+                                "answer": "no"}
+    assert conflicts == ["answer", "meta", "tags"]
+
+    voted, _ = merge_branches(base, [left, right, middle], "vote")
+    assert voted["answer"] == "no"
+    first, conflicts = merge_branches(base, [right, left], "first")
+    assert first is right and conflicts == []
+    with pytest.raises(ValueError):
+        merge_branches(base, [left], "majority")
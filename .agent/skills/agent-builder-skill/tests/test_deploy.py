@@ -0,0 +1,44 @@
+import shutil
+
+from deploy import MANIFEST_FILE, scan_files, sync_tree
+
+
+def test_first_deploy_over_a_plain_copy_removes_stale_files(travel_agent_dir, research_agent_dir, tmp_path):
+    dest = tmp_path / "agent"
+    shutil.copytree(travel_agent_dir, dest)
+    (dest / ".agent-sessions").mkdir(exist_ok=True)
+    (dest / ".agent-sessions" / "s1.json").write_text("{}")
+
+    result = sync_tree(str(research_agent_dir), str(dest))
+
+    deployed = set(scan_files(dest))
+    assert deployed == set(scan_files(research_agent_dir))
+    assert {p.name for p in (dest / "nodes").iterdir()} == {p.name for p in (research_agent_dir / "nodes").iterdir()}
+    assert (dest / ".agent-sessions" / "s1.json").is_file()
+    assert result.removed and result.reload == "full"
+
+
+def test_redeploy_only_touches_what_changed(research_agent_dir, tmp_path):
+    source, dest = tmp_path / "src", tmp_path / "dest"
+    shutil.copytree(research_agent_dir, source)
+    sync_tree(str(source), str(dest))
+    (dest / "notes.txt").write_text("kept: not deployed, manifest present")
+
+    (source / "nodes" / "analyze" / "index.md").write_text("# Analyze\n\nNew instructions.\n")
+    shutil.rmtree(source / "nodes" / "review")
+    result = sync_tree(str(source), str(dest))
+
+    assert result.changed == ["nodes/analyze/index.md"]
+    assert sorted(result.removed) == ["nodes/review/guardrails.yaml", "nodes/review/index.md"]
+    assert result.nodes == ["analyze", "review"] and result.reload == "nodes"
+    assert not (dest / "nodes" / "review").exists()
+    assert (dest / "notes.txt").is_file()
+    assert (dest / MANIFEST_FILE).is_file()
+
+
+def test_skip_dirs_only_apply_at_the_root(tmp_path):
+    (tmp_path / "runs").mkdir()
+    (tmp_path / "runs" / "r.jsonl").write_text("")
+    (tmp_path / "nodes" / "runs").mkdir(parents=True)
+    (tmp_path / "nodes" / "runs" / "index.md").write_text("# Runs\n")
+    assert set(scan_files(tmp_path)) == {"nodes/runs/index.md"}
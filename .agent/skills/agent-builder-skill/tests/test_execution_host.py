@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+
+import execution_host
+from execution_host import CompiledAgent, ExecutionHost, compile_condition
+from parser import parse_mermaid
+
+FLAKY = '''```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    a["A
+    @type: executor
+    @timeout: 50ms
+    @retry: 3"]
+    oops["Apologize
+    @type: executor"]
+    end_(("END
+    @type: terminal"))
+    start --> a
+    a --> end_
+    a -->|"@on_error: true"| oops
+    oops --> end_
+```'''
+
+
+FORK = '''```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    split{{"Split
+    @type: fork"}}
+    a["A
+    @type: executor"]
+    b["B
+    @type: executor"]
+    join{{"Join
+    @type: aggregator"}}
+    end_(("END
+    @type: terminal"))
+    start --> split
+    split --> a
+    split --> b
+    a --> join
+    b --> join
+    join --> end_
+```'''
+
+
+def scripted(outputs):
+    """A handler returning the canned output of each node (empty otherwise)."""
+    async def handler(session, node, inputs):
+        return dict(outputs.get(node.id, {}))
+    return handler
+
+
+def run(agent_dir, outputs, inputs=None):
+    host = ExecutionHost(CompiledAgent.from_dir(str(agent_dir)), scripted(outputs))
+    return asyncio.run(host.start(inputs or {"message": "the hotel room was filthy"}))
+
+
+def complaint(severity, auto_resolvable, **assess):
+    return {
+        "classify": {"intent": "complaint"},
+        "complaint_handler": {"severity": severity},
+        "complaint_assess": {"auto_resolvable": auto_resolvable, **assess},
+    }
+
+
+def test_numeric_and_equality_conditions():
+    check = compile_condition("risk == 'low' AND value < 500")
+    assert check({"risk": "low", "value": 120})
+    assert not check({"risk": "low", "value": 900})
+    assert not check({"risk": "low"})            # None < 500 fails closed
+
+
+@pytest.mark.parametrize("expr", ["severity <= 'medium'", "'medium' > severity", "x < 3 AND tier >= 'gold'"])
+def test_string_ordering_is_left_to_the_model(expr):
+    assert compile_condition(expr) is None
+
+
+def test_keywords_inside_quoted_strings_are_kept():
+    check = compile_condition("status == 'NOT FOUND' AND retry == true")
+    assert check({"status": "NOT FOUND", "retry": True})
+    assert not check({"status": "not FOUND", "retry": True})
+    assert compile_condition('note != "true OR null"')({"note": "True or None"})
+
+
+def test_high_severity_complaint_is_escalated(travel_agent_dir):
+    session = run(travel_agent_dir, complaint("high", True))
+    assert (session.status, session.node) == ("waiting", "escalate")
+
+
+def test_low_severity_complaint_needs_the_models_route(travel_agent_dir):
+    session = run(travel_agent_dir, complaint("low", True))
+    assert session.status == "error"
+    assert "needs the model's routing decision" in session.error
+
+    outputs = complaint("low", True, _route="resolve_complaint", quality=0.95)
+    outputs["draft_response"] = {"response_text": "We have refunded your cleaning fee."}
+    session = run(travel_agent_dir, outputs)
+    assert session.status == "done"
+
+
+def test_delegated_edge_is_marked(travel_agent_dir):
+    agent = CompiledAgent.from_dir(str(travel_agent_dir))
+    edges = {e.target: e for e in agent.nodes["complaint_assess"].edges}
+    assert edges["resolve_complaint"].delegated
+    assert not edges["escalate"].delegated
+
+
+def flaky_host(behaviour, config=None, **options):
+    """A host over FLAKY whose node `a` runs behaviour(attempt) on each call."""
+    agent = CompiledAgent.from_agent({"graph": parse_mermaid(FLAKY), "nodes": {}, "config": config or {},
+                                      "path": "flaky"})
+    calls, events = [], []
+
+    async def handler(session, node, inputs):
+        if node.id != "a":
+            return {"apology": True}
+        calls.append(len(calls) + 1)
+        return await behaviour(len(calls))
+
+    host = ExecutionHost(agent, handler, tracer=lambda sid, event: events.append(event), **options)
+    session = asyncio.run(host.start({"q": 1}))
+    return host, session, calls, [e for e in events if e["action"] in ("retry", "error")]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(execution_host, "RETRY_BACKOFF_BASE", 0.001)
+
+
+def test_retries_after_an_error_and_a_timeout():
+    async def behaviour(attempt):
+        if attempt == 1:
+            raise ConnectionError("reset")
+        await asyncio.sleep(1 if attempt == 2 else 0)
+        return {"answer": attempt}
+
+    _, session, calls, events = flaky_host(behaviour)
+    assert session.status == "done" and session.output == {"answer": 3}
+    assert [(e["action"], e["attempt"], e["error"]) for e in events] == [
+        ("retry", 1, "reset"), ("retry", 2, "'a' timed out after 0.05s")]
+
+
+def test_exhausted_retries_take_the_error_edge():
+    async def behaviour(attempt):
+        await asyncio.sleep(1)
+
+    _, session, calls, events = flaky_host(behaviour)
+    assert calls == [1, 2, 3]
+    assert (events[-1]["action"], events[-1]["error"]) == ("error", "'a' timed out after 0.05s")
+    assert session.status == "done" and session.output == {"apology": True}
+
+
+def test_max_total_time_cancels_the_run():
+    async def behaviour(attempt):
+        await asyncio.sleep(0.04)
+        raise ConnectionError("reset")
+
+    _, session, calls, _ = flaky_host(behaviour, {"execution": {"max_total_time": "60ms"}})
+    assert session.status == "error" and "max_total_time (0.06s)" in session.error
+    assert len(calls) == 2
+
+
+def test_hedged_request_wins_over_a_slow_primary():
+    async def behaviour(attempt):
+        await asyncio.sleep(1 if attempt == 1 else 0)
+        return {"answer": attempt}
+
+    host, session, calls, events = flaky_host(behaviour, hedge=True, hedge_after={"a": 0.01})
+    assert session.output == {"answer": 2} and events == []
+    assert (host.hedges, host.hedge_wins) == (1, 1)
+
+
+def test_failed_fork_branch_cancels_the_others():
+    agent = CompiledAgent.from_agent({"graph": parse_mermaid(FORK), "nodes": {}, "config": {}, "path": "fork"})
+    cancelled = []
+
+    async def handler(session, node, inputs):
+        if node.id == "a":
+            raise ValueError("boom")
+        if node.id == "b":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(node.id)
+                raise
+        return {}
+
+    async def main():
+        session = await ExecutionHost(agent, handler).start({})
+        return session, list(cancelled)
+
+    session, cancelled_before_return = asyncio.run(main())
+    assert session.status == "error" and "boom" in session.error
+    assert cancelled_before_return == ["b"]
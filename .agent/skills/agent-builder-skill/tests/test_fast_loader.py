@@ -0,0 +1,67 @@
+from fast_loader import load_agent_fast, scan_agent_tree
+from parser import LazySubAgent, load_agent, prefetch_subagents
+
+MERMAID = '''```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    runs["Fetch Runs
+    @type: executor"]
+    node_modules["Check Dependencies
+    @type: executor"]
+    done(("DONE
+    @type: terminal"))
+    start --> runs
+    runs --> node_modules
+    node_modules --> done
+```
+'''
+
+
+def make_agent(root):
+    (root / "agent-mermaid.md").write_text(MERMAID)
+    for name in ("runs", "node_modules"):
+        (root / "nodes" / name / "references").mkdir(parents=True)
+        (root / "nodes" / name / "index.md").write_text(f"# {name}\n")
+        (root / "nodes" / name / "references" / "notes.md").write_text("notes\n")
+    (root / "runs").mkdir()
+    (root / "runs" / "trace.jsonl").write_text("{}\n")
+    (root / ".agent-sessions").mkdir()
+
+
+def test_skip_dirs_only_apply_at_the_agent_root(tmp_path):
+    make_agent(tmp_path)
+    tree = scan_agent_tree(str(tmp_path))
+    assert "runs" not in tree.root.dirs and ".agent-sessions" not in tree.root.dirs
+    assert sorted(tree.nodes) == ["node_modules", "runs"]
+    assert sorted(tree.references) == ["node_modules", "runs"]
+
+
+def test_matches_the_reference_loader(tmp_path):
+    make_agent(tmp_path)
+    fast, slow = load_agent_fast(str(tmp_path)), load_agent(str(tmp_path))
+    assert set(fast["nodes"]) == set(slow["nodes"]) == {"runs", "node_modules"}
+    for name, data in slow["nodes"].items():
+        assert fast["nodes"][name]["instructions"] == data["instructions"]
+        assert fast["nodes"][name]["references"] == data["references"]
+
+
+def test_travel_agent_loads_like_the_reference_loader(travel_agent_dir):
+    fast, slow = load_agent_fast(str(travel_agent_dir)), load_agent(str(travel_agent_dir))
+    assert fast["config"] == slow["config"]
+    assert set(fast["nodes"]) == set(slow["nodes"])
+    assert set(fast["graph"].nodes) == set(slow["graph"].nodes)
+
+
+def test_lazy_subagents_load_on_first_access(research_agent_dir):
+    agent = load_agent_fast(str(research_agent_dir), lazy=True)
+    search = agent["nodes"]["search"]["sub_agent"]
+    assert isinstance(search, LazySubAgent) and search and not search.loaded
+
+    assert prefetch_subagents(agent, "start") == []
+    [future] = prefetch_subagents(agent, "intake")
+    future.result()
+    assert search.loaded and prefetch_subagents(agent, "intake") == []
+    eager = load_agent(str(research_agent_dir))["nodes"]["search"]["sub_agent"]
+    assert sorted(search["graph"].nodes) == sorted(eager["graph"].nodes)
+    assert search["config"] == eager["config"]
@@ -0,0 +1,82 @@
+from flatten import FlattenReport, flatten_agent
+from parser import load_agent, parse_mermaid
+
+
+def graph(body):
+    return parse_mermaid("```mermaid\ngraph TD\n" + body + "\n```")
+
+
+def edges_of(flat):
+    return {(e.source, e.target): e for e in flat["graph"].edges}
+
+
+def test_research_agent_search_is_inlined(research_agent_dir):
+    report = FlattenReport()
+    flat = flatten_agent(load_agent(str(research_agent_dir)), report)
+    edges = edges_of(flat)
+
+    assert report.subagents == ["search"]
+    assert report.dropped == ["search: @timeout 60s", "search: @retry 2"]
+    assert "search" not in flat["graph"].nodes and "search__start" not in flat["graph"].nodes
+    assert not any("search" in (e.source, e.target) for e in flat["graph"].edges)
+    # Parent edges into the sub-agent splice onto START's successor, exits onto the parent's edge out
+    assert edges[("intake", "search__fork")].condition == "clarity >= 0.7"
+    assert edges[("intake", "search__fork")].pass_fields == "query, entities, scope"
+    assert ("clarify", "search__fork") in edges
+    assert edges[("search__rank", "analyze")].pass_fields == "sources, excerpts, metadata"
+    assert flat["graph"].nodes["search__merge"].node_type == "aggregator"
+    assert "search" not in flat["nodes"] and "search__rank" in flat["nodes"]
+
+
+def test_nested_subagents_conditions_and_error_routes():
+    inner = {"graph": graph('''
+    start(("START
+    @type: terminal"))
+    fetch["Fetch
+    @type: executor"]
+    done(("DONE
+    @type: terminal"))
+    start -->|"@cond: ready == true"| fetch
+    fetch --> done'''), "nodes": {"fetch": {"instructions": "Fetch it."}}, "config": {}}
+    middle = {"graph": graph('''
+    start(("START
+    @type: terminal"))
+    web["Web
+    @type: subagent"]
+    done(("DONE
+    @type: terminal"))
+    start --> web
+    web -->|"@pass: pages"| done'''), "nodes": {"web": {"sub_agent": inner}},
+              "config": {"defaults": {"model": "small-model"}}}
+    outer = {"graph": graph('''
+    start(("START
+    @type: terminal"))
+    search["Search
+    @type: subagent
+    @model: big-model"]
+    answer["Answer
+    @type: executor"]
+    oops["Apologize
+    @type: executor"]
+    end_(("END
+    @type: terminal"))
+    start -->|"@cond: query != ''
+              @pass: query"| search
+    search -->|"@pass: results"| answer
+    search -->|"@on_error: true"| oops
+    answer --> end_
+    oops --> end_'''), "nodes": {"search": {"sub_agent": middle, "instructions": "Search well."}},
+             "config": {"defaults": {"model": "big-model"}}}
+
+    report = FlattenReport()
+    flat = flatten_agent(outer, report)
+    edges = edges_of(flat)
+
+    assert report.subagents == ["search__web", "search"]
+    assert set(flat["graph"].nodes) == {"start", "search__web__fetch", "answer", "oops", "end_"}
+    entry = edges[("start", "search__web__fetch")]
+    assert entry.condition == "(query != '') AND (ready == true)" and entry.pass_fields == "query"
+    assert edges[("search__web__fetch", "answer")].pass_fields == "results"
+    assert edges[("search__web__fetch", "oops")].on_error
+    assert flat["graph"].nodes["search__web__fetch"].model == "small-model"
+    assert flat["nodes"]["search__web__fetch"]["instructions"] == "Search well.\n\nFetch it."
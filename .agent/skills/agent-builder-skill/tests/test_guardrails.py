@@ -0,0 +1,174 @@
+import asyncio
+import shutil
+import threading
+
+import pytest
+
+from execution_host import FEEDBACK_KEY, CompiledAgent, ExecutionHost
+from guardrails import FAIL, PASS, SKIPPED, GuardrailEngine, compile_check, load_rules
+
+GOOD = {"clarity": 0.9, "quality": 0.9, "report": "Findings.", "citations": ["[1]"],
+        "confidence": 0.8, "approved": True}
+
+
+@pytest.mark.parametrize("check, payload, expected", [
+    ("answer must be a non-empty string", {"answer": "Sure."}, True),
+    ("answer must be a non-empty string", {"answer": ""}, False),
+    ("length(citations) >= 2", {"citations": ["[1]"]}, False),
+    ("confidence must be a number between 0 and 1", {"confidence": 0.4}, True),
+    ("body does not contain \"password\", \"ssn\"", {"body": "Your SSN is on file"}, False),
+    ("language of reply is fr", {"reply": "Merci pour votre message, nous avons bien reçu la demande."}, True),
+])
+def test_deterministic_checks(check, payload, expected):
+    assert compile_check(check)(payload) is expected
+
+
+def test_both_file_layouts_load():
+    rules = load_rules({"input": ["query must be a non-empty string"],
+                        "output_guardrails": [{"name": "polite", "check": "answer is polite", "action": "warn"}]})
+    assert [(r.name, r.stage, r.action, r.deterministic) for r in rules] == [
+        ("input_1", "input", "fail", True), ("polite", "output", "warn", False)]
+
+
+def test_model_is_asked_only_about_rules_it_must_judge():
+    asked = []
+
+    def model_check(rules, payload):
+        asked.append([r.name for r in rules])
+        return {r.name: True for r in rules}
+
+    engine = GuardrailEngine.from_spec({"output": ["answer must be a non-empty string", "answer is polite"]},
+                                       model_check)
+    report = engine.run("output", {"answer": "Sure."})
+    assert report.passed and [r.status for r in report.results] == [PASS, PASS]
+    assert asked == [["output_2"]]
+
+    # A hard local failure decides the outcome without a model call
+    report = engine.run("output", {"answer": ""})
+    assert report.action == "fail" and [r.status for r in report.results] == [FAIL, SKIPPED]
+    assert asked == [["output_2"]]
+
+
+def test_report_is_pending_until_the_model_answers():
+    spec = {"output": ["answer must be a non-empty string", "answer is polite"]}
+    report = GuardrailEngine.from_spec(spec).run("output", {"answer": "Sure."})
+    assert report.passed is None
+    assert [r.name for r in report.pending] == ["output_2"]
+
+    answered = GuardrailEngine.from_spec(spec, lambda rules, payload: {r.name: True for r in rules})
+    assert answered.run("output", {"answer": "Sure."}).passed is True
+    report = answered.run("output", {"answer": ""})
+    assert report.passed is False and report.action == "fail"
+
+
+def test_names_resolve_against_declared_fields_only():
+    [rule] = load_rules({"input": ["response is not empty"]}, fields={"response_text", "customer_id"})
+    assert rule.predicate({"response_text": "Hi"}) is True
+    [rule] = load_rules({"input": ["response is not empty"]})
+    assert rule.predicate({"response_text": "Hi"}) is False
+    [rule] = load_rules({"input": ["response is not empty"]}, fields={"response_text", "response_id"})
+    assert rule.predicate({"response_text": "Hi"}) is False
+
+
+def test_travel_review_rules_name_the_response_text(travel_agent_dir):
+    agent = CompiledAgent.from_dir(str(travel_agent_dir))
+    [language] = [r for r in agent.nodes["review"].guardrails if r.name == "language_match"]
+    payload = {"response_text": "Merci pour votre message, nous avons bien reçu la demande.",
+               "customer_language": "French"}
+    assert language.predicate(payload) is True
+
+
+def test_arun_keeps_model_checks_off_the_event_loop():
+    spec = {"output": ["answer is polite"]}
+    threads = []
+
+    def blocking_check(rules, payload):
+        threads.append(threading.get_ident())
+        return {r.name: True for r in rules}
+
+    async def async_check(rules, payload):
+        await asyncio.sleep(0)
+        return {r.name: False for r in rules}
+
+    async def main():
+        passed = await GuardrailEngine.from_spec(spec, blocking_check).arun("output", {"answer": "Sure."})
+        failed = await GuardrailEngine.from_spec(spec, async_check).arun("output", {"answer": "Sure."})
+        return passed, failed
+
+    passed, failed = asyncio.run(main())
+    assert passed.passed is True and failed.action == "fail"
+    assert threads and threads[0] != threading.get_ident()
+    with pytest.raises(TypeError, match="use arun"):
+        GuardrailEngine.from_spec(spec, async_check).run("output", {"answer": "Sure."})
+
+
+@pytest.fixture
+def agent_dir(research_agent_dir, tmp_path):
+    agent = tmp_path / "research-agent"
+    shutil.copytree(research_agent_dir, agent)
+    return agent
+
+
+def run(agent_dir, handler, inputs, **options):
+    events = []
+    host = ExecutionHost(CompiledAgent.from_dir(str(agent_dir)), handler,
+                         tracer=lambda session_id, event: events.append(event), **options)
+    session = asyncio.run(host.start(inputs))
+    return session, [e for e in events if e["action"] == "guardrail"]
+
+
+async def echo(session, node, inputs):
+    return dict(inputs)
+
+
+def test_failed_input_guardrail_stops_the_step(agent_dir):
+    session, events = run(agent_dir, echo, {**GOOD, "citations": []})
+    assert session.status == "error"
+    assert "'review' failed input guardrails (fail): input_2" in session.error
+    assert events[0]["failed"] == ["input_2"]
+
+
+def test_unanswered_rules_are_traced_not_passed(agent_dir):
+    session, events = run(agent_dir, echo, GOOD)
+    assert session.status == "done", session.error
+    assert events[-1]["stage"] == "output" and events[-1]["outcome"] is None
+    assert events[-1]["pending"] == ["output_2", "output_4"]
+
+
+def test_model_verdict_is_acted_on(agent_dir):
+    session, _ = run(agent_dir, echo, GOOD, guardrail_check=lambda rules, payload: {r.name: False for r in rules})
+    assert session.status == "error"
+    assert "output_2, output_4" in session.error
+
+
+def test_host_awaits_an_async_model_check(agent_dir):
+    asked = []
+
+    async def guardrail_check(rules, payload):
+        asked.extend(r.name for r in rules)
+        return {r.name: True for r in rules}
+
+    session, events = run(agent_dir, echo, GOOD, guardrail_check=guardrail_check)
+    assert session.status == "done", session.error
+    assert asked == ["output_2", "output_4"] and events == []
+
+
+def test_revise_reruns_the_handler_with_feedback(agent_dir):
+    (agent_dir / "nodes" / "synthesize" / "guardrails.yaml").write_text(
+        "output_guardrails:\n"
+        "  - name: has_summary\n"
+        "    check: summary must be a non-empty string\n"
+        "    action: revise\n")
+    calls = []
+
+    async def handler(session, node, inputs):
+        if node.id == "synthesize":
+            calls.append(inputs.get(FEEDBACK_KEY))
+            return {**inputs, "summary": "Done." if FEEDBACK_KEY in inputs else ""}
+        return dict(inputs)
+
+    session, events = run(agent_dir, handler, GOOD)
+    assert session.status == "done", session.error
+    assert calls == [None, ["summary must be a non-empty string"]]
+    assert events[0] == {**events[0], "node": "synthesize", "outcome": "revise", "failed": ["has_summary"]}
+    assert session.context.to_dict()["summary"] == "Done."
@@ -0,0 +1,41 @@
+from liveness import analyze
+from parser import load_agent, parse_mermaid
+
+
+def test_edges_carry_only_live_keys(research_agent_dir):
+    agent = load_agent(str(research_agent_dir))
+    live = analyze(agent["graph"], agent["config"], agent["nodes"])
+
+    assert live.projection("intake", "search") == ("entities", "query", "scope")
+    assert live.projection("review", "analyze") == ("feedback", "weak_sections")
+    # The terminal also reads every output_schema property
+    assert live.projection("review", "deliver") == ("citations", "confidence", "report", "warnings")
+    context = {"sources": [1], "excerpts": [], "metadata": {}, "query": "q", "findings": "old"}
+    assert live.project(context, "analyze", "search") == {"sources": [1], "excerpts": [], "metadata": {}}
+
+
+def test_keys_survive_nodes_that_do_not_redefine_them():
+    graph = parse_mermaid('''```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    a["A
+    @type: executor"]
+    b["B
+    @type: executor"]
+    c["C
+    @type: executor"]
+    end_(("END
+    @type: terminal"))
+    start -->|"@pass: q, user"| a
+    a -->|"@pass: q, draft"| b
+    b -->|"@pass: final"| c
+    c --> end_
+```''')
+    config = {"input_schema": {"properties": {"q": {}, "user": {}}}, "output_schema": {"properties": {"final": {}, "user": {}}}}
+    live = analyze(graph, config)
+
+    # `user` is not passed on by a, but END still needs it
+    assert live.projection("a", "b") == ("draft", "q", "user")
+    assert live.projection("b", "c") == ("final", "user")
+    assert live.defs["a"] == {"draft"} and live.defs["start"] == {"q", "user"}
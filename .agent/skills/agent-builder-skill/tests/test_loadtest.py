@@ -0,0 +1,14 @@
+import asyncio
+
+from execution_host import CompiledAgent
+from loadtest import LoadTest, StubConfig
+
+
+def test_closed_loop_run_reports_every_session(travel_agent_dir):
+    test = LoadTest(CompiledAgent.from_dir(str(travel_agent_dir)), StubConfig(), seed=1, time_scale=1e-4)
+    report = asyncio.run(test.run(concurrency=4, requests=20))
+
+    assert report["sessions"] == 20 and report["mode"] == "concurrency"
+    assert sum(report["statuses"].values()) == 20
+    assert report["nodes"]["intake"]["visits"] == 20
+    assert report["latency_s"]["p50"] <= report["latency_s"]["p99"]
@@ -0,0 +1,53 @@
+from fast_loader import load_agent_fast
+from loop_analysis import analyze_bounds, strongly_connected_components
+from parser import parse_mermaid
+
+
+def graph(body):
+    return parse_mermaid("```mermaid\ngraph TD\n" + body + "\n```")
+
+
+def test_research_agent_review_loop_is_bounded(research_agent_dir):
+    agent = load_agent_fast(str(research_agent_dir), lazy=True)
+    bounds = analyze_bounds(agent["graph"], agent["config"], agent["nodes"])
+
+    [loop] = bounds.loops
+    assert loop.bounded and loop.bounds == ["review @max_iterations: 3"]
+    assert loop.max_visits == {"review": 3, "synthesize": 4, "analyze": 4}
+    assert bounds.max_steps == 18 and bounds.max_model_calls == 20
+    assert bounds.latency_capped and bounds.max_latency == 180.0
+
+
+def test_unbounded_cycle_and_edge_caps():
+    body = '''
+    start(("START
+    @type: terminal"))
+    a["A
+    @type: executor
+    @timeout: 2s
+    @retry: 2"]
+    b["B
+    @type: executor
+    @timeout: 1s"]
+    end_(("END
+    @type: terminal"))
+    start --> a
+    a --> b
+    b -->|"@cond: bad == true
+            {cap}"| a
+    b --> end_'''
+    open_loop = analyze_bounds(graph(body.format(cap="")))
+    assert open_loop.unbounded and open_loop.unbounded[0].unbounded == ["a", "b"]
+    assert open_loop.max_steps is None and open_loop.max_latency is None
+
+    capped = analyze_bounds(graph(body.format(cap="@max_iterations: 2")))
+    assert not capped.unbounded and capped.untimed == []
+    # Three visits each, terminals are not steps; a makes two attempts of 2s per visit
+    assert capped.max_steps == 3 * 2
+    assert capped.max_model_calls == 3 * 2 + 3
+    assert capped.max_latency == 3 * 4.0 + 3 * 1.0
+
+
+def test_tarjan_components():
+    successors = {"a": ["b"], "b": ["c", "a"], "c": ["c"], "d": []}
+    assert sorted(map(sorted, strongly_connected_components(successors, successors))) == [["a", "b"], ["c"], ["d"]]
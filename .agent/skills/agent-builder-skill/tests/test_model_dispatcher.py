@@ -0,0 +1,50 @@
+import asyncio
+
+from model_dispatcher import ModelDispatcher
+
+
+class Backend:
+    def __init__(self, fail=False):
+        self.batches, self.fail = [], fail
+
+    async def complete(self, model, requests):
+        self.batches.append([r.payload["q"] for r in requests])
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("overloaded")
+        return [f"{model}:{r.payload['q']}" for r in requests]
+
+
+def dispatcher(backend, **models):
+    config = {"models": {"default": {"max_concurrency": 1, "batch_window": "5ms", "max_batch": 3}, **models}}
+    return ModelDispatcher.from_config(backend, config)
+
+
+def test_coalesces_batches_and_limits_concurrency():
+    backend = Backend()
+    models = dispatcher(backend, big={"max_batch": 10})
+
+    async def go():
+        calls = [models.submit("small", {"q": i % 5}, "node") for i in range(7)]
+        calls.append(models.submit("big", {"q": 0}, "node"))
+        return await asyncio.gather(*calls)
+
+    results = asyncio.run(go())
+    assert results == [f"small:{i % 5}" for i in range(7)] + ["big:0"]
+    assert sorted(map(sorted, backend.batches)) == [[0], [0, 1, 2], [3, 4]]
+    report = models.report()
+    assert report["small"]["coalesced"] == 2 and report["small"]["batches"] == 2
+    assert report["small"]["peak_in_flight"] == 1 and report["small"]["max_concurrency"] == 1
+    assert models.limits_for("big").max_batch == 10 and models.limits_for("big").batch_window == 0.005
+
+
+def test_a_failed_batch_fails_every_waiter():
+    models = dispatcher(Backend(fail=True))
+
+    async def go():
+        return await asyncio.gather(*(models.submit("small", {"q": i}) for i in (1, 1, 2)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(go())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert models.report()["small"]["errors"] == 1
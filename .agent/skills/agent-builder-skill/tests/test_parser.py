@@ -0,0 +1,15 @@
+from parser import LazySubAgent, load_agent, prefetch_subagents
+
+
+def test_lazy_subagents_load_on_first_access(research_agent_dir):
+    agent = load_agent(str(research_agent_dir), lazy=True)
+    search = agent["nodes"]["search"]["sub_agent"]
+    assert isinstance(search, LazySubAgent) and search and not search.loaded
+
+    assert prefetch_subagents(agent, "start") == []
+    [future] = prefetch_subagents(agent, "intake")
+    future.result()
+    assert search.loaded and prefetch_subagents(agent, "intake") == []
+    eager = load_agent(str(research_agent_dir))["nodes"]["search"]["sub_agent"]
+    assert sorted(search["graph"].nodes) == sorted(eager["graph"].nodes)
+    assert search["config"] == eager["config"]
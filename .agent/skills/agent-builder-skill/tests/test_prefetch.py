@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+from execution_host import CompiledAgent
+from prefetch import Prefetcher, tool_args
+
+INPUTS = {"customer_id": "C1", "booking_ref": "B1", "message": "can I change my dates?"}
+
+
+class Routing:
+    """TraceStats stand-in: most sessions go from classify to booking_lookup."""
+
+    def edge_probability(self, source, target):
+        return {"booking_lookup": 0.6, "kb_search": 0.3, "complaint_handler": 0.1}.get(target, 0.0)
+
+
+def test_args_must_be_known_up_front(travel_agent_dir):
+    tools = CompiledAgent.from_dir(str(travel_agent_dir)).tools
+    assert tool_args(tools["get_booking_details"], {"customer_id": "C1", "other": 1}) == {"customer_id": "C1"}
+    assert tool_args(tools["check_availability"], INPUTS) is None
+    assert tool_args(tools["search_knowledge_base"], {"query": "bags", "category": "baggage"}) == \
+        {"query": "bags", "category": "baggage"}
+
+
+def test_taken_branch_joins_the_prefetch_and_others_are_cancelled(travel_agent_dir):
+    agent = CompiledAgent.from_dir(str(travel_agent_dir))
+    calls = []
+
+    async def call_tool(name, args):
+        calls.append(name)
+        await asyncio.sleep(0.02)
+        return {"tool": name, **args}
+
+    async def go():
+        prefetcher = Prefetcher(agent, call_tool, stats=Routing())
+        session = SimpleNamespace(context={})
+        started = prefetcher.start(session, agent.nodes["classify"], INPUTS)
+        await asyncio.sleep(0)
+        prefetcher.settle(started, "booking_lookup")
+        details = await prefetcher.call("get_booking_details", {"booking_ref": "B1", "customer_id": "C1"})
+        again = await prefetcher.call("get_booking_details", {"booking_ref": "B1", "customer_id": "C1"})
+        return prefetcher, started, details, again
+
+    prefetcher, started, details, again = asyncio.run(go())
+    assert [b["target"] for b in prefetcher.stats()["routers"]["classify"]] == ["booking_lookup", "kb_search"]
+    assert sorted(target for target, _ in started) == ["booking_lookup", "kb_search"]
+    assert details == again == {"tool": "get_booking_details", "booking_ref": "B1", "customer_id": "C1"}
+    assert sorted(calls) == ["get_booking_details", "get_booking_summary"]
+    metrics = prefetcher.stats()
+    assert (metrics["started"], metrics["used"], metrics["discarded"], metrics["cancelled"]) == (2, 1, 1, 1)
@@ -0,0 +1,111 @@
+import asyncio
+import shutil
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import reference_index
+from compiler import compile_and_write, compile_system_prompt
+from execution_host import REFERENCES_KEY, CompiledAgent, ExecutionHost
+from reference_index import INDEX_DIR, ReferenceIndex
+
+
+# Satisfies the review node's guardrails
+REVIEWABLE = {"report": "Findings.", "citations": ["[1]"], "confidence": 0.8, "approved": True}
+
+
+def section(title, topic, words):
+    return f"## {title}\n\n" + " ".join(f"{topic}{i % 40}" for i in range(words)) + "\n\n"
+
+
+@pytest.fixture
+def agent_dir(research_agent_dir, tmp_path):
+    """The research agent with a 20 KB and a 60 KB reference on `analyze`."""
+    agent = tmp_path / "research-agent"
+    shutil.copytree(research_agent_dir, agent)
+    refs = agent / "nodes" / "analyze" / "references"
+    refs.mkdir()
+    (refs / "rubric.md").write_text(section("Rubric", "criterion", 2500))
+    (refs / "handbook.md").write_text(section("Citations", "citation", 4000) + section("Quotas", "quota", 4000))
+    reference_index.build_index(str(agent))
+    return agent
+
+
+def test_search_ranks_the_matching_section_first(agent_dir):
+    index = ReferenceIndex.load(str(agent_dir))
+    try:
+        [best, *_] = index.excerpts_for("analyze", "quota3 quota7")
+        assert (best.source, best.heading) == ("handbook.md", "Quotas")
+        assert index.search("nothing-like-this") == []
+        assert index.node_scope("intake") is None and index.excerpts_for("intake", "quota3") == []
+        assert 'section="Citations"' in index.inject("analyze", {"query": "citation7"})
+    finally:
+        index.close()
+
+
+def test_references_under_the_large_file_limit_stay_inline(agent_dir):
+    rubric = (agent_dir / "nodes" / "analyze" / "references" / "rubric.md").read_text()
+    assert len(rubric) > 8000
+    prompt = compile_system_prompt(str(agent_dir))
+    assert rubric in prompt
+    assert "Indexed: `handbook.md`" in prompt
+    assert '<reference name="handbook.md">' not in prompt
+
+
+def test_inject_skips_chunks_the_prompt_carries(agent_dir):
+    index = ReferenceIndex.load(str(agent_dir))
+    try:
+        text = index.inject("analyze", {"query": "criterion1 quota3"})
+    finally:
+        index.close()
+    assert 'name="handbook.md" section="Quotas"' in text
+    assert "rubric.md" not in text
+
+
+def test_host_passes_excerpts_to_the_handler(agent_dir):
+    seen = {}
+
+    async def handler(session, node, inputs):
+        seen[node.id] = inputs.get(REFERENCES_KEY)
+        return dict(inputs)
+
+    index = ReferenceIndex.load(str(agent_dir))
+    try:
+        host = ExecutionHost(CompiledAgent.from_dir(str(agent_dir)), handler, references=index)
+        session = asyncio.run(host.start({"excerpts": "citation7 sources", "clarity": 0.9, "quality": 0.9, **REVIEWABLE}))
+    finally:
+        index.close()
+    assert session.status == "done", session.error
+    assert 'section="Citations"' in seen["analyze"]
+    assert seen["intake"] is None                  # no references of its own
+    assert REFERENCES_KEY not in session.context.to_dict()
+
+
+def test_edited_references_make_the_index_stale(agent_dir):
+    rubric = agent_dir / "nodes" / "analyze" / "references" / "rubric.md"
+    rubric.write_text(section("Rubric", "standard", 2500))
+    assert ReferenceIndex.load(str(agent_dir)) is None
+
+    index = ReferenceIndex.load(str(agent_dir), rebuild=True)
+    try:
+        assert not index.is_stale(str(agent_dir))
+        assert index.excerpts_for("analyze", "standard3")[0].source == "rubric.md"
+    finally:
+        index.close()
+    (agent_dir / "references").mkdir()
+    (agent_dir / "references" / "faq.md").write_text(section("FAQ", "answer", 50))
+    assert ReferenceIndex.load(str(agent_dir)) is None
+
+
+def test_compile_builds_the_index_only_when_asked(research_agent_dir, tmp_path):
+    agent = tmp_path / "research-agent"
+    shutil.copytree(research_agent_dir, agent)
+    (agent / "references").mkdir()
+    (agent / "references" / "faq.md").write_text(section("FAQ", "answer", 50))
+    compile_and_write(str(agent))
+    assert not (agent / INDEX_DIR).exists()
+    compile_and_write(str(agent), index=True)
+    index = ReferenceIndex.load(str(agent))
+    assert index is not None and index.sources == ["faq.md"]
+    index.close()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import shutil
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from execution_host import CompiledAgent, ExecutionHost
+from parser import parse_mermaid
+from router_classifier import CLASSIFIER_FILE, FastPathRouter, train_router
+
+MESSAGES = {
+    "kb_search": ["what documents do i need for {} travel", "is breakfast included on the {} trip"],
+    "booking_lookup": ["please change my {} booking dates", "i want to move my {} reservation"],
+    "complaint_handler": ["the {} hotel room was filthy", "terrible service on my {} flight"],
+}
+PLACES = ["paris", "rome", "tokyo", "lisbon", "cairo", "oslo"]
+
+
+def write_traces(path):
+    with open(path, "w") as fh:
+        for target, templates in MESSAGES.items():
+            for template in templates:
+                for place in PLACES:
+                    for event in ({"action": "enter", "node": "classify",
+                                   "input_data": {"message": template.format(place)}},
+                                  {"action": "enter", "node": target, "input_data": {}}):
+                        fh.write(json.dumps(event) + "\n")
+
+
+def test_trained_router_decides_only_when_confident(travel_agent_dir, tmp_path):
+    traces = tmp_path / "traces.jsonl"
+    write_traces(traces)
+    graph = parse_mermaid((travel_agent_dir / "agent-mermaid.md").read_text())
+    clf, evaluation = train_router(graph, "classify", [str(traces)], epochs=20)
+    assert clf.labels == ["booking_lookup", "complaint_handler", "kb_search"]
+    assert evaluation["train_examples"] + evaluation["examples"] == 36
+    clf.save(str(tmp_path / CLASSIFIER_FILE))
+
+    router = FastPathRouter.for_node(graph, "classify", str(tmp_path))
+    edge, confidence = router.route({"message": "please change my rome booking dates"})
+    assert edge.target == "booking_lookup" and confidence >= router.threshold
+    edge, _ = router.route({"message": "xyzzy"})
+    assert edge is None
+    assert (router.decided, router.deferred) == (1, 1)
+    assert FastPathRouter.for_node(graph, "intake", str(tmp_path / "missing")) is None
+
+
+def test_on_error_edges_are_never_routing_choices(travel_agent_dir, tmp_path):
+    text = (travel_agent_dir / "agent-mermaid.md").read_text()
+    graph = parse_mermaid(text.replace("    start --> intake",
+                                       "    start --> intake\n    classify -->|\"@on_error: true\"| escalate"))
+    traces = tmp_path / "traces.jsonl"
+    write_traces(traces)
+    with open(traces, "a") as fh:
+        for event in ({"action": "enter", "node": "classify", "input_data": {"message": "timeout"}},
+                      {"action": "enter", "node": "escalate", "input_data": {}}):
+            fh.write(json.dumps(event) + "\n")
+    clf, _ = train_router(graph, "classify", [str(traces)], epochs=20)
+    assert "escalate" not in clf.labels
+    clf.save(str(tmp_path / CLASSIFIER_FILE))
+    assert "escalate" not in FastPathRouter.for_node(graph, "classify", str(tmp_path)).edges
+
+
+@pytest.fixture
+def trained_agent(travel_agent_dir, tmp_path):
+    agent = tmp_path / "travel-support"
+    shutil.copytree(travel_agent_dir, agent)
+    traces = tmp_path / "traces.jsonl"
+    write_traces(traces)
+    graph = parse_mermaid((agent / "agent-mermaid.md").read_text())
+    clf, evaluation = train_router(graph, "classify", [str(traces)], epochs=20)
+    clf.save(str(agent / "nodes" / "classify" / CLASSIFIER_FILE))
+    assert evaluation["decision_us"] > 0
+    return agent
+
+
+def run(agent_dir, message, fast_path=True):
+    called, events = [], []
+
+    async def handler(session, node, inputs):
+        called.append(node.id)
+        if node.id == "classify":
+            return {**inputs, "intent": "trip_info"}
+        return dict(inputs)
+
+    host = ExecutionHost(CompiledAgent.from_dir(str(agent_dir)), handler, fast_path=fast_path,
+                         tracer=lambda session_id, event: events.append(event))
+    asyncio.run(host.start({"message": message}))
+    return host, called, [e for e in events if e["action"] == "fast_path"]
+
+
+def test_confident_router_decision_skips_the_model(trained_agent):
+    host, called, decisions = run(trained_agent, "please change my rome booking dates")
+    assert "classify" not in called
+    assert "booking_lookup" in called
+    assert host.stats()["fast_path"]["classify"] == {"decided": 1, "deferred": 0}
+    [event] = decisions
+    assert event["node"] == "classify" and event["route"] == "booking_lookup"
+    assert event["confidence"] >= 0.8
+
+
+def test_unsure_router_falls_back_to_the_model(trained_agent):
+    host, called, decisions = run(trained_agent, "xyzzy")
+    assert "classify" in called and "kb_search" in called
+    assert host.stats()["fast_path"]["classify"]["deferred"] == 1
+    assert decisions == []
+
+
+def test_fast_path_can_be_turned_off(trained_agent):
+    host, called, _ = run(trained_agent, "please change my rome booking dates", fast_path=False)
+    assert "classify" in called and "kb_search" in called
+    assert "fast_path" not in host.stats()
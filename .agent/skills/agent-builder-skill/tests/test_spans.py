@@ -0,0 +1,55 @@
+import asyncio
+
+from execution_host import CompiledAgent, ExecutionHost
+from spans import OTLPFileExporter, SpanRecorder, annotate, fold, read_spans, span
+
+REVIEWED = {"clarity": 0.9, "quality": 0.9, "report": "Findings.", "citations": ["[1]"],
+            "confidence": 0.8, "approved": True}
+
+
+async def handler(session, node, inputs):
+    with span(f"model {node.id}", {"gen_ai.usage.input_tokens": 10}):
+        annotate({"gen_ai.usage.output_tokens": 5})
+    return {**inputs, **REVIEWED}
+
+
+def record(agent_dir, path, sample_rate=1.0, sessions=("s1",)):
+    recorder = SpanRecorder(OTLPFileExporter(str(path)), sample_rate=sample_rate)
+    host = ExecutionHost(CompiledAgent.from_dir(str(agent_dir)), handler, spans=recorder)
+
+    async def go():
+        for sid in sessions:
+            await host.start({"query": "q"}, session_id=sid)
+
+    asyncio.run(go())
+    recorder.close()
+    return recorder, read_spans(str(path)) if path.exists() else []
+
+
+def test_node_route_and_model_spans_nest_under_the_run(research_agent_dir, tmp_path):
+    recorder, spans = record(research_agent_dir, tmp_path / "spans.jsonl")
+    by_id = {s["spanId"]: s for s in spans}
+    names = {s["name"]: s for s in spans}
+
+    assert len({s["traceId"] for s in spans}) == 1 and recorder.stats()["traces"] == 1
+    root = next(s for s in spans if "parentSpanId" not in s)
+    assert root["name"].startswith("run ")
+    assert by_id[names["node analyze"]["parentSpanId"]] is root
+    assert by_id[names["model analyze"]["parentSpanId"]] is names["node analyze"]
+    assert "route review -> deliver" in names
+    attributes = {a["key"]: a["value"] for a in names["model analyze"]["attributes"]}
+    assert attributes == {"gen_ai.usage.input_tokens": {"intValue": "10"},
+                          "gen_ai.usage.output_tokens": {"intValue": "5"}}
+    stacks = fold(spans)
+    assert any(stack.endswith(";node analyze;model analyze") for stack in stacks)
+
+
+def test_sampling_is_per_session(research_agent_dir, tmp_path):
+    recorder, spans = record(research_agent_dir, tmp_path / "none.jsonl", sample_rate=0.0)
+    assert spans == [] and recorder.stats()["traces"] == 0
+
+    recorder = SpanRecorder(OTLPFileExporter(str(tmp_path / "half.jsonl")), sample_rate=0.5)
+    sampled = [sid for sid in map(str, range(200)) if recorder.trace(sid, "run").span is not None]
+    recorder.close()
+    assert 60 < len(sampled) < 140
+    assert recorder.trace_id("7") == recorder.trace_id("7") != recorder.trace_id("8")
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from execution_host import CompiledAgent, ExecutionHost, dispatch_tool
+from parser import parse_mermaid
+from tool_cache import ToolCache, parse_cache_policy
+
+TOOLS = [
+    {"name": "get_booking", "cache": {"ttl": "5m", "key": "booking_ref"}},
+    {"name": "search_flights", "cache": True, "parameters": {"cabin": {"type": "string", "default": "economy"}}},
+    {"name": "cancel_booking"},
+]
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cache(**kwargs):
+    agent = {"nodes": {"lookup": {"tools": TOOLS}, "other": {"tools": TOOLS[:1]}}}
+    return ToolCache.from_agent(agent, **kwargs)
+
+
+def test_policies_come_from_tools_yaml():
+    tools = cache()
+    assert set(tools.policies) == {"get_booking", "search_flights"}
+    assert tools.policies["get_booking"].ttl == 300 and tools.policies["get_booking"].key_fields == ("booking_ref",)
+    assert parse_cache_policy({"name": "x", "cache": {"enabled": False}}) is None
+    # Defaults and None values do not split the key; non-key arguments are ignored
+    assert tools.make_key("search_flights", {"to": "LIS"}) == \
+        tools.make_key("search_flights", {"to": "LIS", "cabin": "economy", "date": None})
+    assert tools.make_key("get_booking", {"booking_ref": "B1", "trace": 1}) == \
+        tools.make_key("get_booking", {"booking_ref": "B1", "trace": 2})
+
+
+def test_hits_expire_and_evict():
+    clock, calls = Clock(), []
+
+    def lookup(**args):
+        calls.append(args)
+        return len(calls)
+
+    tools = cache(max_entries=2, default_ttl=10, clock=clock)
+    assert tools.call("get_booking", {"booking_ref": "B1"}, lookup) == 1
+    assert tools.call("get_booking", {"booking_ref": "B1"}, lookup) == 1
+    assert tools.call("cancel_booking", {"booking_ref": "B1"}, lookup) == 2
+    assert tools.call("cancel_booking", {"booking_ref": "B1"}, lookup) == 3
+
+    clock.now = 11    # search_flights uses the cache-wide 10s, get_booking its own 5m
+    tools.call("search_flights", {"to": "LIS"}, lookup)
+    assert tools.call("get_booking", {"booking_ref": "B1"}, lookup) == 1
+    assert tools.call("search_flights", {"to": "LIS"}, lookup) == 4
+    clock.now = 22
+    assert tools.call("search_flights", {"to": "LIS"}, lookup) == 5
+
+    tools.call("get_booking", {"booking_ref": "B2"}, lookup)
+    tools.call("get_booking", {"booking_ref": "B3"}, lookup)
+    stats = tools.stats()
+    assert len(tools) == 2 and stats["total"]["evictions"] == 2
+    assert stats["tools"]["get_booking"]["hits"] == 2 and stats["tools"]["search_flights"]["expirations"] == 1
+    assert "cancel_booking" not in stats["tools"]
+    assert tools.invalidate("get_booking") == 2 and len(tools) == 0
+
+
+def test_scalar_cache_is_a_ttl_or_rejected():
+    assert parse_cache_policy({"name": "x", "cache": "5m"}).ttl == 300
+    assert parse_cache_policy({"name": "x", "cache": 30}).ttl == 30
+    with pytest.raises(ValueError, match="cache must be true, a duration"):
+        parse_cache_policy({"name": "x", "cache": "soon"})
+    with pytest.raises(ValueError, match="cache ttl 'soon' is not a duration"):
+        parse_cache_policy({"name": "x", "cache": {"ttl": "soon"}})
+
+
+def test_evictions_are_counted_for_tool_names_with_colons():
+    tools = ToolCache.from_tools([{"name": "crm:lookup", "cache": True}], max_entries=1)
+    tools.put("crm:lookup", {"id": 1}, "a")
+    tools.put("crm:lookup", {"id": 2}, "b")
+    assert tools.stats()["tools"]["crm:lookup"]["evictions"] == 1
+    assert tools.invalidate("crm:lookup") == 1
+
+
+FLOW = """```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    lookup["Lookup
+    @type: executor"]
+    end_(("END
+    @type: terminal"))
+    start --> lookup
+    lookup --> end_
+```"""
+
+
+def test_host_dispatch_goes_through_the_cache():
+    calls = []
+
+    async def call_tool(name, args):
+        calls.append(name)
+        return len(calls)
+
+    async def handler(session, node, inputs):
+        return {"booking": await dispatch_tool("get_booking", {"booking_ref": "B1"}),
+                "cancelled": await dispatch_tool("cancel_booking", {"booking_ref": "B1"})}
+
+    agent = CompiledAgent.from_agent({"graph": parse_mermaid(FLOW), "config": {}, "path": "flow",
+                                      "nodes": {"lookup": {"tools": TOOLS}}})
+    host = ExecutionHost(agent, handler, call_tool=call_tool)
+    first = asyncio.run(host.start({})).output
+    second = asyncio.run(host.start({})).output
+    assert first == {"booking": 1, "cancelled": 2} and second == {"booking": 1, "cancelled": 3}
+    assert calls == ["get_booking", "cancel_booking", "cancel_booking"]
+    assert host.tool_cache.stats()["tools"]["get_booking"]["hits"] == 1
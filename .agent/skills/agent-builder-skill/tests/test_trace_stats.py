@@ -0,0 +1,81 @@
+import json
+
+from compiler import compile_system_prompt, profile_layout
+from parser import load_agent
+from trace_stats import compute_stats, find_trace_files, load_stats, load_trace_columns
+
+HOT_PATH = ["intake", "search", "analyze", "synthesize", "review"]
+
+
+def write_session(path, nodes, seconds=1.0):
+    events, ts = [], 0.0
+    for i, node in enumerate(nodes):
+        events.append({"action": "enter", "node": node, "iteration": nodes[:i + 1].count(node), "ts": ts})
+        ts += seconds
+        events.append({"action": "complete", "node": node, "ts": ts})
+        if i + 1 < len(nodes):
+            events.append({"action": "route", "from": node, "to": nodes[i + 1], "ts": ts})
+    path.write_text("\n".join(json.dumps(e) for e in events) + "\n")
+
+
+def write_sessions(agent_dir, n=25):
+    sessions = agent_dir / ".agent-sessions"
+    sessions.mkdir(parents=True)
+    for i in range(n):
+        nodes = ["intake", "clarify"] if i == 0 else []
+        nodes += HOT_PATH + (["analyze", "synthesize", "review"] if i % 5 == 0 else []) + ["deliver"]
+        write_session(sessions / f"s{i:02}.trace.jsonl", ["start"] + nodes)
+    (sessions / "notes.txt").write_text("not a trace")
+
+
+def test_stats_count_visits_edges_and_loops(tmp_path):
+    write_sessions(tmp_path)
+    files = find_trace_files(str(tmp_path))
+    assert len(files) == 25 and all(f.name.endswith(".trace.jsonl") for f in files)
+
+    stats = compute_stats(load_trace_columns(files))
+    assert stats.sessions == 25
+    assert stats.nodes["analyze"]["visits"] == 30 and stats.nodes["analyze"]["sessions"] == 25
+    assert stats.nodes["clarify"]["session_rate"] == 0.04
+    assert stats.nodes["synthesize"]["p50_ms"] == 1000.0
+    assert stats.edge_probability("review", "analyze") == round(5 / 30, 4)
+    assert stats.edge_probability("review", "deliver") == round(25 / 30, 4)
+    assert stats.loops["analyze"] == {1: 20, 2: 5}
+    assert stats.hot_nodes()[0] in ("analyze", "synthesize", "review")
+    assert load_stats(str(tmp_path)).to_dict() == stats.to_dict()
+
+
+def test_retries_come_from_retry_events_only(tmp_path):
+    events = [
+        {"action": "enter", "node": "search", "ts": 0.0},
+        {"action": "retry", "node": "search", "attempt": 1, "ts": 0.5},
+        {"action": "complete", "node": "search", "ts": 1.0},
+        {"action": "enter", "node": "search", "ts": "not a time"},
+        {"action": "complete", "node": "search", "ts": True},
+        {"action": "enter", "ts": 2.0},
+        {"action": "error", "node": "search", "ts": "2024-05-01T10:00:00Z"},
+    ]
+    (tmp_path / "s.trace.jsonl").write_text("\n".join(json.dumps(e) for e in events) + "\n")
+    (tmp_path / "inputs.jsonl").write_text(json.dumps({"action": "enter", "node": "search"}) + "\n")
+    files = find_trace_files(str(tmp_path))
+    assert [f.name for f in files] == ["s.trace.jsonl"]
+
+    stats = load_stats(str(tmp_path))
+    assert stats.bad_timestamps == 2
+    assert stats.nodes["search"]["visits"] == 2 and stats.nodes["search"]["retries"] == 1
+    assert stats.nodes["search"]["p50_ms"] == 1000.0
+    assert stats.edges == [{"source": "search", "target": "search", "count": 1, "probability": 1.0}]
+
+
+def test_profile_orders_hot_path_first_and_collapses_cold_nodes(research_agent_dir, tmp_path):
+    write_sessions(tmp_path)
+    stats = load_stats(str(tmp_path))
+    order, collapsed = profile_layout(load_agent(str(research_agent_dir))["graph"], stats)
+
+    assert order[-1] == "clarify"
+    assert order.index("intake") < order.index("search") < order.index("analyze")
+    assert collapsed == {"clarify"}
+
+    prompt = compile_system_prompt(str(research_agent_dir), profile=stats)
+    assert "(`clarify`) — rarely used" in prompt
+    assert "(`analyze`) — rarely used" not in prompt
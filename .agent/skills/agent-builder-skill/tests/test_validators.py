@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from execution_host import CompiledAgent, ExecutionHost, dispatch_tool
+from parser import parse_mermaid
+from prefetch import Prefetcher
+from validators import (AgentValidators, ValidationError, Validator, schema_problems,
+                        tool_parameters_schema)
+
+
+SEARCH_TOOL = {
+    "type": "function",
+    "name": "kb_search",
+    "parameters": {
+        "query": {"type": "string", "required": True},
+        "limit": {"type": "integer", "default": 5, "minimum": 1},
+    },
+}
+
+LOOKUP = '''```mermaid
+graph TD
+    start(("START
+    @type: terminal"))
+    lookup["Lookup
+    @type: executor
+    @retry: 3"]
+    end_(("END
+    @type: terminal"))
+    start --> lookup
+    lookup --> end_
+```'''
+
+
+def lookup_agent():
+    return CompiledAgent.from_agent({"graph": parse_mermaid(LOOKUP), "config": {}, "path": "lookup",
+                                     "nodes": {"lookup": {"tools": [SEARCH_TOOL]}}})
+
+
+def test_per_parameter_required_flag_compiles():
+    validator = Validator.compile("tool kb_search", tool_parameters_schema(SEARCH_TOOL))
+    assert validator.errors({"query": "visa"}) == []
+    assert validator.errors({"limit": 3}) == ["query: required"]
+
+
+def test_required_flag_on_a_nested_property():
+    validator = Validator.compile("input", {
+        "type": "object",
+        "properties": {"booking": {"type": "object", "properties": {"ref": {"type": "string", "required": True}}}},
+    })
+    assert validator.errors({"booking": {}}) == ["booking.ref: required"]
+
+
+def test_schema_problems_accepts_required_flags():
+    assert schema_problems("tool kb_search", tool_parameters_schema(SEARCH_TOOL)) == []
+
+
+def test_required_list_defaults_and_types():
+    validator = Validator.compile("input", {
+        "type": "object",
+        "required": ["query"],
+        "properties": {"query": {"type": "string"}, "depth": {"enum": ["quick", "deep"], "default": "quick"}},
+    })
+    assert validator.check({"query": "q"}) == {"query": "q", "depth": "quick"}
+    with pytest.raises(ValidationError) as err:
+        validator.check({"query": 3, "depth": "slow"})
+    assert sorted(err.value.errors) == ["depth: 'slow' not in ['quick', 'deep']", "query: expected string, got int"]
+
+
+def test_agent_validators_compile_example_tools(research_agent_dir):
+    from parser import load_agent
+    validators = AgentValidators.from_agent(load_agent(str(research_agent_dir)))
+    assert validators.input.errors({"query": "q"}) == []
+
+
+def test_host_rejects_bad_tool_calls_before_the_backend():
+    backend, attempts = [], []
+
+    async def call_tool(name, args):
+        backend.append((name, args))
+        return {"hits": []}
+
+    async def handler(session, node, inputs):
+        attempts.append(node.id)
+        return await dispatch_tool("kb_search", inputs["args"])
+
+    host = ExecutionHost(lookup_agent(), handler, call_tool=call_tool)
+    session = asyncio.run(host.start({"args": {"query": "visa"}}))
+    assert session.status == "done" and backend == [("kb_search", {"query": "visa", "limit": 5})]
+
+    backend.clear()
+    attempts.clear()
+    session = asyncio.run(host.start({"args": {"limit": 0}}))
+    assert session.status == "error" and "tool kb_search" in session.error
+    assert "query: required" in session.error and "limit: 0 below minimum 1" in session.error
+    assert backend == [] and attempts == ["lookup"]      # not retried
+
+
+def test_prefetcher_rejects_bad_tool_calls_before_the_backend():
+    backend = []
+
+    async def call_tool(name, args):
+        backend.append(name)
+
+    prefetcher = Prefetcher(lookup_agent(), call_tool)
+    with pytest.raises(ValidationError, match="query: expected string"):
+        asyncio.run(prefetcher.call("kb_search", {"query": 7}))
+    assert backend == []
@@ -20,13 +20,22 @@ fi
 
 echo "✅ Source agent: $SOURCE_AGENT_DIR"
 
-# Remove current agent folder and copy source agent into agent-session/agent
-rm -rf "$AGENT_DIR"
-cp -R "$SOURCE_AGENT_DIR" "$AGENT_DIR"
-echo "✅ Agent folder updated: $AGENT_DIR"
-
-cd "$SCRIPT_DIR/agent-runtime-mcp" && npm install --silent 2>/dev/null
-echo "✅ MCP installed"
+# Sync the source agent into agent-session/agent: only changed files are
+# copied (atomically), and npm install runs only when the lockfile changed.
+# deploy.py needs only the standard library; if it cannot run, fall back to
+# a clean copy
+DEPLOY="$SCRIPT_DIR/../.agent/skills/agent-builder-skill/scripts/deploy.py"
+if command -v python3 >/dev/null 2>&1 && [ -f "$DEPLOY" ] \
+    && python3 "$DEPLOY" "$SOURCE_AGENT_DIR" "$AGENT_DIR" --runtime "$SCRIPT_DIR/agent-runtime-mcp"; then
+    echo "✅ Agent folder updated: $AGENT_DIR"
+else
+    rm -rf "$AGENT_DIR"
+    cp -R "$SOURCE_AGENT_DIR" "$AGENT_DIR"
+    echo "✅ Agent folder updated: $AGENT_DIR"
+
+    cd "$SCRIPT_DIR/agent-runtime-mcp" && npm install --silent 2>/dev/null
+    echo "✅ MCP installed"
+fi
 
 cd "$SCRIPT_DIR"
 